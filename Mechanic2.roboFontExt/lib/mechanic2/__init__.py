@@ -1,23 +1,141 @@
+import os
+import json
 import AppKit
+from urllib.parse import urlparse
 from mojo.UI import getPassword
 
-from urlreader import URLReader, URLReaderError
-from urlreader import USER_CACHE_DIRECTORY_URL
+from urlreader import URLReader, URLReaderError, Metrics, RetryPolicy, RateLimit, RedirectMap
+from urlreader import NegativeCache, KnownFailureError, FAILURE_PARSE, failure_class, status_failure_class
+from urlreader import CircuitBreaker, HostUnavailableError
+from urlreader import CACHE_STALE, BatchReceiver
+from urlreader import PRIORITY_INTERACTIVE, PRIORITY_VISIBLE
+from urlreader import PRIORITY_BACKGROUND
+from urlreader import ContentStore, USER_CACHE_DIRECTORY_URL
+from urlreader import Cassette, CassetteTransport, RECORD
 
+from mechanic2.remoteVersions import RemoteVersionStore
 
-OFFLINE_CACHE_URL = USER_CACHE_DIRECTORY_URL.\
+
+CACHE_URL = USER_CACHE_DIRECTORY_URL.\
     URLByAppendingPathComponent_isDirectory_(
-        'com.robofontmechanic.OfflineCache', True)
+        'com.robofontmechanic.Cache', True)
+
+
+# One content addressed cache shared by all the URLReaders,
+# with a budget for every kind of resource.
+CACHE_PARTITION_ICONS = 'icons'
+CACHE_PARTITION_REGISTRIES = 'registries'
+CACHE_PARTITION_METADATA = 'metadata'
+CACHE_PARTITION_ARCHIVES = 'archives'
+
+MechanicCache = ContentStore(
+    CACHE_URL,
+    budgets={
+        CACHE_PARTITION_ICONS: 50 * 1024 * 1024,
+        CACHE_PARTITION_REGISTRIES: 10 * 1024 * 1024,
+        CACHE_PARTITION_METADATA: 20 * 1024 * 1024,
+        CACHE_PARTITION_ARCHIVES: 200 * 1024 * 1024,
+    }
+)
+
+
+# The registries, like the extension store data and the Mechanic registry,
+# are used as is for a few minutes. After that, the last known copy is
+# still shown right away for up to a month while it is refreshed, and the
+# extension list corrects itself when the registry changed.
+REGISTRY_MAX_AGE = 5 * 60
+REGISTRY_STALE = 30 * 24 * 60 * 60
+
+
+# Transient failures, like a dropped connection or a 503, are retried
+# with backoff, so a flaky network doesn’t fail a bulk update.
+MechanicRetryPolicy = RetryPolicy(max_attempts=4, base_delay=0.5, max_delay=8, deadline=120)
+
+
+# Redirects, like the GitHub API zipball URLs to codeload.github.com,
+# are remembered for as long as they are valid, so later requests skip
+# the extra round trip. Shared by all the URLReaders.
+MechanicRedirects = RedirectMap()
+
+
+# Failures likely to last, like a registry entry pointing to a removed
+# repository or an info.plist that doesn’t parse, are remembered across
+# launches, so they aren’t requested and reported at every update check.
+MechanicFailures = NegativeCache(os.path.join(MechanicCache.location, "failures.json"))
+
+
+# The remote versions found by update checks are kept across launches,
+# so the extensions needing an update are known as soon as Mechanic opens.
+# Every extension is only checked again after its own interval, from an hour
+# to a week, depending on how often it released so far.
+MechanicRemoteVersions = RemoteVersionStore(os.path.join(MechanicCache.location, "remoteVersions.json"))
+
+
+# A host that keeps failing, like gitlab.com during an outage, fails
+# fast for a minute instead of every request waiting for the timeout.
+MechanicBreaker = CircuitBreaker(threshold=3, cool_down=60)
+
+
+# The GitHub API allows 60 requests an hour without a token, per IP
+# address, and 5000 with one. Every API request goes through the
+# GithubDefaultURLReader, which keeps track of what is left and holds
+# background work, like update checks, before it runs out.
+GITHUB_API_HOST = "api.github.com"
+
+GithubRateLimit = RateLimit(reserve=10, hosts=[GITHUB_API_HOST])
+
+
+def setGithubAPIHost(host):
+    """
+    Send the GitHub API requests to `host` instead, like a local stand-in server.
+    """
+    global GITHUB_API_HOST
+    GITHUB_API_HOST = host
+    GithubRateLimit.set_hosts([host])
+
+
+# For benchmarks, set MECHANIC_CASSETTE to a file path to record every
+# exchange of the URLReaders in it, and MECHANIC_CASSETTE_MODE to "replay"
+# to serve them from it without the network. While replaying, the optional
+# MECHANIC_CASSETTE_LATENCY, in seconds, and MECHANIC_CASSETTE_BANDWIDTH,
+# in bytes per second, shape the responses.
+MechanicCassette = None
+if os.environ.get("MECHANIC_CASSETTE"):
+    MechanicCassette = Cassette(os.environ["MECHANIC_CASSETTE"], os.environ.get("MECHANIC_CASSETTE_MODE", RECORD))
+
+
+def _makeTransport():
+    """
+    Return the transport of a URLReader singleton, `None` for the default one.
+    """
+    if MechanicCassette is None:
+        return None
+    bandwidth = os.environ.get("MECHANIC_CASSETTE_BANDWIDTH")
+    return CassetteTransport(
+        MechanicCassette,
+        latency=float(os.environ.get("MECHANIC_CASSETTE_LATENCY", 0)),
+        bandwidth=float(bandwidth) if bandwidth else None
+    )
 
 
 # Singletons for URLReaders with slightly different behavior.
 # Both quote the URL path component by default and force connections
 # over HTTPS to comply with App Transport Security policy requirements.
 
-# The default URLReader, uses standard HTTP caching policies.
+# The default URLReader, keeps a local copy of every response and
+# revalidates it with conditional requests (ETag / Last-Modified).
 DefaultURLReader = URLReader(
     force_https=True,
-    timeout=60
+    timeout=60,
+    transport=_makeTransport(),
+    revalidate=True,
+    cache=MechanicCache,
+    cache_partition=CACHE_PARTITION_METADATA,
+    metrics=Metrics("DefaultURLReader"),
+    retry=MechanicRetryPolicy,
+    redirects=MechanicRedirects,
+    negative_cache=MechanicFailures,
+    breaker=MechanicBreaker
 )
 
 # Github URLReader if a token is set in the preferences.
@@ -26,12 +144,32 @@ if githubToken:
     GithubDefaultURLReader = URLReader(
         force_https=True,
         timeout=60,
-        headers=dict(Authorization='token ' + githubToken)
+        transport=_makeTransport(),
+        headers=dict(Authorization='token ' + githubToken),
+        revalidate=True,
+        cache=MechanicCache,
+        cache_partition=CACHE_PARTITION_METADATA,
+        metrics=Metrics("GithubDefaultURLReader"),
+        retry=MechanicRetryPolicy,
+        rate_limit=GithubRateLimit,
+        redirects=MechanicRedirects,
+        negative_cache=MechanicFailures,
+        breaker=MechanicBreaker
     )
 else:
     GithubDefaultURLReader = URLReader(
         force_https=True,
-        timeout=60
+        timeout=60,
+        transport=_makeTransport(),
+        revalidate=True,
+        cache=MechanicCache,
+        cache_partition=CACHE_PARTITION_METADATA,
+        metrics=Metrics("GithubDefaultURLReader"),
+        retry=MechanicRetryPolicy,
+        rate_limit=GithubRateLimit,
+        redirects=MechanicRedirects,
+        negative_cache=MechanicFailures,
+        breaker=MechanicBreaker
     )
 
 
@@ -40,6 +178,96 @@ else:
 CachingURLReader = URLReader(
     force_https=True,
     timeout=60,
+    transport=_makeTransport(),
     use_cache=True,
-    cache_location=OFFLINE_CACHE_URL
+    cache=MechanicCache,
+    cache_partition=CACHE_PARTITION_ICONS,
+    metrics=Metrics("CachingURLReader"),
+    retry=MechanicRetryPolicy,
+    redirects=MechanicRedirects,
+    negative_cache=MechanicFailures,
+    breaker=MechanicBreaker
 )
+
+
+def setGithubToken(token):
+    """
+    Send the GitHub API requests with `token`, without any when empty.
+    """
+    global githubToken
+    githubToken = token or None
+    # another token comes with another budget
+    GithubRateLimit.reset()
+    if githubToken:
+        GithubDefaultURLReader.setHeaders(dict(Authorization='token ' + githubToken))
+    else:
+        GithubDefaultURLReader.setHeaders(None)
+
+
+def hasGithubToken():
+    """
+    Return if the GitHub API requests are sent with a token.
+    Some of the API, like GraphQL queries, is only available with one.
+    """
+    return bool(githubToken)
+
+
+def urlReaderForURL(url):
+    """
+    Return the URLReader to use for `url`.
+    Requests to the GitHub API go through the GithubDefaultURLReader, with the token when one is set.
+    """
+    if urlparse(str(url)).hostname == GITHUB_API_HOST:
+        return GithubDefaultURLReader
+    return DefaultURLReader
+
+
+def githubRateLimit():
+    """
+    Return what is known of the GitHub API request budget, or `None`.
+    A dict with `limit`, `remaining`, `reset` and `retry_after`, see `RateLimit.budget()`.
+    """
+    return GithubRateLimit.budget(GITHUB_API_HOST)
+
+
+def unavailableHosts():
+    """
+    Return the hosts currently failing fast, as they kept failing.
+    """
+    return sorted(MechanicBreaker.states())
+
+
+def setForceHTTPS(force):
+    """
+    Set if the URLReader singletons turn http URLs into https ones.
+    """
+    for reader in (DefaultURLReader, GithubDefaultURLReader, CachingURLReader):
+        reader.setForceHTTPS(force)
+
+
+def urlReaderMetrics():
+    """
+    Return the metrics of all the URLReader singletons, by name.
+    """
+    return {
+        reader.metrics.name: reader.metrics.snapshot()
+        for reader in (DefaultURLReader, GithubDefaultURLReader, CachingURLReader)
+    }
+
+
+def cancelURLReaderRequests(owner):
+    """
+    Cancel the requests of `owner` on all the URLReader singletons,
+    their callbacks won’t be called.
+    """
+    for reader in (DefaultURLReader, GithubDefaultURLReader, CachingURLReader):
+        reader.cancel(owner)
+
+
+def dumpURLReaderMetrics(path):
+    """
+    Write the metrics of all the URLReader singletons to `path` as JSON,
+    so they can be compared.
+    """
+    with open(path, "w") as f:
+        json.dump(urlReaderMetrics(), f, indent=2)
@@ -1,13 +1,14 @@
 import os
-import io
+import time
 import zipfile
 import tempfile
 import shutil
 import logging
 import plistlib
+import functools
 import yaml
 
-from packaging.version import Version
+from packaging.version import Version, InvalidVersion
 from urllib.parse import urlparse
 
 from Foundation import NSString, NSUTF8StringEncoding
@@ -18,7 +19,12 @@ from AppKit import NSColor, NSBezierPath
 from mojo.extensions import ExtensionBundle
 from mojo.events import postEvent
 
-from mechanic2 import DefaultURLReader, CachingURLReader, URLReaderError
+from mechanic2 import CachingURLReader, URLReaderError, urlReaderForURL, BatchReceiver
+from mechanic2 import KnownFailureError, FAILURE_PARSE, failure_class, status_failure_class
+from mechanic2 import PRIORITY_INTERACTIVE, PRIORITY_VISIBLE
+from mechanic2 import PRIORITY_BACKGROUND
+from mechanic2 import CACHE_PARTITION_ARCHIVES
+from mechanic2 import MechanicRemoteVersions
 from mechanic2.mechanicTools import remember, clearRemembered, findExtensionInRoot
 from mechanic2.mechanicTools import ExtensionRepoError
 
@@ -27,14 +33,28 @@ logger = logging.getLogger("Mechanic")
 
 
 EXTENSION_ICON_DID_LOAD_EVENT_KEY = 'com.robofontmechanic.extensionIconDidLoad'
+EXTENSION_ICONS_DID_LOAD_EVENT_KEY = 'com.robofontmechanic.extensionIconsDidLoad'
 EXTENSION_DID_CHECK_FOR_UPDATES_EVENT_KEY = 'com.robofontmechanic.extensionDidCheckForUpdates'
 EXTENSION_DID_REMOTE_INSTALL_EVENT_KEY = 'com.robofontmechanic.extensionDidRemoteInstall'
 EXTENSION_DID_UNINSTALL_EVENT_KEY = 'com.robofontmechanic.extensionDidUninstall'
 
 
+def _processExtensionIcons(results):
+    # all the icons delivered in one batch, announced with a single event
+    items = []
+    for item, url, data, error in results:
+        if item._processExtensionIcon(url, data, error):
+            items.append(item)
+    if items:
+        postEvent(EXTENSION_ICONS_DID_LOAD_EVENT_KEY, items=items, iconURLs=[item.extensionIconURL() for item in items])
+
+
+_extensionIconReceiver = BatchReceiver(_processExtensionIcons)
+
+
 class BaseExtensionItem(object):
 
-    def __init__(self, data, checkForUpdates=True):
+    def __init__(self, data, checkForUpdates=False):
         valid, report = self.validateData(data)
         if not valid:
             raise ExtensionRepoError(report)
@@ -44,6 +64,8 @@ class BaseExtensionItem(object):
         self._extensionIcon = None
         self._showMessages = False
         self._remoteVersion = None
+        self._updateCheckFailure = None
+        self._updateCheckExpires = None
         self._init()
 
     def _init(self):
@@ -109,9 +131,12 @@ class BaseExtensionItem(object):
             image = NSImage.alloc().initWithData_(data)
             self._extensionIcon = image
             postEvent(EXTENSION_ICON_DID_LOAD_EVENT_KEY, item=self, iconURL=self.extensionIconURL())
+            return True
+        return False
 
-    def _fetchExtensionIcon(self, iconURL):
-        CachingURLReader.fetch(iconURL, self._processExtensionIcon)
+    def _fetchExtensionIcon(self, iconURL, priority=PRIORITY_VISIBLE, owner=None):
+        # icons delivered together are set at once, see `EXTENSION_ICONS_DID_LOAD_EVENT_KEY`
+        CachingURLReader.fetch(iconURL, _extensionIconReceiver.callback(self), priority=priority, tag="icon", owner=owner)
 
     @remember
     def extensionIconPlaceholder(self):
@@ -126,11 +151,15 @@ class BaseExtensionItem(object):
         image.unlockFocus()
         return image
 
-    def extensionIcon(self):
+    def extensionIcon(self, priority=PRIORITY_VISIBLE, owner=None):
+        """
+        Return the extension icon, a placeholder is returned while the icon is loading.
+        Optionally set the `priority` of the icon request and its `owner`, to cancel it.
+        """
         if self._extensionIcon is None:
             iconURL = self.extensionIconURL()
             if iconURL is not None:
-                self._fetchExtensionIcon(iconURL)
+                self._fetchExtensionIcon(iconURL, priority, owner)
                 self._extensionIcon = self.extensionIconPlaceholder()
         return self._extensionIcon
 
@@ -181,7 +210,7 @@ class BaseExtensionItem(object):
 
     # download and install
 
-    def _remoteInstallCallback(self, url, data, error):
+    def _remoteInstallCallback(self, url, path, error, statusCode=None, mirrors=None, progressCallback=None):
 
         if "installErrors" in self._data:
             del self._data["installErrors"]
@@ -194,6 +223,16 @@ class BaseExtensionItem(object):
             postEvent(EXTENSION_DID_REMOTE_INSTALL_EVENT_KEY, item=self)
             raise ExtensionRepoError(message)
 
+        if error is None and statusCode is not None and not 200 <= statusCode < 300:
+            # an error page is no zip file
+            error = "HTTP %s" % statusCode
+
+        if error and mirrors:
+            # try the next mirror of this download
+            logger.warning("Could not download '%s' for '%s', trying '%s'" % (url, self.extensionName(), mirrors[0]))
+            self._remoteDownload(mirrors, progressCallback)
+            return
+
         if error:
             message = "Could not download the extension zip file for: '%s' at url: '%s'" % (self.extensionName(), url)
             reportError(message, error)
@@ -201,9 +240,9 @@ class BaseExtensionItem(object):
         # create a temp folder
         tempFolder = tempfile.mkdtemp()
         try:
-            # try to extract the zip
+            # try to extract the downloaded zip
             # and fail silently with a custom message
-            with zipfile.ZipFile(io.BytesIO(data.bytes())) as z:
+            with zipfile.ZipFile(path) as z:
                 z.extractall(tempFolder)
         except Exception as e:
             message = "Could not extract the extension zip file for: '%s' at url: '%s'" % (self.extensionName(), url)
@@ -235,11 +274,12 @@ class BaseExtensionItem(object):
         self._needsUpdate = False
         postEvent(EXTENSION_DID_REMOTE_INSTALL_EVENT_KEY, item=self)
 
-    def remoteInstall(self, forcedUpdate=False, showMessages=False):
+    def remoteInstall(self, forcedUpdate=False, showMessages=False, progressCallback=None):
         """
         Install the extension from the remote. This will call `extensionNeedsUpdate()`
 
         Optional set `forcedUpdate` to `True` if its needed to install the extension anyhow
+        Optional set a `progressCallback` receiving `(url, bytesReceived, bytesExpected)` while downloading
         """
         self._showMessages = showMessages
 
@@ -247,22 +287,36 @@ class BaseExtensionItem(object):
             # dont download and install if the current intall is newer (only when it forced)
             return
 
-        # get the zip path
-        zipPath = self.remoteZipPath()
+        # get the zip path, and the mirrors to fall back on
+        self._remoteDownload([self.remoteZipPath()] + self.remoteZipMirrors(), progressCallback)
 
-        # performing the background URL fetching operation
-        DefaultURLReader.fetch(zipPath, self._remoteInstallCallback)
+    def _remoteDownload(self, zipPaths, progressCallback=None):
+        """
+        Download and install the first of `zipPaths`, falling back on the next ones when it fails.
+        """
+        zipPath, mirrors = zipPaths[0], zipPaths[1:]
+        # every download carries its own mirrors
+        callback = functools.partial(self._remoteInstallCallback, mirrors=mirrors, progressCallback=progressCallback)
+        # performing the background download, streamed to a temporary file
+        urlReaderForURL(zipPath).download(zipPath, callback, progressCallback, priority=PRIORITY_INTERACTIVE, cache_partition=CACHE_PARTITION_ARCHIVES, tag="install", with_status_code=True)
 
     def remoteZipPath(self):
         # subclass must overwrite this method
         raise NotImplementedError
 
+    def remoteZipMirrors(self):
+        """
+        Return other urls of the zip file, downloaded when `remoteZipPath()` fails.
+        """
+        # subclass can overwrite this method
+        return []
+
     def remoteVersion(self):
         # subclass must overwrite this method
         raise NotImplementedError
 
     def remoteIsBeta(self):
-        return "b" in self.remoteVersion()
+        return "b" in (self.remoteVersion() or "")
 
     def remoteURL(self):
         # subclass must overwrite this method
@@ -280,6 +334,42 @@ class BaseExtensionItem(object):
         # subclass must overwrite this method
         raise NotImplementedError
 
+    def updateCheckIsDue(self):
+        """
+        Return if the remote version is unknown, or was checked too long ago and must be checked again.
+        """
+        return self._updateCheckExpires is None or self._updateCheckExpires <= time.time()
+
+    def updateCheckFailure(self):
+        """
+        Return why the last update check failed, like "not found", "timeout", "server error" or "parse error", or `None`.
+        A failed check has no remote version and never needs an update.
+        """
+        return self._updateCheckFailure
+
+    def updateCheckURL(self):
+        """
+        Return the url fetched to check for updates, or `None` when checking does not need a fetch.
+        The fetched data must be handled by `_checkForUpdatesCallback(url, data, error, statusCode)`.
+        """
+        # subclass can overwrite this method
+        return None
+
+    def updateCheckMirrors(self):
+        """
+        Return other urls with the same data as `updateCheckURL()`, fetched when it is slow or fails.
+        """
+        # subclass can overwrite this method
+        return []
+
+    def githubRepository(self):
+        """
+        Return the (owner, name, info.plist path) of the GitHub repository to check for updates, or `None`.
+        Those can be checked many at once with GraphQL queries, see `mechanic2.githubUpdates`.
+        """
+        # subclass can overwrite this method
+        return None
+
     validationRequiredKeys = []
     validationNotRequiredKeys = []
 
@@ -311,9 +401,12 @@ class BaseExtensionItem(object):
 
     # helpers
 
+    def extensionBundleName(self):
+        return self.extensionPath.split("/")[-1]
+
     def extensionBundle(self):
         # get the bundleName
-        bundleName = self.extensionPath.split("/")[-1]
+        bundleName = self.extensionBundleName()
         # get the bundle
         return ExtensionBundle(bundleName)
 
@@ -381,6 +474,11 @@ class ExtensionRepositoryItem(BaseExtensionItem):
 
         self.repositoryParsedURL = urlparse(self.repository)
 
+        # start with the version found by the last check, even in an earlier session
+        self._seedRemoteVersion()
+
+        # making an item doesn't touch the network unless asked,
+        # the remote versions are resolved later by whoever shows the item
         if self._shouldCheckForUpdates:
             self.checkForUpdates()
 
@@ -392,6 +490,12 @@ class ExtensionRepositoryItem(BaseExtensionItem):
             infoPlistPath="https://raw.githubusercontent.com{repositoryPath}/master/{extensionPath}/info.plist",
             releasesPath="https://github.com{repositoryPath}/releases",
             releasesJsonPath="https://api.github.com/repos{repositoryPath}/releases",
+            # other locations of the same files, tried when the ones above are slow or fail
+            # there are no `infoPlistMirrors`: a CDN like jsDelivr caches the master branch for hours,
+            # and an update check answered first by an old info.plist would find an old version
+            zipMirrors=[
+                "https://codeload.github.com{repositoryPath}/zip/master",
+            ],
         ),
         gitlab=dict(
             zipPath="https://gitlab.com{repositoryPath}/-/archive/master/{repositoryName}-master.zip",
@@ -407,42 +511,150 @@ class ExtensionRepositoryItem(BaseExtensionItem):
         )
     )
 
-    def _checkForUpdatesCallback(self, url, data, error):
+    def _seedRemoteVersion(self):
+        entry = MechanicRemoteVersions.get(self.updateCheckURL())
+        if entry is None or entry["version"] is None:
+            return
+        try:
+            self._setRemoteVersion(entry["version"])
+        except InvalidVersion:
+            # like an installed extension with an odd version, check it again
+            self._remoteVersion = None
+            return
+        self._updateCheckExpires = entry["expires"]
+
+    def _setRemoteVersion(self, version):
+        self._updateCheckFailure = None
+        self._remoteVersion = str(version)
+        # flag the extension as needing an update
+        extensionVersion = self.extensionVersion()
+        if extensionVersion is None:
+            self._needsUpdate = False
+        else:
+            self._needsUpdate = Version(extensionVersion) < Version(self.remoteVersion())
+
+    def _cachedValidators(self):
+        # the validators of the info.plist last fetched, if any
+        url = self.updateCheckURL()
+        reader = urlReaderForURL(url)
+        if reader.cache is None:
+            return None
+        cached = reader.cache.get_path(reader.process_url(url))
+        if cached is None:
+            return None
+        return cached[1]
+
+    def _checkForUpdatesFailed(self, failure):
+        self._updateCheckFailure = failure
+        self._remoteVersion = None
+        self._needsUpdate = False
+        self._updateCheckExpires = None
+        # back off until the failure is forgotten, the last known version is kept
+        MechanicRemoteVersions.expire(self.updateCheckURL(), self._updateCheckFailureTTL())
+        postEvent(EXTENSION_DID_CHECK_FOR_UPDATES_EVENT_KEY, item=self)
+
+    def _updateCheckFailureTTL(self):
+        # the seconds the failure of the update check is remembered, if it is
+        url = self.updateCheckURL()
+        reader = urlReaderForURL(url)
+        if reader.negative_cache is None:
+            return None
+        known = reader.negative_cache.get(reader.process_url(url))
+        if known is None:
+            return None
+        return known[1] - time.time()
+
+    def _checkForUpdatesCallback(self, url, data, error, statusCode=None, validators=None):
+        """
+        Handle the info.plist fetched for an update check, `statusCode` is the HTTP status code of the response.
+        `validators` identify the info.plist, like a GitHub blob `oid`, by default the ones of the cached response.
+        """
+        if isinstance(error, KnownFailureError):
+            # failed recently, and was reported then
+            logger.debug("Skipping '%s' for '%s', %s" % (url, self.extensionName(), error.failure))
+            self._checkForUpdatesFailed(error.failure)
+            return
+
         if error:
             # cannot get the contents of the info.plist file
             logger.error("Cannot read '%s' for '%s'" % (url, self.extensionName()))
             logger.error(error)
+            self._checkForUpdatesFailed(failure_class(None, error) or "error")
+            return
+
+        failure = status_failure_class(statusCode)
+        if failure is not None:
+            # an error page, still failing after the retries, don't fetch it again for a while
+            # a server error or a rate limited response only for a short while
+            logger.error("Cannot read '%s' for '%s', HTTP %s" % (url, self.extensionName(), statusCode))
+            updateCheckURL = self.updateCheckURL()
+            urlReaderForURL(updateCheckURL).record_failure(updateCheckURL, failure)
+            self._checkForUpdatesFailed(failure)
+            return
 
         try:
             # try to parse the info.plist from string
-            # and fail silently with a custom message
+            # and fail with a custom message
             data = bytes(data)
             pathExtension = url.pathExtension()
             if pathExtension in ("yaml", "yml"):
                 info = yaml.safe_load(data)
             else:
                 info = plistlib.loads(data)
+            version = info["version"]
 
         except Exception as e:
-            # cannot parse the plist
-            info = {}
+            # cannot parse the plist, don't fetch it again for a while
             logger.error("Cannot parse '%s' for '%s'" % (url, self.extensionName()))
             logger.error(e)
+            updateCheckURL = self.updateCheckURL()
+            urlReaderForURL(updateCheckURL).record_failure(updateCheckURL, FAILURE_PARSE)
+            self._checkForUpdatesFailed(FAILURE_PARSE)
+            return
 
-        # set the version
-        self._remoteVersion = str(info.get("version", "0.0"))
-        if self._remoteVersion is not None:
-            # flag the extension as needing an update
-            extensionVersion = self.extensionVersion()
-            if extensionVersion is None:
-                self._needsUpdate = False
-            else:
-                self._needsUpdate = Version(extensionVersion) < Version(self.remoteVersion())
+        # set the version, and remember it for the next sessions
+        self._setRemoteVersion(version)
+        if validators is None and str(url) == urlReaderForURL(self.updateCheckURL()).process_url(self.updateCheckURL()):
+            # only the validators of the update check url itself, not of a mirror that answered first
+            validators = self._cachedValidators()
+        self._updateCheckExpires = MechanicRemoteVersions.record(self.updateCheckURL(), self._remoteVersion, validators, bundleName=self.extensionBundleName())
 
         postEvent(EXTENSION_DID_CHECK_FOR_UPDATES_EVENT_KEY, item=self)
 
     def checkForUpdates(self):
-        DefaultURLReader.fetch(self.remoteInfoPath(), self._checkForUpdatesCallback)
+        url = self.updateCheckURL()
+        mirrors = self.updateCheckMirrors()
+        if mirrors:
+            urlReaderForURL(url).fetch_hedged([url] + mirrors, self._checkForUpdatesCallback, priority=PRIORITY_BACKGROUND, tag="updateCheck", with_status_code=True)
+        else:
+            urlReaderForURL(url).fetch(url, self._checkForUpdatesCallback, priority=PRIORITY_BACKGROUND, tag="updateCheck", with_status_code=True)
+
+    def updateCheckURL(self):
+        return self.remoteInfoPath()
+
+    def updateCheckMirrors(self):
+        return self.remoteInfoMirrors()
+
+    def githubRepository(self):
+        if not self.isGithub() or "infoPath" in self._data:
+            # the info.plist can be anywhere
+            return None
+        parts = self.repositoryParsedURL.path.strip("/").split("/")
+        if len(parts) < 2:
+            return None
+        return parts[0], parts[1], "%s/info.plist" % self.extensionPath.strip("/")
+
+    def _formatMirrors(self, key):
+        # format the mirrors of the service, if any
+        formatters = self.urlFormatters[self.service()].get(key, [])
+        return [
+            formatter.format(
+                repositoryPath=self.repositoryParsedURL.path,
+                repositoryName=self.extensionName(),
+                extensionPath=self.extensionPath
+            )
+            for formatter in formatters
+        ]
 
     def remoteZipPath(self):
         """
@@ -460,6 +672,15 @@ class ExtensionRepositoryItem(BaseExtensionItem):
             )
         return self._remoteZipPath
 
+    def remoteZipMirrors(self):
+        """
+        Return the mirrors of the zip file based on the formatters and supported services.
+        There are none when a `remoteZipPath` is given.
+        """
+        if "zipPath" in self._data:
+            return []
+        return self._formatMirrors("zipMirrors")
+
     # info path
 
     def remoteInfoPath(self):
@@ -478,6 +699,15 @@ class ExtensionRepositoryItem(BaseExtensionItem):
             )
         return self._remoteInfoPath
 
+    def remoteInfoMirrors(self):
+        """
+        Return the mirrors of the info.plist file based on the formatters and supported services.
+        There are none when a `remoteInfoPath` is given.
+        """
+        if "infoPath" in self._data:
+            return []
+        return self._formatMirrors("infoPlistMirrors")
+
     def remoteURL(self):
         return self.repository
 
@@ -618,7 +848,7 @@ class ExtensionStoreItem(BaseExtensionItem):
 
 class ExtensionYamlItem(ExtensionRepositoryItem):
 
-    def __init__(self, data, checkForUpdates=True):
+    def __init__(self, data, checkForUpdates=False):
         if "tags" in data:
             data["tags"] = list(data["tags"])
         super(ExtensionYamlItem, self).__init__(data, checkForUpdates)
@@ -0,0 +1,139 @@
+import json
+import time
+import logging
+import functools
+
+from mechanic2 import GithubDefaultURLReader, PRIORITY_BACKGROUND, hasGithubToken
+
+
+logger = logging.getLogger("Mechanic")
+
+
+# The GitHub GraphQL API answers for many repositories in a single request,
+# but only to requests with a token.
+githubGraphQLURL = "https://api.github.com/graphql"
+
+# repositories asked for in a single query, well within the GraphQL node limits
+GITHUB_GRAPHQL_BATCH_SIZE = 50
+
+
+def canCheckGithubUpdatesInBatches():
+    """
+    Return if GitHub hosted extensions can be checked for updates with GraphQL queries.
+    """
+    return hasGithubToken()
+
+
+def githubInfoPlistQuery(repositories):
+    """
+    Return a GraphQL query for the info.plist of every (owner, name, info.plist path) in `repositories`.
+    The result of the repository at `index` is aliased `r<index>`, the info.plist comes from the master branch,
+    like the one of `infoPlistPath` and its mirrors, so both ways of checking find the same version.
+    """
+    fields = []
+    for index, (owner, name, path) in enumerate(repositories):
+        # JSON strings are valid GraphQL strings
+        fields.append(
+            "r%s: repository(owner: %s, name: %s) { object(expression: %s) { ... on Blob { oid text } } }" % (
+                index, json.dumps(owner), json.dumps(name), json.dumps("master:%s" % path)
+            )
+        )
+    return "query {\n%s\n}" % "\n".join(fields)
+
+
+class GithubUpdateCheck(object):
+
+    """
+    Check GitHub hosted extensions for updates with GraphQL queries, dozens of repositories at once.
+
+    The info.plist of every item is handled by `_checkForUpdatesCallback`, like for a
+    single update check, so items get the same remote version, update flag and event.
+    Items the queries could not answer for, like a renamed repository, a binary info.plist or
+    a failed query, are left in `unresolved`, to be checked the regular way.
+    `doneCallback` is called with the check once all the queries are answered,
+    `itemCallback` with every item resolved.
+    """
+
+    def __init__(self, items, doneCallback, itemCallback=None, owner=None):
+        self.items = list(items)
+        self.unresolved = []
+        self.queries = 0
+        self.started = None
+        self.finished = None
+        self._doneCallback = doneCallback
+        self._itemCallback = itemCallback
+        self._owner = owner
+        self._pending = 0
+
+    @property
+    def elapsed(self):
+        end = self.finished
+        if end is None:
+            end = time.monotonic()
+        return end - self.started
+
+    def start(self):
+        self.started = time.monotonic()
+        batches = [self.items[index:index + GITHUB_GRAPHQL_BATCH_SIZE] for index in range(0, len(self.items), GITHUB_GRAPHQL_BATCH_SIZE)]
+        self._pending = len(batches)
+        if not batches:
+            self._finish()
+            return
+        for batch in batches:
+            self.queries += 1
+            query = githubInfoPlistQuery([item.githubRepository() for item in batch])
+            GithubDefaultURLReader.post(
+                githubGraphQLURL,
+                json.dumps(dict(query=query)),
+                functools.partial(self._queryCallback, batch),
+                headers={"Content-Type": "application/json"},
+                priority=PRIORITY_BACKGROUND,
+                tag="updateCheck",
+                owner=self._owner
+            )
+
+    def _queryCallback(self, batch, url, data, error):
+        try:
+            self._resolveBatch(batch, url, data, error)
+        finally:
+            # the check has to finish, whatever happened to this query
+            self._pending -= 1
+            if not self._pending:
+                self._finish()
+
+    def _resolveBatch(self, batch, url, data, error):
+        results = None
+        if error is None:
+            try:
+                results = json.loads(bytes(data)).get("data")
+            except Exception as e:
+                error = e
+        if results is None:
+            # the whole query failed, like without a valid token
+            logger.warning("Cannot check %s GitHub extensions for updates at once, checking them one by one." % len(batch))
+            logger.warning(error or "No data in '%s'" % url)
+            self.unresolved.extend(batch)
+            return
+        for index, item in enumerate(batch):
+            blob = None
+            repository = results.get("r%s" % index)
+            if repository:
+                blob = repository.get("object")
+            if not blob or blob.get("text") is None:
+                self.unresolved.append(item)
+                continue
+            try:
+                infoURL = GithubDefaultURLReader.transport.url(GithubDefaultURLReader.process_url(item.updateCheckURL()))
+                # the git object id of the info.plist identifies it like an ETag
+                item._checkForUpdatesCallback(infoURL, blob["text"].encode("utf-8"), None, validators=dict(oid=blob.get("oid")))
+                if self._itemCallback is not None:
+                    self._itemCallback(item)
+            except Exception as e:
+                # leave it to be checked on its own, the others are still resolved
+                logger.error("Cannot check '%s' for updates with the GitHub query." % item.extensionName())
+                logger.error(e)
+                self.unresolved.append(item)
+
+    def _finish(self):
+        self.finished = time.monotonic()
+        self._doneCallback(self)
@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+
+
+logger = logging.getLogger("Mechanic")
+
+
+# bounds of the time a remote version is used without checking again, in seconds
+MIN_CHECK_INTERVAL = 60 * 60
+MAX_CHECK_INTERVAL = 7 * 24 * 60 * 60
+
+# the time a remote version is used while there is no release history yet, in seconds
+DEFAULT_CHECK_INTERVAL = 24 * 60 * 60
+
+# how many times an extension is checked between two of its releases
+CHECKS_PER_RELEASE = 4
+
+# the version changes remembered for every extension
+MAX_VERSION_CHANGES = 10
+
+
+class RemoteVersionStore(object):
+
+    """
+    The remote versions of the extensions, kept across launches.
+
+    Every update check that found a version records it with the validators of the info.plist it was read from,
+    like its `ETag`, and when it was checked. Extension items are seeded with the last known version right away,
+    so they know if they need an update before any request, and are only checked again once it expires.
+
+    How long a version is used depends on how often the extension changes: the times its version changed are kept,
+    and it is checked `CHECKS_PER_RELEASE` times between two releases on average, within `minInterval` and `maxInterval`.
+    An extension releasing every day is checked every few hours, one releasing a few times a year once a week.
+    Until its version changed, an extension is checked once a day, `DEFAULT_CHECK_INTERVAL`.
+
+    Entries are kept in a JSON file at `path`, written by `save()`.
+    """
+
+    def __init__(self, path=None, minInterval=MIN_CHECK_INTERVAL, maxInterval=MAX_CHECK_INTERVAL):
+        self._path = path
+        self.minInterval = minInterval
+        self.maxInterval = maxInterval
+        self._lock = threading.Lock()
+        self._dirty = False
+        # key -> dict(version, validators, checked, expires, bundleName, firstSeen, changes)
+        self._entries = dict()
+        if self._path is not None:
+            self._load()
+            atexit.register(self.save)
+
+    def _load(self):
+        try:
+            with open(self._path) as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            return
+
+    def save(self):
+        if self._path is None:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            entries = dict(self._entries)
+            self._dirty = False
+        try:
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            with open(self._path, "w") as f:
+                json.dump(entries, f)
+        except OSError:
+            logger.exception("Cannot write %s" % self._path)
+
+    def checkInterval(self, firstSeen, changes, now=None):
+        """
+        Return how long to use a version, for an extension known since `firstSeen` whose version changed at the times in `changes`.
+        """
+        if now is None:
+            now = time.time()
+        if len(changes) >= MAX_VERSION_CHANGES:
+            # only the last changes are kept, the average time between two releases is measured
+            # over the intervals between those, but it is never shorter than the time since the last one
+            releaseInterval = max((changes[-1] - changes[0]) / (len(changes) - 1), now - changes[-1])
+        else:
+            # the average time between two releases, as if the
+            # extension was about to release when it was first seen
+            releaseInterval = (now - firstSeen) / (len(changes) + 1)
+        interval = releaseInterval / CHECKS_PER_RELEASE
+        if not changes:
+            # an extension seen only recently didn't release yet, that says nothing about how often it does
+            interval = max(interval, DEFAULT_CHECK_INTERVAL)
+        return min(max(interval, self.minInterval), self.maxInterval)
+
+    def record(self, key, version, validators=None, bundleName=None, ttl=None):
+        """
+        Record the `version` just found for `key`, the extension installed as `bundleName`.
+        It is used for `ttl` seconds, by default for the check interval of the extension.
+        Return the time it expires, since the epoch.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                firstSeen = now
+                changes = []
+            else:
+                firstSeen = entry.get("firstSeen", entry["checked"])
+                changes = list(entry.get("changes", []))
+                if entry["version"] is not None and entry["version"] != version:
+                    changes = (changes + [now])[-MAX_VERSION_CHANGES:]
+            if ttl is None:
+                ttl = self.checkInterval(firstSeen, changes, now)
+            self._entries[key] = dict(
+                version=version,
+                validators=validators or None,
+                checked=now,
+                expires=now + ttl,
+                bundleName=bundleName,
+                firstSeen=firstSeen,
+                changes=changes
+            )
+            self._dirty = True
+        logger.debug("%s is checked again in %.1f hours" % (key, ttl / 3600))
+        return now + ttl
+
+    def get(self, key):
+        """
+        Return the last entry of `key`, expired or not, as a dict with `version`, `validators`, `checked`, `expires`,
+        `bundleName`, `firstSeen` and the times the version `changes`, or `None`.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            return dict(entry)
+
+    def due(self, now=None):
+        """
+        Return the entries that expired, by key.
+        """
+        if now is None:
+            now = time.time()
+        with self._lock:
+            return {key: dict(entry) for key, entry in self._entries.items() if entry["expires"] <= now}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def expire(self, key, ttl=None):
+        """
+        Check `key` again in `ttl` seconds, at least `minInterval`, like after a failed check.
+        The last known version and the times it changed are kept, so the next version found is compared to it.
+        """
+        if ttl is None or ttl < self.minInterval:
+            ttl = self.minInterval
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.update(validators=None, expires=time.time() + ttl)
+                self._dirty = True
+
+    def forget(self, key):
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._dirty = True
+
+    def clear(self):
+        with self._lock:
+            self._entries = dict()
+            self._dirty = True
@@ -0,0 +1,77 @@
+import mechanic2
+from mechanic2 import githubUpdates
+from mechanic2.ui import settings
+from mechanic2.extensionItem import ExtensionRepositoryItem
+
+
+# what `useStandInServer` changed, to put it back
+_savedState = None
+
+
+def standInURLFormatters(url):
+    """
+    Return the `urlFormatters` of `ExtensionRepositoryItem` for a stand-in server at `url`.
+    The repositories in the registry are still on github.com and gitlab.com, only their files come from the stand-in server,
+    the release pages, opened in a browser, are the real ones.
+    """
+    return dict(
+        github=dict(
+            zipPath=url + "/github/api/repos{repositoryPath}/zipball",
+            infoPlistPath=url + "/github/raw{repositoryPath}/master/{extensionPath}/info.plist",
+            releasesPath=ExtensionRepositoryItem.urlFormatters["github"]["releasesPath"],
+            releasesJsonPath=url + "/github/api/repos{repositoryPath}/releases",
+            zipMirrors=[
+                url + "/github/codeload{repositoryPath}/zip/master",
+            ],
+        ),
+        gitlab=dict(
+            zipPath=url + "/gitlab{repositoryPath}/-/archive/master/{repositoryName}-master.zip",
+            infoPlistPath=url + "/gitlab{repositoryPath}/raw/master/{extensionPath}/info.plist",
+            releasesPath=ExtensionRepositoryItem.urlFormatters["gitlab"]["releasesPath"],
+            releasesJsonPath=""
+        ),
+        bitbucket=ExtensionRepositoryItem.urlFormatters["bitbucket"],
+    )
+
+
+def useStandInServer(port=8000, host="localhost", apiHost="127.0.0.1"):
+    """
+    Point Mechanic at a stand-in server started with `standInServer.py`, until `stopUsingStandInServer()`.
+    The registry is requested from `host`, the extension store data, GitHub API and files from `apiHost`,
+    two names of the same server, so the store and the GitHub API are told apart from the registry by their host name like they are for real.
+    Reopen the Mechanic window to load the stand-in extensions.
+    """
+    global _savedState
+    if _savedState is None:
+        _savedState = dict(
+            urlFormatters=ExtensionRepositoryItem.urlFormatters,
+            extensionStoreDataURL=settings.extensionStoreDataURL,
+            urlStreamsOverride=settings.urlStreamsOverride,
+            githubAPIHost=mechanic2.GITHUB_API_HOST,
+            githubGraphQLURL=githubUpdates.githubGraphQLURL,
+        )
+    url = "http://%s:%s" % (host, port)
+    apiURL = "http://%s:%s" % (apiHost, port)
+    ExtensionRepositoryItem.urlFormatters = standInURLFormatters(apiURL)
+    githubUpdates.githubGraphQLURL = apiURL + "/github/api/graphql"
+    settings.extensionStoreDataURL = apiURL + "/store/data.json"
+    # never written to the defaults, a crash leaves the streams of the user as they are
+    settings.urlStreamsOverride = [settings.extensionStoreDataURL, url + "/registry.json"]
+    mechanic2.setGithubAPIHost(apiHost)
+    mechanic2.setForceHTTPS(False)
+
+
+def stopUsingStandInServer():
+    """
+    Point Mechanic back at the real servers.
+    """
+    global _savedState
+    if _savedState is None:
+        return
+    ExtensionRepositoryItem.urlFormatters = _savedState["urlFormatters"]
+    githubUpdates.githubGraphQLURL = _savedState["githubGraphQLURL"]
+    settings.extensionStoreDataURL = _savedState["extensionStoreDataURL"]
+    settings.urlStreamsOverride = _savedState["urlStreamsOverride"]
+    mechanic2.setGithubAPIHost(_savedState["githubAPIHost"])
+    mechanic2.setForceHTTPS(True)
+    _savedState = None
@@ -1,11 +1,11 @@
 import json
 import logging
+import functools
 import time
 import vanilla
 
-from urllib.parse import urlparse
-
 from Foundation import NSObject, NSString, NSUTF8StringEncoding
+from PyObjCTools.AppHelper import callLater
 from AppKit import NSToolbarFlexibleSpaceItemIdentifier, NSPredicate
 from AppKit import NSEvent, NSAlternateKeyMask
 
@@ -14,16 +14,22 @@ from mojo.extensions import getExtensionDefault, setExtensionDefault, ExtensionB
 
 from defconAppKit.windows.baseWindow import BaseWindowController
 
-from mechanic2 import DefaultURLReader, GithubDefaultURLReader, URLReaderError
+from mechanic2 import DefaultURLReader, GithubDefaultURLReader, URLReaderError, KnownFailureError, cancelURLReaderRequests
+from mechanic2 import unavailableHosts
+from mechanic2 import PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+from mechanic2 import CACHE_PARTITION_REGISTRIES
+from mechanic2 import CACHE_STALE, REGISTRY_MAX_AGE, REGISTRY_STALE
+from mechanic2 import MechanicRemoteVersions
 from mechanic2.ui.cells import MCExtensionCirleCell, MCImageTextFieldCell
 from mechanic2.ui.formatters import MCExtensionDescriptionFormatter
-from mechanic2.ui.settings import Settings, extensionStoreDataURL
+from mechanic2.ui.settings import Settings, isExtensionStoreStream, urlStreams
 from mechanic2.extensionItem import ExtensionRepositoryItem, ExtensionStoreItem
 from mechanic2.extensionItem import ExtensionYamlItem
-from mechanic2.extensionItem import EXTENSION_ICON_DID_LOAD_EVENT_KEY
+from mechanic2.extensionItem import EXTENSION_ICONS_DID_LOAD_EVENT_KEY
 from mechanic2.extensionItem import EXTENSION_DID_CHECK_FOR_UPDATES_EVENT_KEY
 from mechanic2.extensionItem import EXTENSION_DID_REMOTE_INSTALL_EVENT_KEY
 from mechanic2.extensionItem import EXTENSION_DID_UNINSTALL_EVENT_KEY
+from mechanic2.githubUpdates import GithubUpdateCheck, canCheckGithubUpdatesInBatches
 
 
 logger = logging.getLogger("Mechanic")
@@ -60,7 +66,7 @@ class MechanicListItemPopoverController:
         self.item = item
         if item.releaseJsonURL() and item.isGithub():
             # for now only github is supported
-            GithubDefaultURLReader.fetch(item.releaseJsonURL(), self._makeExtensionReleaseItems)
+            GithubDefaultURLReader.fetch(item.releaseJsonURL(), self._makeExtensionReleaseItems, priority=PRIORITY_INTERACTIVE, tag="releases", owner=self)
 
         self.w = vanilla.Popover((370, 260), behavior="semitransient")
         self.w.releases = vanilla.List(
@@ -148,7 +154,8 @@ class MechanicListItemPopoverController:
                 for asset in data["assets"]:
                     if asset["name"].lower().endswith(".robofontext.zip"):
                         zipPath = asset["browser_download_url"]
-            GithubDefaultURLReader.fetch(zipPath, self.item._remoteInstallCallback)
+            # the release picked, without falling back on the mirrors of the default branch
+            self.item._remoteDownload([zipPath])
 
     def openInBrowserCallback(self, sender):
         self.item.openRemoteURL(background=True)
@@ -254,14 +261,19 @@ class MechanicController(BaseWindowController):
         self._progress = None
 
         self._wrappedItems = []
+        self._streamItems = dict()
         self._extensionsToCheck = []
-        self._numExtensionsChecked = 0
+        self._updateCheckBatch = None
+        self._githubUpdateCheck = None
+        self._updateCheckItems = dict()
+        self._updateCheckScheduled = False
+        self._scheduledItemsToCheck = None
         self._extensionsToUpdate = []
         self._numExtensionsUpdated = 0
         self._iconURLs = set()
         self._iconURLsForVisibleRows = set()
 
-        addObserver(self, 'extensionIconDidLoad', EXTENSION_ICON_DID_LOAD_EVENT_KEY)
+        addObserver(self, 'extensionIconsDidLoad', EXTENSION_ICONS_DID_LOAD_EVENT_KEY)
         addObserver(self, 'extensionDidCheckForUpdates', EXTENSION_DID_CHECK_FOR_UPDATES_EVENT_KEY)
         addObserver(self, 'extensionDidRemoteInstall', EXTENSION_DID_REMOTE_INSTALL_EVENT_KEY)
         addObserver(self, 'extensionDidUninstall', EXTENSION_DID_UNINSTALL_EVENT_KEY)
@@ -270,10 +282,27 @@ class MechanicController(BaseWindowController):
             self.loadExtensions()
 
     def _windowWillCloseCallback(self, sender):
-        removeObserver(self, EXTENSION_ICON_DID_LOAD_EVENT_KEY)
+        removeObserver(self, EXTENSION_ICONS_DID_LOAD_EVENT_KEY)
         removeObserver(self, EXTENSION_DID_CHECK_FOR_UPDATES_EVENT_KEY)
         removeObserver(self, EXTENSION_DID_REMOTE_INSTALL_EVENT_KEY)
         removeObserver(self, EXTENSION_DID_UNINSTALL_EVENT_KEY)
+        # stop loading icons, release lists and update checks nobody will see
+        self._cancelRequests()
+        popoverController = getattr(self, "_mechanicListItemPopoverController", None)
+        if popoverController is not None:
+            cancelURLReaderRequests(popoverController)
+
+    def _cancelRequests(self):
+        """
+        Cancel the requests still running for this window.
+        Installs are left to finish.
+        """
+        cancelURLReaderRequests(self)
+        self._updateCheckScheduled = False
+        self._scheduledItemsToCheck = None
+        self._updateCheckBatch = None
+        self._githubUpdateCheck = None
+        self._updateCheckItems = dict()
 
     def _makeExtensionItem(self, extensionData, itemClass, url):
         try:
@@ -281,6 +310,7 @@ class MechanicController(BaseWindowController):
                 itemClass(extensionData)
             )
             self._wrappedItems.append(item)
+            return item
         except Exception as e:
             logger.error("Creating extension item '%s' from url '%s' failed." % (extensionData.get("extensionName", "unknown"), url))
             logger.error(e)
@@ -299,19 +329,52 @@ class MechanicController(BaseWindowController):
             logger.error("Cannot decode extension data at '%s'" % url)
             logger.error("Error '%s'" % e)
 
-    def _makeExtensionStoreItems(self, url, data, error):
-        _data = self._decodeData(url, data, error)
+    def _makeStreamItems(self, urlStream, itemClass, url, _data):
+        # make the items of a stream, and remember them in case it's refreshed
+        items = []
         if _data is not None:
             for extensionData in _data:
-                self._makeExtensionItem(extensionData, ExtensionStoreItem, url)
+                item = self._makeExtensionItem(extensionData, itemClass, url)
+                if item is not None:
+                    items.append(item)
+        self._streamItems[urlStream] = items
+
+    def _refreshStreamItems(self, urlStream, itemClass, url, data, error):
+        # the stream changed since the last known copy was shown
+        _data = self._decodeData(url, data, error)
+        if _data is None:
+            # keep showing the last known items
+            return
+        logger.info("Extensions at '%s' changed, refreshing the list." % urlStream)
+        oldItems = self._streamItems.pop(urlStream, [])
+        self._wrappedItems = [item for item in self._wrappedItems if item not in oldItems]
+        self._makeStreamItems(urlStream, itemClass, url, _data)
+        if not self._canLoadSingleExtensions:
+            # all extensions were already set, set them again
+            self._finishSettingExtensions()
+            if self.isCheckingForUpdates() or self._didCheckForUpdates:
+                # the check only knows the replaced items, check the installed new ones as well
+                refreshedItems = [item.extensionObject() for item in self._streamItems[urlStream] if item.extensionObject().isExtensionInstalled()]
+                if refreshedItems:
+                    self.scheduleCheckForUpdates(refreshedItems)
+
+    def _makeExtensionStoreItems(self, urlStream, url, data, error, status):
+        if urlStream in self._streamItems:
+            self._refreshStreamItems(urlStream, ExtensionStoreItem, url, data, error)
+            return
+        if status == CACHE_STALE:
+            logger.info("Showing the last known extensions at '%s' while refreshing them." % urlStream)
+        self._makeStreamItems(urlStream, ExtensionStoreItem, url, self._decodeData(url, data, error))
         self._extensionStoreItemsLoaded = True
         self._checkExtensionsDidLoad()
 
-    def _makeExtensionRepositories(self, url, data, error):
-        _data = self._decodeData(url, data, error)
-        if _data is not None:
-            for extensionData in _data:
-                self._makeExtensionItem(extensionData, ExtensionRepositoryItem, url)
+    def _makeExtensionRepositories(self, urlStream, url, data, error, status):
+        if urlStream in self._streamItems:
+            self._refreshStreamItems(urlStream, ExtensionRepositoryItem, url, data, error)
+            return
+        if status == CACHE_STALE:
+            logger.info("Showing the last known extensions at '%s' while refreshing them." % urlStream)
+        self._makeStreamItems(urlStream, ExtensionRepositoryItem, url, self._decodeData(url, data, error))
         self._extensionRepositoryItemsLoaded = True
         self._checkExtensionsDidLoad()
 
@@ -336,8 +399,13 @@ class MechanicController(BaseWindowController):
         self._finishSettingExtensions()
 
     def _finishSettingExtensions(self):
-        if self._progress is not None:
-            self._progress.update("Setting Extensions...")
+        # a refreshed registry can set the extensions again while checking for updates,
+        # leave the progress of that check alone, it's closed once the check is done
+        progress = None
+        if not self.isCheckingForUpdates():
+            progress = self._progress
+        if progress is not None:
+            progress.update("Setting Extensions...")
 
         # sort items by repo, YAML and leave store for last as before...
         _wrappedItemsOrder = [
@@ -366,7 +434,7 @@ class MechanicController(BaseWindowController):
             if iconURL is None:
                 continue
 
-            item.extensionIcon()
+            item.extensionIcon(owner=self)
             self._iconURLs.add(iconURL)
             self._iconURLsForVisibleRows.add(iconURL)
 
@@ -378,30 +446,44 @@ class MechanicController(BaseWindowController):
             if iconURL is None or iconURL in self._iconURLsForVisibleRows:
                 continue
 
-            item.extensionObject().extensionIcon()
+            # these wait behind the visible rows and interactive requests
+            item.extensionObject().extensionIcon(priority=PRIORITY_BACKGROUND, owner=self)
             self._iconURLs.add(iconURL)
 
-        if self._progress is not None:
-            self._progress.close()
+        if progress is not None:
+            progress.close()
             self._progress = None
 
+        # the items are made without any update check, when asked to, like at launch,
+        # resolve the remote versions of the installed extensions once the list is drawn
+        # otherwise the items only show the remote versions known from earlier checks
         if self._shouldCheckForUpdates:
             self._shouldCheckForUpdates = False
-            self.checkForUpdates()
+            self.scheduleCheckForUpdates()
 
     def loadExtensions(self):
         self._wrappedItems = []
+        self._streamItems = dict()
         self._canLoadSingleExtensions = True
         self._progress = self.startProgress("Loading extensions...")
 
-        streams = getExtensionDefault("com.mechanic.urlstreams")
-        for urlStream in streams:
-            parsedExtensionStoreDataURL = urlparse(extensionStoreDataURL)
-            parsedUrlStream = urlparse(urlStream)
-            if parsedUrlStream.hostname == parsedExtensionStoreDataURL.hostname:
-                DefaultURLReader.fetch(urlStream, self._makeExtensionStoreItems)
+        for urlStream in urlStreams():
+            if isExtensionStoreStream(urlStream):
+                callback = self._makeExtensionStoreItems
             else:
-                DefaultURLReader.fetch(urlStream, self._makeExtensionRepositories)
+                callback = self._makeExtensionRepositories
+            # show the last known extensions right away, the callback is called again when they changed
+            DefaultURLReader.fetch(
+                urlStream,
+                functools.partial(callback, urlStream),
+                with_status=True,
+                priority=PRIORITY_INTERACTIVE,
+                cache_partition=CACHE_PARTITION_REGISTRIES,
+                tag="registry",
+                owner=self,
+                max_age=REGISTRY_MAX_AGE,
+                stale=REGISTRY_STALE
+            )
 
     def extensionDidRemoteInstall(self, info):
         self._numExtensionsUpdated += 1
@@ -422,68 +504,190 @@ class MechanicController(BaseWindowController):
         self.reloadData()
 
     def extensionDidCheckForUpdates(self, info):
-        self._numExtensionsChecked += 1
-
-        if self._numExtensionsChecked < len(self._extensionsToCheck):
-            # drop out early if we’re still in the middle of checking
-            # for extension updates
+        if self.isCheckingForUpdates():
+            # a bulk check reports its own progress
             return
+        self._didFinishCheckingForUpdates()
 
-        if self._progress is not None:
-            self._progress.update()
+    def _extensionUpdateCheckCallback(self, url, data, error, statusCode):
+        # called for every fetch of a bulk update check
+        for item in self._updateCheckItems.get(str(url), []):
+            item._checkForUpdatesCallback(url, data, error, statusCode)
+            if self._progress is not None:
+                self._progress.update()
+
+    def _extensionsUpdateCheckDoneCallback(self, results):
+        batch = self._updateCheckBatch
+        knownFailures = [result for result in batch.errors if isinstance(result[2], KnownFailureError)]
+        logger.info("Fetched update information for %s extensions in %.1f seconds, %s failed, %s of them recently." % (batch.total, batch.elapsed, len(batch.errors), len(knownFailures)))
+        self._updateCheckBatch = None
+        self._updateCheckItems = dict()
+        self._didFinishCheckingForUpdates()
 
+    def _didFinishCheckingForUpdates(self):
         # By this point, all selected extensions have finished checking.
         # The self._didCheckForUpdates flag just ensures this block doesn’t
         # get executed multiple times
         if not self._didCheckForUpdates:
 
+            MechanicRemoteVersions.save()
+
             now = time.time()
             setExtensionDefault("com.mechanic.lastUpdateCheck", now)
             title = time.strftime("Checked at %H:%M", time.localtime(now))
+            hosts = unavailableHosts()
+            if hosts:
+                # the extensions hosted there couldn't be checked
+                title += ", %s unreachable" % ", ".join(hosts)
             self.w.checkForUpdatesInfo.set(title)
 
             if self._progress is not None:
                 self._progress.close()
                 self._progress = None
 
-            # figure out which extension items need updating
-            extensionsItemsToUpdate = [x for x in self._wrappedItems if x.extensionObject().extensionNeedsUpdate()]
-            if len(extensionsItemsToUpdate) > 0:
-                # bring items that need updating to the top of the list
-                self._wrappedItems.sort(key=lambda x: x.extensionObject().extensionNeedsUpdate(), reverse=True)
+            self._showExtensionsToUpdate()
 
-            # set the table view with the current _wrappedItems
-            self.setItems(self._wrappedItems)
+            self._didCheckForUpdates = True
 
-            # after the updated items are set...
-            if len(extensionsItemsToUpdate) > 0:
-                # ...scroll to the top of the list if there are items which need updating
-                self.w.extensionList.getNSTableView().scrollRowToVisible_(0)
-                # ...and select them for easy, one-click update all by the user
-                extensionItemsToUpdateIndices = [self.w.extensionList.index(x) for x in extensionsItemsToUpdate if not x.extensionObject().remoteIsBeta()]
-                self.w.extensionList.setSelection(extensionItemsToUpdateIndices)
+    def _showExtensionsToUpdate(self):
+        # figure out which extension items need updating
+        extensionsItemsToUpdate = [x for x in self._wrappedItems if x.extensionObject().extensionNeedsUpdate()]
+        if len(extensionsItemsToUpdate) > 0:
+            # bring items that need updating to the top of the list
+            self._wrappedItems.sort(key=lambda x: x.extensionObject().extensionNeedsUpdate(), reverse=True)
 
-            self._didCheckForUpdates = True
+        # set the table view with the current _wrappedItems
+        self.setItems(self._wrappedItems)
+
+        # after the updated items are set...
+        if len(extensionsItemsToUpdate) > 0:
+            # ...scroll to the top of the list if there are items which need updating
+            self.w.extensionList.getNSTableView().scrollRowToVisible_(0)
+            # ...and select them for easy, one-click update all by the user
+            extensionItemsToUpdateIndices = [self.w.extensionList.index(x) for x in extensionsItemsToUpdate if not x.extensionObject().remoteIsBeta()]
+            self.w.extensionList.setSelection(extensionItemsToUpdateIndices)
+
+    def scheduleCheckForUpdates(self, itemsToCheck=None, delay=0):
+        """
+        Check for updates after `delay` seconds, at the earliest once the current events are handled, like drawing the list.
+        Only the installed extensions due for a check are checked when no `itemsToCheck` are given.
+        When a check is already scheduled, the items are checked along with that one.
+        """
+        if self._updateCheckScheduled:
+            scheduledItems = self._scheduledItemsToCheck
+            if scheduledItems is None and itemsToCheck is None:
+                return
+            if scheduledItems is None:
+                scheduledItems = self._itemsDueForUpdateCheck()
+            if itemsToCheck is None:
+                itemsToCheck = self._itemsDueForUpdateCheck()
+            self._scheduledItemsToCheck = scheduledItems + [item for item in itemsToCheck if item not in scheduledItems]
+            return
+        self._updateCheckScheduled = True
+        self._scheduledItemsToCheck = itemsToCheck
+        callLater(delay, self._scheduledCheckForUpdates)
+
+    def _scheduledCheckForUpdates(self):
+        if not self._updateCheckScheduled:
+            # the window closed in the meantime
+            return
+        if self.isCheckingForUpdates():
+            # like after a refreshed registry, check its new items when the running check is done
+            callLater(1, self._scheduledCheckForUpdates)
+            return
+        itemsToCheck = self._scheduledItemsToCheck
+        self._updateCheckScheduled = False
+        self._scheduledItemsToCheck = None
+        self.checkForUpdates(itemsToCheck)
+
+    def _itemsDueForUpdateCheck(self):
+        # only the installed extensions can need an update, and the
+        # ones checked recently already know their remote version
+        return [x.extensionObject() for x in self._wrappedItems if x.extensionObject().isExtensionInstalled() and x.extensionObject().updateCheckIsDue()]
+
+    def isCheckingForUpdates(self):
+        return self._updateCheckBatch is not None or self._githubUpdateCheck is not None
 
     def checkForUpdates(self, itemsToCheck=None):
+        if self.isCheckingForUpdates():
+            # already checking
+            return
+
         # reset the flag so we know we need to complete an update cycle
         self._didCheckForUpdates = False
 
         if itemsToCheck is None:
-            self._extensionsToCheck = [x.extensionObject() for x in self._wrappedItems]
+            self._extensionsToCheck = self._itemsDueForUpdateCheck()
         else:
             self._extensionsToCheck = itemsToCheck
 
         numExtensionsToCheck = len(self._extensionsToCheck)
-        self._numExtensionsChecked = 0
+        if not numExtensionsToCheck:
+            # nothing was checked, so nothing is recorded, only show what is known
+            self._showExtensionsToUpdate()
+            return
 
         self._progress = self.startProgress("Checking for updates...")
         self._progress.setTickCount(numExtensionsToCheck)
 
-        for item in self._extensionsToCheck:
-            # these get executed asyncronously and send extensionDidCheckForUpdates
-            # notifications when they’re done
+        # ask for the GitHub hosted extensions with a few GraphQL queries first,
+        # when there is a token, the other ones are fetched afterwards
+        githubItems = []
+        if canCheckGithubUpdatesInBatches():
+            githubItems = [item for item in self._extensionsToCheck if item.githubRepository() is not None]
+        if githubItems:
+            self._githubUpdateCheck = GithubUpdateCheck(
+                githubItems,
+                self._githubUpdateCheckDoneCallback,
+                itemCallback=self._githubUpdateCheckItemCallback,
+                owner=self
+            )
+            self._githubUpdateCheck.start()
+        else:
+            self._fetchUpdates(self._extensionsToCheck)
+
+    def _githubUpdateCheckItemCallback(self, item):
+        if self._progress is not None:
+            self._progress.update()
+
+    def _githubUpdateCheckDoneCallback(self, check):
+        logger.info("Checked %s GitHub extensions for updates with %s queries in %.1f seconds, %s left to fetch." % (len(check.items), check.queries, check.elapsed, len(check.unresolved)))
+        self._githubUpdateCheck = None
+        resolved = set(check.items) - set(check.unresolved)
+        self._fetchUpdates([item for item in self._extensionsToCheck if item not in resolved])
+
+    def _fetchUpdates(self, items):
+        # fetch all the update information as one batch, items
+        # without an update check URL check themselves right away
+        self._updateCheckItems = dict()
+        mirrors = dict()
+        itemsCheckingThemselves = []
+        for item in items:
+            url = item.updateCheckURL()
+            if url is None:
+                itemsCheckingThemselves.append(item)
+            else:
+                url = DefaultURLReader.process_url(url)
+                self._updateCheckItems.setdefault(url, []).append(item)
+                itemMirrors = item.updateCheckMirrors()
+                if itemMirrors:
+                    mirrors[url] = itemMirrors
+
+        self._updateCheckBatch = DefaultURLReader.fetch_many(
+            list(self._updateCheckItems),
+            self._extensionUpdateCheckCallback,
+            self._extensionsUpdateCheckDoneCallback,
+            priority=PRIORITY_BACKGROUND,
+            tag="updateCheck",
+            owner=self,
+            mirrors=mirrors,
+            with_status_code=True
+        )
+
+        for item in itemsCheckingThemselves:
             item.checkForUpdates()
+            if self._progress is not None:
+                self._progress.update()
 
     def setItems(self, items):
         # set the list with the current _wrappedItems
@@ -548,6 +752,7 @@ class MechanicController(BaseWindowController):
         # show a button to open the repo in a browser
         # list all releases
         def popoverCloseCallback(sender):
+            cancelURLReaderRequests(self._mechanicListItemPopoverController)
             del self._mechanicListItemPopoverController
 
         items = self.getSelection()
@@ -563,12 +768,16 @@ class MechanicController(BaseWindowController):
             if value:
                 if NSEvent.modifierFlags() & NSAlternateKeyMask:
                     # only check the selected items
-                    selected = self.getSelection()
-                    self.checkForUpdates(selected)
+                    itemsToCheck = self.getSelection()
                 else:
                     # only check for updates in items that are actually installed
-                    installed = [item.extensionObject() for item in self._wrappedItems if item.extensionObject().isExtensionInstalled()]
-                    self.checkForUpdates(installed)
+                    itemsToCheck = [item.extensionObject() for item in self._wrappedItems if item.extensionObject().isExtensionInstalled()]
+                if self.isCheckingForUpdates():
+                    # a check is running in the background, check these once it's done
+                    self.w.checkForUpdatesInfo.set("Checking again after the current check...")
+                    self.scheduleCheckForUpdates(itemsToCheck)
+                else:
+                    self.checkForUpdates(itemsToCheck)
                 self.extensionListSelectionCallback(self.w.extensionList)
 
         if self._didCheckForUpdates:
@@ -620,18 +829,17 @@ class MechanicController(BaseWindowController):
         # reload the underlying NSTableView data, which also triggers a repaint
         self.w.extensionList.getNSTableView().reloadData()
 
-    def extensionIconDidLoad(self, info):
-        iconURL = info.get('iconURL', None)
-        if iconURL:
-
-            if iconURL in self._iconURLs:
-                self._iconURLs.remove(iconURL)
+    def extensionIconsDidLoad(self, info):
+        # called once for all the icons delivered in the same batch
+        iconURLs = info.get('iconURLs', [])
+        for iconURL in iconURLs:
+            self._iconURLs.discard(iconURL)
 
-            # Call reloadData() for every icon that shows up in the visible area.
-            # This avoids the situation where most icons have loaded but we’re waiting
-            # for one way down the tableview, when the user is still at the top of the list
-            if iconURL in self._iconURLsForVisibleRows:
-                self.reloadData()
+        # Call reloadData() for every batch with icons that show up in the visible area.
+        # This avoids the situation where most icons have loaded but we’re waiting
+        # for one way down the tableview, when the user is still at the top of the list
+        if self._iconURLsForVisibleRows.intersection(iconURLs):
+            self.reloadData()
 
         # call setNeedsDisplay_(True) on the tableView once, when all the icons have loaded
         if len(self._iconURLs) == 0:
@@ -662,6 +870,8 @@ class MechanicController(BaseWindowController):
             self.showMessage(message, "Failed, see output window for details.")
 
     def settingsCallback(self, sender):
+        # the streams may have changed, drop what was loading for the old ones
+        self._cancelRequests()
         self.loadExtensions()
 
     # toolbar
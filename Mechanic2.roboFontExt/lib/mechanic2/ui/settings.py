@@ -2,6 +2,7 @@ import json
 import yaml
 import logging
 import vanilla
+from urllib.parse import urlparse
 
 import AppKit
 from Foundation import NSString, NSUTF8StringEncoding
@@ -11,7 +12,8 @@ from defconAppKit.windows.baseWindow import BaseWindowController
 from mojo.extensions import getExtensionDefault, setExtensionDefault, registerExtensionDefaults, removeExtensionDefault
 from mojo.UI import setPassword, getPassword, deletePassword
 
-from mechanic2 import DefaultURLReader, GithubDefaultURLReader
+from mechanic2 import DefaultURLReader, cancelURLReaderRequests, setGithubToken
+from mechanic2 import CACHE_PARTITION_REGISTRIES
 from mechanic2.extensionItem import ExtensionYamlItem
 
 
@@ -24,6 +26,25 @@ genericListPboardType = "mechanicListPBoardType"
 extensionStoreDataURL = "https://extensionstore.robofont.com/data.json"
 mechanicDataURL = "https://robofontmechanic.com/api/v2/registry.json"
 
+# streams loaded instead of the ones in the defaults, for this session only
+urlStreamsOverride = None
+
+
+def isExtensionStoreStream(url):
+    """
+    Return if the stream `url` is the extension store data, or a registry.
+    """
+    return urlparse(url).hostname == urlparse(extensionStoreDataURL).hostname
+
+
+def urlStreams():
+    """
+    Return the urls of the streams to load extensions from, `urlStreamsOverride` when set.
+    """
+    if urlStreamsOverride is not None:
+        return list(urlStreamsOverride)
+    return list(getExtensionDefault("com.mechanic.urlstreams"))
+
 
 def registerMechanicDefaults(reset=False):
     defaults = {
@@ -107,10 +128,11 @@ class AddURLSheet(BaseWindowController):
     def addCallback(self, sender):
         # check the URL before adding
         url = self.w.url.get()
-        DefaultURLReader.fetch(url, self._checkURLCallback)
+        DefaultURLReader.fetch(url, self._checkURLCallback, cache_partition=CACHE_PARTITION_REGISTRIES, tag="registry", owner=self)
         return True
 
     def closeCallback(self, sender):
+        cancelURLReaderRequests(self)
         self.w.close()
 
 
@@ -211,10 +233,7 @@ class Settings(BaseWindowController):
         # github token
         githubToken = self.w.githubToken.get()
         setPassword(service="com.mechanic.githubToken", username=str(AppKit.NSUserName()), password=str(githubToken))
-        if githubToken:
-            GithubDefaultURLReader.setHeaders(dict(Authorization='token ' + githubToken))
-        else:
-            GithubDefaultURLReader.setHeaders(None)
+        setGithubToken(githubToken)
 
     def createURLItems(self, urls):
         return [self.createURLItem(url) for url in urls]
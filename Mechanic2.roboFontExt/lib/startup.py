@@ -7,8 +7,10 @@ from vanilla.dialogs import message, BaseMessageDialog
 from mojo.tools import registerFileExtension
 
 from mojo.events import addObserver
-from mojo.extensions import setExtensionDefault, getExtensionDefault
+from mojo.extensions import setExtensionDefault, getExtensionDefault, ExtensionBundle
 
+from mechanic2 import MechanicRemoteVersions
+from mechanic2.remoteVersions import DEFAULT_CHECK_INTERVAL, MAX_CHECK_INTERVAL
 from mechanic2.extensionItem import ExtensionYamlItem
 from mechanic2.ui.controller import MechanicController
 
@@ -17,6 +19,28 @@ logger = logging.getLogger("Mechanic")
 
 fileExtension = "mechanic"
 
+
+def updateCheckIsDue():
+    """
+    Return if one of the installed extensions is due for an update check.
+    Each has its own check interval, depending on how often it releases. All of them are
+    checked at least every `MAX_CHECK_INTERVAL`, like the ones installed without Mechanic.
+    After a check, or after asking to check later, nobody is asked again for `DEFAULT_CHECK_INTERVAL`.
+    """
+    now = time.time()
+    lastCheck = getExtensionDefault("com.mechanic.lastUpdateCheck")
+    if not len(MechanicRemoteVersions) or lastCheck + MAX_CHECK_INTERVAL < now:
+        return True
+    if lastCheck + DEFAULT_CHECK_INTERVAL > now:
+        # checked or snoozed recently
+        return False
+    for entry in MechanicRemoteVersions.due(now).values():
+        bundleName = entry.get("bundleName")
+        if bundleName and ExtensionBundle(bundleName).bundleExists():
+            return True
+    return False
+
+
 registerFileExtension(fileExtension)
 
 
@@ -60,10 +84,8 @@ class MechanicObservers(object):
         shouldCheckForUpdates = getExtensionDefault("com.mechanic.checkForUpdate")
         if not shouldCheckForUpdates:
             return
-        lastCheck = getExtensionDefault("com.mechanic.lastUpdateCheck")
-        oneDay = 60 * 60 * 24
         now = time.time()
-        if lastCheck + oneDay < now:
+        if updateCheckIsDue():
             messageText = "Mechanic would like to check for updates."
             informativeText = "Updating might take some time, you can check for updates later by opening the Mechanic extension."
 
@@ -0,0 +1,35 @@
+from urlreader.base import URLReaderError, Transport
+from urlreader.base import callback, status_callback
+from urlreader.base import CACHE_HIT, CACHE_MISS, CACHE_KNOWN_FAILURE
+from urlreader.base import CACHE_STALE
+from urlreader.base import PRIORITY_INTERACTIVE, PRIORITY_VISIBLE
+from urlreader.base import PRIORITY_BACKGROUND
+from urlreader.batch import FetchBatch
+from urlreader.dispatch import BatchReceiver, BatchDispatcher
+from urlreader.dispatch import DELIVERY_BUDGET
+from urlreader.cache import ContentStore, DEFAULT_PARTITION
+from urlreader.metrics import Metrics, RequestTrace, Histogram
+from urlreader.metrics import OUTCOME_HIT, OUTCOME_MISS, OUTCOME_REVALIDATED
+from urlreader.metrics import OUTCOME_STALE, OUTCOME_ERROR
+from urlreader.retry import RetryPolicy, is_transient_error
+from urlreader.ratelimit import RateLimit, retry_after
+from urlreader.redirects import RedirectMap
+from urlreader.negative import NegativeCache, KnownFailureError
+from urlreader.negative import FAILURE_NOT_FOUND, FAILURE_TIMEOUT
+from urlreader.negative import FAILURE_PARSE, FAILURE_SERVER_ERROR
+from urlreader.negative import FAILURE_RATE_LIMITED, FAILURE_HTTP_ERROR
+from urlreader.negative import failure_class, status_failure_class
+from urlreader.breaker import CircuitBreaker, HostUnavailableError
+from urlreader.breaker import CLOSED, OPEN, HALF_OPEN
+from urlreader.transport import PooledTransport
+from urlreader.cassette import Cassette, CassetteTransport, RECORD, REPLAY
+from urlreader.reader import URLReader, CACHE_DIRECTORY_URL
+
+try:
+    from urlreader.foundation import FoundationTransport
+    from urlreader.foundation import USER_CACHE_DIRECTORY_URL
+except ImportError:
+    # no PyObjC, only the pure Python transport is available
+    FoundationTransport = None
+    from urlreader.transport import USER_CACHE_DIRECTORY \
+        as USER_CACHE_DIRECTORY_URL
@@ -0,0 +1,150 @@
+import logging
+
+
+logger = logging.getLogger('URLReader')
+
+
+# outcomes reported to callbacks fetched with `with_status=True`
+CACHE_HIT = 'hit'
+CACHE_MISS = 'miss'
+CACHE_KNOWN_FAILURE = 'known failure'
+CACHE_STALE = 'stale'
+
+
+# priority classes for URLReader.fetch(), lower values start first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_VISIBLE = 1
+PRIORITY_BACKGROUND = 2
+
+
+def callback(url, data, error):
+    """URLReader prototype callback
+
+    By providing a function with the same signature as this to
+    URLReader.fetch(), code can be notified when the background URL
+    fetching operation has been completed and manipulate the resulting
+    data. The callback will be called on the main thread.
+    """
+    raise NotImplementedError
+
+
+def status_callback(url, data, error, status):
+    """URLReader prototype callback with cache status
+
+    Same as callback() but used with URLReader.fetch(..., with_status=True).
+    `status` is CACHE_HIT when the data was served from the local copy,
+    either directly or after a `304 Not Modified` response, and
+    CACHE_MISS when the body was downloaded. It is CACHE_KNOWN_FAILURE
+    when the URL wasn’t requested, as it failed recently, and CACHE_STALE
+    when an outdated local copy is given while it is being refreshed.
+    """
+    raise NotImplementedError
+
+
+def completion(data, response_url, status_code, headers, error):
+    """Transport prototype completion
+
+    Called by Transport.request() once a request has finished, from any
+    thread. `response_url` is the URL after all the redirects, or None
+    when there was no response. `status_code` is the HTTP status code and
+    `headers` a dict with the response headers, both only meaningful for
+    HTTP responses.
+    """
+    raise NotImplementedError
+
+
+class URLReaderError(Exception):
+    pass
+
+
+class Transport(object):
+
+    """The interface between URLReader and an HTTP implementation
+
+    A transport performs single requests in the background, everything
+    else (coalescing, scheduling, caching and revalidation) is handled by
+    URLReader so it behaves the same on every transport.
+
+    URLs are passed to a transport as strings, the URL objects handed to
+    callbacks are made by url(), so the native type of a transport, like
+    NSURL, is preserved.
+    """
+
+    def set_timeout(self, timeout):
+        raise NotImplementedError
+
+    def set_headers(self, headers):
+        raise NotImplementedError
+
+    def set_max_connections_per_host(self, max_connections):
+        pass
+
+    def set_bypass_cache(self, bypass):
+        """Don’t use any HTTP cache of the transport
+
+        Set when URLReader keeps its own cache, so responses are neither
+        stored twice nor served without URLReader knowing.
+        """
+        pass
+
+    def url(self, url):
+        return url
+
+    def request(self, url, headers, completion, trace=None, body=None):
+        """Start a GET request for `url` with the additional `headers`
+
+        With a `body`, bytes, a POST request sending it is started instead.
+
+        `completion` is called with the same signature as the prototype
+        completion() in this module. When given, the `first_byte`,
+        `redirects`, `redirect_responses` and `status_code` of the
+        RequestTrace `trace` should be set before calling it, and before
+        the body for downloads.
+
+        Returns a task that can be given to cancel().
+        """
+        raise NotImplementedError
+
+    def download(self, url, headers, path, progress, completion,
+                 trace=None):
+        """Start a GET request for `url`, streaming the body to `path`
+
+        `progress` is called from any thread with (bytes_received,
+        bytes_expected), `bytes_expected` is -1 when unknown.
+        `completion` and `trace` are handled like for request(), with
+        `path` instead of the data. When the download fails, `path` is
+        still passed and holds the part of the body received, along with
+        the status code and headers if the response had started.
+        """
+        raise NotImplementedError
+
+    def cancel(self, task):
+        """Stop the request of `task`, returned by request() or download()
+
+        Its completion may still be called, with an error, or not at all.
+        """
+        pass
+
+    def dispatch(self, function, *args):
+        """Call `function` on the main thread"""
+        raise NotImplementedError
+
+    def run_loop(self, timeout):
+        """Process main thread work for at most `timeout` seconds"""
+        raise NotImplementedError
+
+    def idle(self):
+        """Return if there is no main thread work left to dispatch"""
+        return True
+
+
+def header_value(headers, name):
+    # header field names are case insensitive and their capitalization
+    # depends on the server and, for NSURLSession, the macOS version
+    if not headers:
+        return None
+    name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == name:
+            return str(value)
+    return None
@@ -0,0 +1,76 @@
+import time
+
+from urlreader.base import logger
+
+
+class FetchBatch(object):
+
+    """A set of fetches scheduled as one unit by URLReader.fetch_many()
+
+    Results are collected in the order of the requested URLs. The
+    batch is only touched from the main thread, where the callbacks
+    run, so it needs no locking.
+    """
+
+    def __init__(self, urls, per_item_callback=None, done_callback=None,
+                 with_status=False, with_status_code=False):
+        self.urls = list(urls)
+        self.total = len(self.urls)
+        self.completed = 0
+        self.results = [None] * self.total
+        self.started = time.monotonic()
+        self.finished = None
+        self._per_item_callback = per_item_callback
+        self._done_callback = done_callback
+        self._with_status = with_status
+        self._with_status_code = with_status_code
+
+    @property
+    def done(self):
+        return self.finished is not None
+
+    @property
+    def elapsed(self):
+        end = self.finished
+        if end is None:
+            end = time.monotonic()
+        return end - self.started
+
+    @property
+    def errors(self):
+        return [result for result in self.results
+                if result is not None and result[2] is not None]
+
+    def callback(self, index, request_url):
+        # the status callback URLReader calls for the item at `index`
+        def item_callback(url, data, error, status, status_code=None):
+            self._item_done(index, request_url, data, error, status,
+                            status_code)
+        item_callback.with_status_code = self._with_status_code
+        return item_callback
+
+    def _item_done(self, index, url, data, error, status, status_code=None):
+        result = (url, data, error)
+        if self._with_status:
+            result += (status,)
+        if self._with_status_code:
+            result += (status_code,)
+        self.results[index] = result
+        self.completed += 1
+        if self._per_item_callback is not None:
+            try:
+                self._per_item_callback(*result)
+            except Exception:
+                # one failing item must not prevent the batch completion
+                logger.exception(f'Error calling {self._per_item_callback}')
+        if self.completed == self.total:
+            self.finish()
+
+    def finish(self):
+        if self.finished is not None:
+            return
+        self.finished = time.monotonic()
+        logger.debug(f'{self.total} fetches done in {self.elapsed:.3f}s, '
+                     f'{len(self.errors)} errors')
+        if self._done_callback is not None:
+            self._done_callback(self.results)
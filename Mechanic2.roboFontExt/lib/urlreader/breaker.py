@@ -0,0 +1,138 @@
+import time
+import threading
+
+from urlreader.base import URLReaderError, logger
+from urlreader.retry import is_transient_error
+
+
+# states of a host in a CircuitBreaker
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+def is_host_failure(status_code, error):
+    """Return if a response tells the host is down or overloaded"""
+    if error is not None:
+        return is_transient_error(error)
+    return status_code is not None and status_code >= 500
+
+
+class HostUnavailableError(URLReaderError):
+
+    """The error of a request not sent, as its host is failing
+
+    `retry_at` is the time, since the epoch, after which a request will be
+    let through to probe the host again.
+    """
+
+    def __init__(self, host, retry_at):
+        super().__init__(f'{host} is unavailable')
+        self.host = host
+        self.retry_at = retry_at
+
+
+class _Circuit(object):
+
+    # the state of a single host
+
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0
+        # when it opened, or the probe started
+        self.opened = None
+
+
+class CircuitBreaker(object):
+
+    """Fail fast on hosts that keep failing
+
+    After `threshold` consecutive failures of a host, timeouts, dropped
+    connections and 5xx responses, its circuit opens: requests to it
+    fail right away with a HostUnavailableError instead of waiting for
+    a timeout. URLReader records a request once its retries are
+    exhausted, not every attempt. After `cool_down` seconds, a single
+    request is let through as a probe, its success closes the circuit
+    again and its failure opens it for another `cool_down`, it isn’t
+    retried. A probe that doesn’t answer within `cool_down` is replaced
+    by another one. All methods can be called from any thread.
+    """
+
+    def __init__(self, threshold=3, cool_down=60):
+        self.threshold = threshold
+        self.cool_down = cool_down
+        self._lock = threading.Lock()
+        self._circuits = {}
+
+    def reset(self):
+        with self._lock:
+            self._circuits = {}
+
+    def state(self, host):
+        with self._lock:
+            circuit = self._circuits.get(host)
+            if circuit is None:
+                return CLOSED
+            return circuit.state
+
+    def states(self):
+        """Return the state of every host that isn’t closed"""
+        with self._lock:
+            return {host: circuit.state
+                    for host, circuit in self._circuits.items()
+                    if circuit.state != CLOSED}
+
+    def unavailable(self, host):
+        """Return a HostUnavailableError when `host` fails fast, or None
+
+        Doesn’t let a probe through, see allow() for that.
+        """
+        with self._lock:
+            circuit = self._circuits.get(host)
+            if circuit is None or circuit.state == CLOSED:
+                return None
+            retry_at = circuit.opened + self.cool_down
+            if retry_at <= time.time():
+                # a probe can go
+                return None
+            return HostUnavailableError(host, retry_at)
+
+    def allow(self, host):
+        """Return if a request to `host` can be sent
+
+        Once the cool-down is over, the first request asking is the
+        probe and the others wait for its outcome.
+        """
+        with self._lock:
+            circuit = self._circuits.get(host)
+            if circuit is None or circuit.state == CLOSED:
+                return True
+            now = time.time()
+            if circuit.opened + self.cool_down <= now:
+                circuit.state = HALF_OPEN
+                circuit.opened = now
+                logger.debug(f'{host} probing')
+                return True
+            return False
+
+    def record(self, host, status_code, error):
+        """Record the outcome of a request to `host`"""
+        failed = is_host_failure(status_code, error)
+        if not failed and error is not None:
+            # like a TLS error, it says nothing about the host load
+            return
+        with self._lock:
+            circuit = self._circuits.setdefault(host, _Circuit())
+            if not failed:
+                if circuit.state != CLOSED:
+                    logger.info(f'{host} available again')
+                self._circuits.pop(host)
+                return
+            circuit.failures += 1
+            if circuit.state == HALF_OPEN or \
+                    circuit.failures >= self.threshold:
+                if circuit.state == CLOSED:
+                    logger.warning(f'{host} unavailable, failing fast for '
+                                   f'{self.cool_down}s')
+                circuit.state = OPEN
+                circuit.opened = time.time()
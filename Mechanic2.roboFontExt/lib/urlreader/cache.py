@@ -0,0 +1,287 @@
+import os
+import json
+import atexit
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+
+from urllib.parse import urlparse, unquote
+
+from urlreader.base import logger
+
+
+DEFAULT_PARTITION = 'default'
+
+# budget of a partition without an explicit one, in bytes
+DEFAULT_BUDGET = 20 * 1024 * 1024
+
+INDEX_VERSION = 1
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def cache_path(location):
+    """Return a file system path for a cache location
+
+    `location` can be a path, a file:// URL string or a NSURL.
+    """
+    if not isinstance(location, str):
+        # a NSURL, when running on macOS
+        return location.path()
+    if location.startswith('file:'):
+        return unquote(urlparse(location).path)
+    return location
+
+
+class ContentStore(object):
+
+    """A persistent, content addressed cache
+
+    Bodies are stored once per content digest, so identical bytes fetched
+    from different URLs share a single file. Every URL entry belongs to a
+    partition, like icons or metadata, and every partition has its own
+    budget in bytes: when a partition grows beyond it, the least recently
+    used entries are evicted.
+
+    The URL entries are kept in a single JSON index, loaded once when the
+    store is opened and written back by save(). All methods can be called
+    from any thread.
+    """
+
+    def __init__(self, location, budgets=None):
+        self._location = cache_path(location)
+        self._objects = os.path.join(self._location, 'objects')
+        self._index_path = os.path.join(self._location, 'index.json')
+        self._lock = threading.RLock()
+        self._budgets = dict(budgets or {})
+        self._dirty = False
+
+        # url -> [digest, size, partition, accessed, validators, fetched]
+        self._entries = {}
+        # digest -> number of url entries referencing it
+        self._references = {}
+        # partition -> {digest: number of url entries}, and its size
+        self._partition_digests = {}
+        self._partition_sizes = {}
+
+        os.makedirs(self._objects, exist_ok=True)
+        self._load()
+        atexit.register(self.save)
+
+    @property
+    def location(self):
+        return self._location
+
+    # index
+
+    def _load(self):
+        try:
+            with open(self._index_path, 'rb') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return
+        if index.get('version') != INDEX_VERSION:
+            logger.debug(f'{self._index_path} ignored, unknown version')
+            return
+        for url, entry in index.get('entries', {}).items():
+            self._add_entry(url, entry)
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            index = json.dumps(dict(
+                version=INDEX_VERSION, entries=self._entries))
+            self._dirty = False
+        fd, temp_path = tempfile.mkstemp(dir=self._location)
+        with os.fdopen(fd, 'w') as f:
+            f.write(index)
+        os.replace(temp_path, self._index_path)
+
+    def _add_entry(self, url, entry):
+        digest, size, partition = entry[:3]
+        self._entries[url] = entry
+        self._references[digest] = self._references.get(digest, 0) + 1
+        digests = self._partition_digests.setdefault(partition, {})
+        if digest not in digests:
+            self._partition_sizes[partition] = \
+                self._partition_sizes.get(partition, 0) + size
+        digests[digest] = digests.get(digest, 0) + 1
+
+    def _remove_entry(self, url):
+        digest, size, partition = self._entries.pop(url)[:3]
+        digests = self._partition_digests[partition]
+        digests[digest] -= 1
+        if not digests[digest]:
+            del digests[digest]
+            self._partition_sizes[partition] -= size
+        self._references[digest] -= 1
+        if not self._references[digest]:
+            del self._references[digest]
+            path = self._object_path(digest)
+            if os.path.exists(path):
+                os.unlink(path)
+        self._dirty = True
+
+    def _object_path(self, digest):
+        return os.path.join(self._objects, digest[:2], digest)
+
+    # cache
+
+    def get(self, url):
+        """Return a (data, validators) tuple for `url`, or None"""
+        found = self.get_path(url)
+        if found is None:
+            return None
+        path, validators = found
+        try:
+            with open(path, 'rb') as f:
+                return f.read(), validators
+        except OSError:
+            return None
+
+    def get_path(self, url):
+        """Return a (path, validators) tuple for `url`, or None
+
+        The file at path is shared, it must not be modified.
+        """
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                return None
+            path = self._object_path(entry[0])
+            if not os.path.exists(path):
+                # removed behind our back
+                self._remove_entry(url)
+                return None
+            entry[3] = time.time()
+            self._dirty = True
+            return path, entry[4]
+
+    def set(self, url, data, validators=None, partition=None):
+        data = bytes(data)
+        digest = hashlib.sha256(data).hexdigest()
+
+        def write(path):
+            with open(path, 'wb') as f:
+                f.write(data)
+
+        self._store(url, digest, len(data), write, validators, partition)
+
+    def set_path(self, url, path, validators=None, partition=None):
+        """Store a copy of the file at `path` for `url`"""
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b''):
+                sha.update(chunk)
+
+        def write(object_path):
+            shutil.copyfile(path, object_path)
+
+        self._store(url, sha.hexdigest(), os.path.getsize(path), write,
+                    validators, partition)
+
+    def _store(self, url, digest, size, write, validators, partition):
+        if partition is None:
+            partition = DEFAULT_PARTITION
+        object_path = self._object_path(digest)
+        with self._lock:
+            # drop the previous entry first, its object may be shared
+            if url in self._entries:
+                self._remove_entry(url)
+            if not os.path.exists(object_path):
+                os.makedirs(os.path.dirname(object_path), exist_ok=True)
+                fd, temp_path = tempfile.mkstemp(
+                    dir=os.path.dirname(object_path))
+                os.close(fd)
+                try:
+                    write(temp_path)
+                    os.replace(temp_path, object_path)
+                except Exception:
+                    os.unlink(temp_path)
+                    raise
+            now = time.time()
+            self._add_entry(
+                url, [digest, size, partition, now, validators, now])
+            self._dirty = True
+            self.trim(partition)
+
+    def age(self, url):
+        """Return the seconds since `url` was stored or revalidated, or None"""
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None or len(entry) < 6:
+                # entries written before the time was kept are as old
+                # as can be
+                return None
+            return max(0, time.time() - entry[5])
+
+    def touch(self, url):
+        """Record that the copy of `url` was just revalidated"""
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                return
+            entry[5:] = [time.time()]
+            self._dirty = True
+
+    def invalidate(self, url):
+        with self._lock:
+            if url in self._entries:
+                self._remove_entry(url)
+
+    def flush(self, partition=None):
+        """Remove every entry, or only the ones of `partition`"""
+        with self._lock:
+            for url, entry in list(self._entries.items()):
+                if partition is None or entry[2] == partition:
+                    self._remove_entry(url)
+
+    # partitions
+
+    def set_budget(self, partition, budget):
+        with self._lock:
+            self._budgets[partition] = budget
+            self.trim(partition)
+
+    def budget(self, partition):
+        return self._budgets.get(partition, DEFAULT_BUDGET)
+
+    def partitions(self):
+        with self._lock:
+            names = set(self._partition_sizes) | set(self._budgets)
+            return sorted(names)
+
+    def usage(self, partition):
+        """Return a dict with the size, entries and budget of `partition`"""
+        with self._lock:
+            entries = sum(
+                1 for entry in self._entries.values()
+                if entry[2] == partition)
+            return dict(
+                size=self._partition_sizes.get(partition, 0),
+                entries=entries,
+                budget=self.budget(partition)
+            )
+
+    def trim(self, partition, size=None):
+        """Evict the least recently used entries of `partition`
+
+        Entries are evicted until the partition fits in `size`, or in its
+        budget when no size is given.
+        """
+        if size is None:
+            size = self.budget(partition)
+        with self._lock:
+            if self._partition_sizes.get(partition, 0) <= size:
+                return
+            entries = sorted(
+                (entry[3], url) for url, entry in self._entries.items()
+                if entry[2] == partition)
+            for _, url in entries:
+                if self._partition_sizes.get(partition, 0) <= size:
+                    break
+                logger.debug(f'{url} evicted from {partition}')
+                self._remove_entry(url)
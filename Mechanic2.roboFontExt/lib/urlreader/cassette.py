@@ -0,0 +1,372 @@
+import os
+import gzip
+import json
+import time
+import atexit
+import base64
+import hashlib
+import builtins
+import threading
+import http.client
+
+from urlreader.base import Transport, URLReaderError, logger
+from urlreader.metrics import error_class
+
+try:
+    from urlreader.foundation import FoundationTransport as DefaultTransport
+except ImportError:
+    from urlreader.transport import PooledTransport as DefaultTransport
+
+
+# modes of a Cassette
+RECORD = 'record'
+REPLAY = 'replay'
+
+CASSETTE_VERSION = 1
+
+# request headers that change the response, the only ones recorded, so
+# credentials never end up in a cassette
+_RECORDED_REQUEST_HEADERS = ('If-None-Match', 'If-Modified-Since', 'Range',
+                             'If-Range')
+
+# NSURLErrorDomain codes replayed as the Python errors URLReader handles
+# the same way
+_URL_ERRORS = {
+    '-1001': TimeoutError,
+    '-1004': ConnectionRefusedError,
+    '-1005': ConnectionResetError,
+}
+
+
+def _request_key(headers, body=None):
+    # the recorded request headers, and the digest of the body of a
+    # POST, as a stable string
+    recorded = {}
+    for name, value in (headers or {}).items():
+        for recorded_name in _RECORDED_REQUEST_HEADERS:
+            if name.lower() == recorded_name.lower():
+                recorded[recorded_name] = str(value)
+    if body is not None:
+        recorded['body'] = hashlib.sha256(body).hexdigest()
+    return json.dumps(recorded, sort_keys=True)
+
+
+def _replayed_error(name, message):
+    # an error like the recorded one, close enough for URLReader to
+    # retry, classify or report it the same way
+    if name is None:
+        return None
+    if name.startswith('NSURLErrorDomain '):
+        error_type = _URL_ERRORS.get(name.split()[1])
+        if error_type is not None:
+            return error_type(message)
+        return URLReaderError(message)
+    if name == 'IncompleteRead':
+        return http.client.IncompleteRead(b'')
+    error_type = getattr(builtins, name, None)
+    if isinstance(error_type, type) and issubclass(error_type, OSError):
+        return error_type(message)
+    return URLReaderError(message)
+
+
+class Cassette(object):
+
+    """Recorded HTTP exchanges, to replay a workload without the network
+
+    In RECORD mode, every exchange of the CassetteTransports using the
+    cassette is kept: the URL, the headers that change the response,
+    the status code, headers, redirects, timings and body of the
+    response, or its error. save(), also called at exit, writes them to
+    `path` as gzipped JSON, identical bodies stored once.
+
+    In REPLAY mode, the exchanges are read from `path` and served by
+    the CassetteTransports. All methods can be called from any thread.
+    """
+
+    def __init__(self, path, mode=RECORD):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f'Unknown cassette mode {mode!r}')
+        self.path = path
+        self.mode = mode
+        self._lock = threading.Lock()
+        # url -> [exchange]
+        self._exchanges = {}
+        # digest -> body
+        self._bodies = {}
+        # (url, request key) -> times replayed
+        self._played = {}
+        self._dirty = False
+        if mode == REPLAY:
+            self._load()
+        else:
+            atexit.register(self.save)
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(exchanges)
+                       for exchanges in self._exchanges.values())
+
+    def _load(self):
+        with gzip.open(self.path, 'rt') as f:
+            cassette = json.load(f)
+        if cassette.get('version') != CASSETTE_VERSION:
+            raise URLReaderError(f'{self.path} has an unknown version')
+        self._bodies = {digest: base64.b64decode(body)
+                        for digest, body in cassette['bodies'].items()}
+        for exchange in cassette['exchanges']:
+            self._exchanges.setdefault(exchange['url'], []).append(exchange)
+
+    def save(self):
+        if self.mode != RECORD:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            cassette = dict(
+                version=CASSETTE_VERSION,
+                exchanges=[exchange
+                           for exchanges in self._exchanges.values()
+                           for exchange in exchanges],
+                bodies={digest: base64.b64encode(body).decode('ascii')
+                        for digest, body in self._bodies.items()},
+            )
+            self._dirty = False
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with gzip.open(self.path, 'wt') as f:
+            json.dump(cassette, f, separators=(',', ':'))
+        logger.debug(f'{len(cassette["exchanges"])} exchanges written to '
+                     f'{self.path}')
+
+    def record(self, url, headers, body, response_url, status_code,
+               response_headers, error, redirect_responses, first_byte,
+               total, request_body=None):
+        digest = None
+        if body:
+            body = bytes(body)
+            digest = hashlib.sha256(body).hexdigest()
+        exchange = dict(
+            url=url,
+            request=_request_key(headers, request_body),
+            body=digest,
+            response_url=None if response_url is None else str(response_url),
+            status_code=status_code,
+            headers={str(name): str(value)
+                     for name, value in (response_headers or {}).items()},
+            redirects=[[status, {str(name): str(value)
+                                 for name, value in (redirect or {}).items()}]
+                       for status, redirect in redirect_responses or []],
+            error=error_class(error),
+            message=None if error is None else str(error),
+            first_byte=first_byte,
+            total=total,
+        )
+        with self._lock:
+            if digest is not None:
+                self._bodies[digest] = body
+            self._exchanges.setdefault(url, []).append(exchange)
+            self._dirty = True
+
+    def play(self, url, headers, request_body=None):
+        """Return the exchange to replay for `url` and `headers`, or None
+
+        Exchanges recorded with the same request headers are preferred,
+        then unconditional ones. Several matching exchanges, like a
+        resource changing between two requests, are replayed in turn.
+        A POST only replays an exchange with the same `request_body`.
+        """
+        key = _request_key(headers, request_body)
+        with self._lock:
+            exchanges = self._exchanges.get(url)
+            if not exchanges:
+                return None
+            matches = [exchange for exchange in exchanges
+                       if exchange['request'] == key]
+            if not matches and request_body is not None:
+                return None
+            if not matches:
+                matches = [exchange for exchange in exchanges
+                           if exchange['request'] == '{}'] or exchanges
+            played = self._played.get((url, key), 0)
+            self._played[(url, key)] = played + 1
+            return matches[played % len(matches)]
+
+    def body(self, exchange):
+        with self._lock:
+            return self._bodies.get(exchange['body'], b'')
+
+
+class _ReplayTask(object):
+
+    # a replayed request, cancelled by stopping its timer
+
+    def __init__(self):
+        self.timer = None
+
+    def cancel(self):
+        if self.timer is not None:
+            self.timer.cancel()
+
+
+class CassetteTransport(Transport):
+
+    """A transport recording to, or replaying from, a Cassette
+
+    When recording, requests go through `transport`, by default the
+    transport URLReader uses, and every exchange is added to `cassette`.
+
+    When replaying, nothing goes to the network: responses are served
+    from the cassette after `latency` seconds, plus the time the body
+    takes at `bandwidth` bytes per second when given. With
+    `recorded_timing`, the recorded times are used instead. A URL that
+    isn’t in the cassette fails with a URLReaderError. `transport` is
+    then only used to dispatch callbacks to the main thread.
+    """
+
+    def __init__(self, cassette, transport=None, latency=0, bandwidth=None,
+                 recorded_timing=False):
+        if transport is None:
+            transport = DefaultTransport()
+        self._cassette = cassette
+        self._transport = transport
+        self._latency = latency
+        self._bandwidth = bandwidth
+        self._recorded_timing = recorded_timing
+        self._tasks = set()
+        self._tasks_lock = threading.Lock()
+
+    @property
+    def cassette(self):
+        return self._cassette
+
+    def set_timeout(self, timeout):
+        self._transport.set_timeout(timeout)
+
+    def set_headers(self, headers):
+        self._transport.set_headers(headers)
+
+    def set_max_connections_per_host(self, max_connections):
+        self._transport.set_max_connections_per_host(max_connections)
+
+    def set_bypass_cache(self, bypass):
+        self._transport.set_bypass_cache(bypass)
+
+    def url(self, url):
+        return self._transport.url(url)
+
+    def request(self, url, headers, completion, trace=None, body=None):
+        if self._cassette.mode == REPLAY:
+            return self._replay(url, headers, None, None, completion, trace,
+                                body)
+        return self._transport.request(
+            url, headers,
+            self._recorder(url, headers, completion, trace, None, body),
+            trace, body)
+
+    def download(self, url, headers, path, progress, completion,
+                 trace=None):
+        if self._cassette.mode == REPLAY:
+            return self._replay(url, headers, path, progress, completion,
+                                trace)
+        return self._transport.download(
+            url, headers, path, progress,
+            self._recorder(url, headers, completion, trace, path), trace)
+
+    def cancel(self, task):
+        if isinstance(task, _ReplayTask):
+            task.cancel()
+            self._finished(task)
+        else:
+            self._transport.cancel(task)
+
+    def dispatch(self, function, *args):
+        self._transport.dispatch(function, *args)
+
+    def run_loop(self, timeout):
+        self._transport.run_loop(timeout)
+
+    def idle(self):
+        with self._tasks_lock:
+            if self._tasks:
+                return False
+        return self._transport.idle()
+
+    def _recorder(self, url, headers, completion, trace, path=None,
+                  request_body=None):
+        sent = time.monotonic()
+
+        def record(data, response_url, status_code, response_headers,
+                   error):
+            body = data
+            if path is not None:
+                body = b''
+                if os.path.exists(path):
+                    with open(path, 'rb') as f:
+                        body = f.read()
+            self._cassette.record(
+                url, headers, body, response_url, status_code,
+                response_headers, error,
+                trace.redirect_responses if trace is not None else None,
+                trace.first_byte if trace is not None else None,
+                time.monotonic() - sent, request_body)
+            completion(data, response_url, status_code, response_headers,
+                       error)
+
+        return record
+
+    def _replay(self, url, headers, path, progress, completion, trace,
+                request_body=None):
+        exchange = self._cassette.play(url, headers, request_body)
+        task = _ReplayTask()
+        if exchange is None:
+            logger.debug(f'{url} not in {self._cassette.path}')
+            first_byte = total = self._latency
+            body = b''
+        else:
+            body = self._cassette.body(exchange)
+            first_byte = self._latency
+            total = first_byte
+            if self._bandwidth:
+                total += len(body) / self._bandwidth
+            if self._recorded_timing:
+                first_byte = exchange['first_byte'] or 0
+                total = exchange['total'] or 0
+
+        def finish():
+            self._finished(task)
+            if exchange is None:
+                completion(path, None, None, {},
+                           URLReaderError(f'{url} not in the cassette'))
+                return
+            if trace is not None:
+                trace.first_byte = first_byte
+                trace.redirects = len(exchange['redirects'])
+                trace.redirect_responses = [
+                    tuple(redirect) for redirect in exchange['redirects']]
+                trace.status_code = exchange['status_code']
+            data = body
+            if path is not None:
+                with open(path, 'wb') as f:
+                    f.write(body)
+                if progress is not None and body:
+                    progress(len(body), len(body))
+                data = path
+            response_url = exchange['response_url']
+            if response_url is not None:
+                response_url = self._transport.url(response_url)
+            completion(data, response_url, exchange['status_code'],
+                       dict(exchange['headers']),
+                       _replayed_error(exchange['error'],
+                                       exchange['message']))
+
+        task.timer = threading.Timer(total, finish)
+        task.timer.daemon = True
+        with self._tasks_lock:
+            self._tasks.add(task)
+        task.timer.start()
+        return task
+
+    def _finished(self, task):
+        with self._tasks_lock:
+            self._tasks.discard(task)
@@ -0,0 +1,120 @@
+import time
+import threading
+import collections
+
+from urlreader.base import logger
+
+
+# time the main thread spends calling callbacks before it handles events
+# again, in seconds, about half a frame at 60 Hz
+DELIVERY_BUDGET = 0.008
+
+
+class BatchReceiver(object):
+
+    """A callback receiving all the results of a delivery batch at once
+
+    Give callback(`context`) to URLReader.fetch() instead of a function:
+    the results delivered in the same batch are given to `function` as a
+    single list of (context, url, data, error) tuples, with the cache
+    status as well when `with_status` is set. Like a table reloaded once
+    for all the icons that came in, rather than once per icon.
+    """
+
+    def __init__(self, function, with_status=False):
+        self._function = function
+        self._with_status = with_status
+
+    def callback(self, context=None):
+        return _BatchItem(self, context)
+
+    def _receive(self, results):
+        if not self._with_status:
+            results = [result[:4] for result in results]
+        self._function(results)
+
+
+class _BatchItem(object):
+
+    # the callback of a single fetch delivered to a BatchReceiver
+
+    batched = True
+
+    def __init__(self, receiver, context):
+        self.receiver = receiver
+        self.context = context
+
+    def __call__(self, url, data, error, status=None):
+        # outside of a dispatcher, like with `wait_until_done`
+        self.receiver._receive([(self.context, url, data, error, status)])
+
+
+class BatchDispatcher(object):
+
+    """Deliver callbacks to the main thread in batches
+
+    Calls are queued from any thread and a single flush is dispatched to
+    the main thread for all of them. A flush stops after `budget`
+    seconds and dispatches another one for what is left, so events are
+    handled in between and the UI stays responsive while hundreds of
+    responses come in. With a None `budget`, a flush delivers everything
+    queued. Calls are always made in the order they were queued.
+    """
+
+    def __init__(self, transport, budget=DELIVERY_BUDGET):
+        self._transport = transport
+        self._budget = budget
+        self._lock = threading.Lock()
+        self._queue = collections.deque()
+        self._scheduled = False
+
+    def set_budget(self, budget):
+        self._budget = budget
+
+    def dispatch(self, function, *args):
+        with self._lock:
+            self._queue.append((function, args))
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self._transport.dispatch(self._flush)
+
+    def idle(self):
+        with self._lock:
+            return not self._queue and not self._scheduled
+
+    def _flush(self):
+        # on the main thread
+        started = time.monotonic()
+        received = collections.OrderedDict()
+        while True:
+            with self._lock:
+                if not self._queue or (
+                        self._budget is not None and
+                        time.monotonic() - started >= self._budget):
+                    if self._queue:
+                        self._transport.dispatch(self._flush)
+                    else:
+                        self._scheduled = False
+                    break
+                function, args = self._queue.popleft()
+            if getattr(function, 'batched', False):
+                received.setdefault(function.receiver, []).append(
+                    (function.context,) + args)
+                continue
+            # results batched so far come before this call
+            self._receive(received)
+            self._call(function, *args)
+        self._receive(received)
+
+    def _receive(self, received):
+        for receiver, results in received.items():
+            self._call(receiver._receive, results)
+        received.clear()
+
+    def _call(self, function, *args):
+        # one failing callback must not prevent the others
+        try:
+            function(*args)
+        except Exception:
+            logger.exception(f'Error calling {function}')
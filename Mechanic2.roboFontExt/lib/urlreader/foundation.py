@@ -0,0 +1,260 @@
+import objc
+import threading
+
+from Foundation import NSObject, NSRunLoop, NSDate
+from Foundation import NSFileManager, NSCachesDirectory, NSUserDomainMask
+from Foundation import NSURL, NSURLSession, NSURLSessionConfiguration
+from Foundation import NSMutableURLRequest, NSMutableData, NSData
+from Foundation import NSURLRequestUseProtocolCachePolicy
+from Foundation import NSURLRequestReloadIgnoringLocalCacheData
+from Foundation import NSHTTPURLResponse
+
+from PyObjCTools.AppHelper import callAfter
+
+from urlreader.base import Transport
+
+
+USER_CACHE_DIRECTORY_URL, _ = NSFileManager.defaultManager().\
+    URLForDirectory_inDomain_appropriateForURL_create_error_(
+        NSCachesDirectory, NSUserDomainMask, None, True, None
+    )
+CACHE_DIRECTORY_URL = USER_CACHE_DIRECTORY_URL.\
+    URLByAppendingPathComponent_isDirectory_('URLReader', True)
+
+
+class _SessionDelegate(NSObject):
+
+    """NSURLSession delegate collecting the responses of data tasks
+
+    The body is collected in memory, or streamed to a file for
+    downloads, with the progress reported as it comes in. As the file
+    is written by the delegate, whatever was received is still there
+    when a download is interrupted. The task metrics give the time to
+    first byte and the number of redirects, the redirect responses are
+    collected as they are followed.
+    """
+
+    def init(self):
+        self = objc.super(_SessionDelegate, self).init()
+        self._tasks = {}
+        self._lock = threading.Lock()
+        return self
+
+    @objc.python_method
+    def addTask(self, task, completion, path=None, progress=None,
+                trace=None):
+        entry = dict(completion=completion, path=path, progress=progress,
+                     trace=trace, data=None, file=None, received=0,
+                     error=None)
+        if path is None:
+            entry['data'] = NSMutableData.data()
+        else:
+            entry['file'] = open(path, 'wb')
+        if trace is not None:
+            trace.redirect_responses = []
+        with self._lock:
+            self._tasks[task.taskIdentifier()] = entry
+
+    @objc.python_method
+    def entryForTask(self, task):
+        with self._lock:
+            return self._tasks.get(task.taskIdentifier())
+
+    def URLSession_dataTask_didReceiveData_(self, session, task, data):
+        entry = self.entryForTask(task)
+        if entry is None:
+            return
+        if entry['file'] is None:
+            entry['data'].appendData_(data)
+            return
+        if entry['error'] is not None:
+            return
+        try:
+            entry['file'].write(bytes(data))
+        except OSError as e:
+            entry['error'] = e
+            task.cancel()
+            return
+        if not entry['received'] and entry['trace'] is not None:
+            entry['trace'].status_code = task.response().statusCode()
+        entry['received'] += data.length()
+        if entry['progress'] is not None:
+            # -1, NSURLSessionTransferSizeUnknown, when there is no length
+            entry['progress'](entry['received'],
+                              task.countOfBytesExpectedToReceive())
+
+    def URLSession_task_willPerformHTTPRedirection_newRequest_completionHandler_(
+            self, session, task, response, request, completionHandler):
+        entry = self.entryForTask(task)
+        if entry is not None and entry['trace'] is not None:
+            entry['trace'].redirect_responses.append(
+                (response.statusCode(), dict(response.allHeaderFields())))
+        # follow it
+        completionHandler(request)
+
+    def URLSession_task_didFinishCollectingMetrics_(
+            self, session, task, metrics):
+        entry = self.entryForTask(task)
+        if entry is None or entry['trace'] is None:
+            return
+        transactions = metrics.transactionMetrics()
+        if not transactions:
+            return
+        trace = entry['trace']
+        # one transaction per request, the last one is the final response
+        trace.redirects = len(transactions) - 1
+        responseStart = transactions[-1].responseStartDate()
+        if responseStart is not None:
+            trace.first_byte = responseStart.timeIntervalSinceDate_(
+                metrics.taskInterval().startDate())
+
+    def URLSession_task_didCompleteWithError_(self, session, task, error):
+        with self._lock:
+            entry = self._tasks.pop(task.taskIdentifier(), None)
+        if entry is None:
+            return
+        if entry['file'] is not None:
+            entry['file'].close()
+        if entry['error'] is not None:
+            error = entry['error']
+        response_url = None
+        status_code = None
+        response_headers = {}
+        response = task.response()
+        if response is not None:
+            response_url = response.URL()
+            if isinstance(response, NSHTTPURLResponse):
+                status_code = response.statusCode()
+                response_headers = dict(response.allHeaderFields())
+        if entry['path'] is not None:
+            result = entry['path']
+        elif error is None:
+            result = entry['data']
+        else:
+            result = None
+        entry['completion'](result, response_url, status_code,
+                            response_headers, error)
+
+
+class FoundationTransport(Transport):
+
+    """A light wrapper around NSURLSession & related APIs"""
+
+    def __init__(self):
+        self._session = None
+        self._delegate = None
+        # requests are started from the completion threads too
+        self._session_lock = threading.Lock()
+        self._timeout = None
+        self._headers = None
+        self._config = NSURLSessionConfiguration.defaultSessionConfiguration()
+        # this is only available in macOS 10.13+
+        if 'waitsForConnectivity' in dir(self._config):
+            self._config.setWaitsForConnectivity_(True)
+        self._bypassCache = False
+        self._requestCachePolicy = NSURLRequestUseProtocolCachePolicy
+
+    def _reset_session(self):
+        # the configuration changed, the next request makes a new
+        # session from it rather than one per setter
+        with self._session_lock:
+            if self._session is not None:
+                # a session retains its delegate until it is invalidated,
+                # the tasks still running complete with their own delegate
+                self._session.finishTasksAndInvalidate()
+                self._session = None
+                self._delegate = None
+
+    def _get_session(self):
+        # the session and its delegate, made on first use
+        with self._session_lock:
+            if self._session is None:
+                self._make_session()
+            return self._session, self._delegate
+
+    def _make_session(self):
+        if self._timeout is not None:
+            self._config.setTimeoutIntervalForResource_(self._timeout)
+        if self._bypassCache:
+            self._config.setURLCache_(None)
+            self._config.setRequestCachePolicy_(self._requestCachePolicy)
+        if self._headers is not None:
+            self._config.setHTTPAdditionalHeaders_(self._headers)
+        # task identifiers are only unique within a session
+        self._delegate = _SessionDelegate.alloc().init()
+        self._session = NSURLSession.\
+            sessionWithConfiguration_delegate_delegateQueue_(
+                self._config, self._delegate, None)
+
+    def set_timeout(self, timeout):
+        self._timeout = timeout
+        self._reset_session()
+
+    def set_headers(self, headers):
+        self._headers = headers
+        self._reset_session()
+
+    def set_max_connections_per_host(self, max_connections):
+        self._config.setHTTPMaximumConnectionsPerHost_(max_connections)
+        self._reset_session()
+
+    def set_bypass_cache(self, bypass):
+        self._bypassCache = bypass
+        if bypass:
+            self._requestCachePolicy = \
+                NSURLRequestReloadIgnoringLocalCacheData
+        else:
+            self._requestCachePolicy = NSURLRequestUseProtocolCachePolicy
+        self._reset_session()
+
+    def url(self, url):
+        return NSURL.URLWithString_(url)
+
+    def request(self, url, headers, completion, trace=None, body=None):
+        request = NSMutableURLRequest.\
+            requestWithURL_cachePolicy_timeoutInterval_(
+                self.url(url), self._requestCachePolicy, self._timeout
+            )
+        if headers:
+            for field, value in headers.items():
+                request.setValue_forHTTPHeaderField_(value, field)
+        if body is not None:
+            request.setHTTPMethod_('POST')
+            request.setHTTPBody_(
+                NSData.dataWithBytes_length_(body, len(body)))
+        # a delegate task rather than a completion handler, the task
+        # metrics are only reported to the delegate
+        session, delegate = self._get_session()
+        task = session.dataTaskWithRequest_(request)
+        delegate.addTask(task, completion, trace=trace)
+        task.resume()
+        return task
+
+    def download(self, url, headers, path, progress, completion,
+                 trace=None):
+        # downloads never go through the URL cache
+        request = NSMutableURLRequest.\
+            requestWithURL_cachePolicy_timeoutInterval_(
+                self.url(url), NSURLRequestReloadIgnoringLocalCacheData,
+                self._timeout
+            )
+        if headers:
+            for field, value in headers.items():
+                request.setValue_forHTTPHeaderField_(value, field)
+        session, delegate = self._get_session()
+        task = session.dataTaskWithRequest_(request)
+        delegate.addTask(task, completion, path, progress, trace)
+        task.resume()
+        return task
+
+    def cancel(self, task):
+        # completes with NSURLErrorCancelled
+        task.cancel()
+
+    def dispatch(self, function, *args):
+        # callAfter executes on the main thread
+        callAfter(function, *args)
+
+    def run_loop(self, timeout):
+        NSRunLoop.mainRunLoop().runUntilDate_(
+            NSDate.dateWithTimeIntervalSinceNow_(timeout))
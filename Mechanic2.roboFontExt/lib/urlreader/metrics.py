@@ -0,0 +1,379 @@
+import json
+import math
+import time
+import threading
+
+from urllib.parse import urlparse
+
+
+# outcomes of a request, as recorded in the metrics
+OUTCOME_HIT = 'hit'
+OUTCOME_MISS = 'miss'
+OUTCOME_REVALIDATED = 'revalidated'
+OUTCOME_STALE = 'stale'
+OUTCOME_ERROR = 'error'
+
+OUTCOMES = (OUTCOME_HIT, OUTCOME_MISS, OUTCOME_REVALIDATED, OUTCOME_STALE,
+            OUTCOME_ERROR)
+
+# timings kept for every request, in seconds
+TIMINGS = ('queue_wait', 'first_byte', 'network', 'total')
+
+# percentiles reported by Metrics.snapshot()
+PERCENTILES = (0.5, 0.9, 0.99)
+
+
+def error_class(error):
+    """Return a short, stable name for `error`"""
+    if error is None:
+        return None
+    if hasattr(error, 'domain') and hasattr(error, 'code'):
+        # a NSError
+        return f'{error.domain()} {error.code()}'
+    return type(error).__name__
+
+
+class RequestTrace(object):
+
+    """The timings and outcome of a single request
+
+    URLReader creates a trace for every request and fills it as the
+    request moves from the queue to the network and back, `retries`
+    counts the attempts after the first one. A transport can set
+    `first_byte`, the seconds between sending the request and receiving
+    the first byte of the response, `redirects`, the number of
+    redirects followed, and `status_code` as soon as it’s known. It
+    adds the (status_code, headers) of every redirect response to
+    `redirect_responses`.
+    """
+
+    def __init__(self, url, tag=None):
+        self.url = url
+        self.host = urlparse(url).hostname
+        self.tag = tag
+        self.queued = time.monotonic()
+        self.started = None
+        # set once handed to the transport, rather than failing fast
+        self.sent = False
+        self.first_byte = None
+        self.finished = None
+        self.bytes = 0
+        self.redirects = 0
+        self.redirect_responses = []
+        self.retries = 0
+        self.status_code = None
+        self.outcome = None
+        self.error = None
+
+    @property
+    def queue_wait(self):
+        if self.started is None:
+            return None
+        return self.started - self.queued
+
+    @property
+    def network(self):
+        # from sending the request to its completion, the retries
+        # included, only for a request that was sent
+        if self.finished is None or not self.sent:
+            return None
+        return self.finished - self.started
+
+    @property
+    def total(self):
+        if self.finished is None:
+            return None
+        return self.finished - self.queued
+
+
+class Histogram(object):
+
+    """A histogram of durations, with logarithmic buckets
+
+    Bucket bounds grow by a factor of √2 from 1 ms to about two minutes,
+    so percentiles are estimated within ~20% with a fixed amount of
+    memory, whatever the number of values.
+    """
+
+    FIRST_BOUND = 0.001
+    FACTOR = math.sqrt(2)
+    BUCKETS = 36
+
+    def __init__(self):
+        self.counts = [0] * (self.BUCKETS + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def bound(self, index):
+        return self.FIRST_BOUND * self.FACTOR ** index
+
+    def add(self, value):
+        if value <= self.FIRST_BOUND:
+            index = 0
+        else:
+            index = math.ceil(math.log(value / self.FIRST_BOUND,
+                                       self.FACTOR))
+            index = min(index, self.BUCKETS)
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, q):
+        """Return an estimate of the `q` quantile, 0 <= q <= 1"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if not count:
+                continue
+            if seen + count >= rank:
+                # interpolate within the bucket
+                lower = self.bound(index - 1) if index else 0.0
+                upper = self.bound(index)
+                value = lower + (upper - lower) * (rank - seen) / count
+                return min(max(value, self.min), self.max)
+            seen += count
+        return self.max
+
+    def as_dict(self):
+        result = dict(count=self.count)
+        if self.count:
+            result.update(
+                mean=self.sum / self.count,
+                min=self.min,
+                max=self.max,
+            )
+            for q in PERCENTILES:
+                result[f'p{round(q * 100)}'] = self.percentile(q)
+        return result
+
+
+class _Stats(object):
+
+    # the aggregated metrics of a host, a tag or the whole reader
+
+    def __init__(self):
+        self.requests = 0
+        self.outcomes = dict.fromkeys(OUTCOMES, 0)
+        self.coalesced = 0
+        self.hedged = 0
+        self.bytes = 0
+        self.redirects = 0
+        self.retries = 0
+        self.retried = 0
+        self.errors = {}
+        self.cancelled = 0
+        self.queued = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.timings = {name: Histogram() for name in TIMINGS}
+
+    def add(self, trace):
+        self.requests += 1
+        self.outcomes[trace.outcome] += 1
+        self.bytes += trace.bytes
+        self.redirects += trace.redirects
+        self.retries += trace.retries
+        if trace.retries:
+            self.retried += 1
+        failure = error_class(trace.error)
+        if failure is None and trace.status_code is not None \
+                and trace.status_code >= 400:
+            failure = f'HTTP {trace.status_code}'
+        if failure is not None:
+            self.errors[failure] = self.errors.get(failure, 0) + 1
+        for name in TIMINGS:
+            value = getattr(trace, name)
+            if value is not None:
+                self.timings[name].add(value)
+
+    @property
+    def hit_ratio(self):
+        hits = self.outcomes[OUTCOME_HIT] + \
+            self.outcomes[OUTCOME_REVALIDATED] + \
+            self.outcomes[OUTCOME_STALE]
+        answered = hits + self.outcomes[OUTCOME_MISS]
+        if not answered:
+            return None
+        return hits / answered
+
+    def as_dict(self):
+        return dict(
+            requests=self.requests,
+            outcomes=dict(self.outcomes),
+            hit_ratio=self.hit_ratio,
+            coalesced=self.coalesced,
+            hedged=self.hedged,
+            bytes=self.bytes,
+            redirects=self.redirects,
+            retries=self.retries,
+            retried=self.retried,
+            errors=dict(self.errors),
+            cancelled=self.cancelled,
+            queued=self.queued,
+            in_flight=self.in_flight,
+            max_in_flight=self.max_in_flight,
+            timings={name: histogram.as_dict()
+                     for name, histogram in self.timings.items()},
+        )
+
+
+class Metrics(object):
+
+    """Request metrics of a URLReader
+
+    Every request is aggregated three times: in the totals, per host
+    and per caller tag, the `tag` given to URLReader.fetch(). Timings
+    are kept in histograms, so percentiles can be queried at any time.
+    All methods can be called from any thread.
+    """
+
+    def __init__(self, name=None):
+        self.name = name
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._total = _Stats()
+            self._hosts = {}
+            self._tags = {}
+            self._started = time.time()
+
+    def _groups(self, host, tag):
+        groups = [self._total]
+        groups.append(self._hosts.setdefault(host, _Stats()))
+        if tag is not None:
+            groups.append(self._tags.setdefault(tag, _Stats()))
+        return groups
+
+    # recording, called by URLReader
+
+    def enqueue(self, trace):
+        with self._lock:
+            for stats in self._groups(trace.host, trace.tag):
+                stats.queued += 1
+
+    def start(self, trace):
+        with self._lock:
+            if trace.started is not None or trace.finished is not None:
+                # restarted, like after an evicted 304, or cancelled
+                return
+            trace.started = time.monotonic()
+            for stats in self._groups(trace.host, trace.tag):
+                stats.queued -= 1
+                stats.in_flight += 1
+                stats.max_in_flight = max(
+                    stats.max_in_flight, stats.in_flight)
+
+    def finish(self, trace, outcome):
+        trace.finished = time.monotonic()
+        in_flight = trace.started is not None
+        if not in_flight:
+            # served from the cache, without a request
+            trace.started = trace.finished
+        if trace.error is not None:
+            outcome = OUTCOME_ERROR
+        trace.outcome = outcome
+        with self._lock:
+            for stats in self._groups(trace.host, trace.tag):
+                if in_flight:
+                    stats.in_flight -= 1
+                stats.add(trace)
+
+    def cancel(self, trace):
+        # a request cancelled before its completion, it isn’t counted
+        # in the requests and their timings
+        with self._lock:
+            trace.finished = time.monotonic()
+            for stats in self._groups(trace.host, trace.tag):
+                if trace.started is None:
+                    stats.queued -= 1
+                else:
+                    stats.in_flight -= 1
+                stats.cancelled += 1
+
+    def coalesced(self, url, tag=None):
+        # a caller joined a request already in flight
+        host = urlparse(url).hostname
+        with self._lock:
+            for stats in self._groups(host, tag):
+                stats.coalesced += 1
+
+    def hedged(self, url, tag=None):
+        # a mirror was asked as well, as `url` was slow to answer
+        host = urlparse(url).hostname
+        with self._lock:
+            for stats in self._groups(host, tag):
+                stats.hedged += 1
+
+    # queries
+
+    def hosts(self):
+        with self._lock:
+            return sorted(self._hosts, key=str)
+
+    def tags(self):
+        with self._lock:
+            return sorted(self._tags, key=str)
+
+    def _stats(self, host=None, tag=None):
+        if host is not None:
+            return self._hosts.get(host)
+        if tag is not None:
+            return self._tags.get(tag)
+        return self._total
+
+    def stats(self, host=None, tag=None):
+        """Return the metrics of `host`, of `tag`, or the totals, as a dict"""
+        with self._lock:
+            stats = self._stats(host, tag)
+            if stats is None:
+                return None
+            return stats.as_dict()
+
+    def percentile(self, timing, q, host=None, tag=None):
+        """Return the `q` quantile of `timing`, in seconds
+
+        `timing` is one of 'queue_wait', 'first_byte', 'network', the
+        time requests took once sent, without the local copies, and
+        'total', the time between fetch() and the callback.
+        """
+        with self._lock:
+            stats = self._stats(host, tag)
+            if stats is None:
+                return None
+            return stats.timings[timing].percentile(q)
+
+    def hit_ratio(self, host=None, tag=None):
+        with self._lock:
+            stats = self._stats(host, tag)
+            if stats is None:
+                return None
+            return stats.hit_ratio
+
+    def snapshot(self):
+        with self._lock:
+            return dict(
+                name=self.name,
+                since=self._started,
+                total=self._total.as_dict(),
+                hosts={str(host): stats.as_dict()
+                       for host, stats in self._hosts.items()},
+                tags={str(tag): stats.as_dict()
+                      for tag, stats in self._tags.items()},
+            )
+
+    def to_json(self, indent=None):
+        return json.dumps(self.snapshot(), indent=indent)
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            f.write(self.to_json(indent=2))
@@ -0,0 +1,183 @@
+import os
+import json
+import time
+import atexit
+import socket
+import threading
+
+from urlreader.base import URLReaderError, logger
+
+
+# failure classes recorded in a NegativeCache
+FAILURE_NOT_FOUND = 'not found'
+FAILURE_TIMEOUT = 'timeout'
+FAILURE_PARSE = 'parse error'
+FAILURE_SERVER_ERROR = 'server error'
+FAILURE_RATE_LIMITED = 'rate limited'
+FAILURE_HTTP_ERROR = 'HTTP error'
+
+# how long a failure is remembered, in seconds, not at all without one
+FAILURE_TTLS = {
+    FAILURE_NOT_FOUND: 12 * 60 * 60,
+    FAILURE_TIMEOUT: 15 * 60,
+    FAILURE_PARSE: 12 * 60 * 60,
+    FAILURE_SERVER_ERROR: 5 * 60,
+    FAILURE_RATE_LIMITED: 15 * 60,
+}
+
+# NSURLErrorDomain code of a timed out request
+_TIMED_OUT_URL_ERROR_CODE = -1001
+
+
+def failure_class(status_code, error):
+    """Return the failure class of a response worth remembering, or None
+
+    Only failures likely to happen again right away are classified,
+    not being offline for instance.
+    """
+    if error is not None:
+        if hasattr(error, 'domain') and hasattr(error, 'code'):
+            # a NSError
+            if error.domain() == 'NSURLErrorDomain' and \
+                    error.code() == _TIMED_OUT_URL_ERROR_CODE:
+                return FAILURE_TIMEOUT
+            return None
+        if isinstance(error, (TimeoutError, socket.timeout)):
+            return FAILURE_TIMEOUT
+        return None
+    if status_code in (404, 410):
+        return FAILURE_NOT_FOUND
+    return None
+
+
+def status_failure_class(status_code):
+    """Return the failure class of an HTTP error response, or None
+
+    Unlike failure_class(), any response but a 2xx is classified, for
+    callers given an error page once the retries are exhausted. A server
+    error or a rate limited response is only remembered for a short
+    while, other HTTP errors not at all.
+    """
+    if status_code is None or 200 <= status_code < 300:
+        return None
+    if status_code in (404, 410):
+        return FAILURE_NOT_FOUND
+    if status_code in (403, 429):
+        return FAILURE_RATE_LIMITED
+    if status_code >= 500:
+        return FAILURE_SERVER_ERROR
+    return FAILURE_HTTP_ERROR
+
+
+class KnownFailureError(URLReaderError):
+
+    """The error of a fetch short-circuited by a NegativeCache
+
+    `failure` is the failure class recorded and `expires` the time, since
+    the epoch, until which it is remembered.
+    """
+
+    def __init__(self, url, failure, expires):
+        super().__init__(f'{url} failed recently ({failure})')
+        self.url = url
+        self.failure = failure
+        self.expires = expires
+
+
+class NegativeCache(object):
+
+    """Recent failures, to not request again what is known to fail
+
+    Every failure is remembered with its class, like FAILURE_NOT_FOUND,
+    for the time to live given by `ttls` for that class. URLReader records
+    the responses it can classify, callers can record their own, like a
+    body that can’t be parsed. A failure already recorded isn’t replaced
+    by a later one, as the first one is usually the more specific.
+
+    With a `path` the failures are kept in a JSON file, written by
+    save(), so they survive a restart.
+    """
+
+    def __init__(self, path=None, ttls=None):
+        self._path = path
+        self._ttls = dict(FAILURE_TTLS)
+        if ttls:
+            self._ttls.update(ttls)
+        self._lock = threading.Lock()
+        self._dirty = False
+        # url -> (failure, expires)
+        self._failures = {}
+        if self._path is not None:
+            self._load()
+            atexit.register(self.save)
+
+    def _load(self):
+        try:
+            with open(self._path) as f:
+                failures = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        self._failures = {url: tuple(entry)
+                          for url, entry in failures.items()
+                          if entry[1] > now}
+
+    def save(self):
+        if self._path is None:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            now = time.time()
+            failures = {url: entry for url, entry in self._failures.items()
+                        if entry[1] > now}
+            self._dirty = False
+        try:
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            with open(self._path, 'w') as f:
+                json.dump(failures, f)
+        except OSError:
+            logger.exception(f'Cannot write {self._path}')
+
+    def record(self, url, failure, ttl=None):
+        if ttl is None:
+            ttl = self._ttls.get(failure, 0)
+        if ttl <= 0:
+            return
+        now = time.time()
+        with self._lock:
+            entry = self._failures.get(url)
+            if entry is not None and entry[1] > now:
+                return
+            self._failures[url] = (failure, now + ttl)
+            self._dirty = True
+        logger.debug(f'{url} {failure}, not requested for {ttl:.0f}s')
+
+    def get(self, url):
+        """Return the (failure, expires) recorded for `url`, or None"""
+        with self._lock:
+            entry = self._failures.get(url)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._failures[url]
+                self._dirty = True
+                return None
+            return entry
+
+    def forget(self, url):
+        with self._lock:
+            if self._failures.pop(url, None) is not None:
+                self._dirty = True
+
+    def clear(self):
+        with self._lock:
+            self._failures = {}
+            self._dirty = True
+
+    def failures(self):
+        """Return the failures still remembered, as a {url: failure} dict"""
+        now = time.time()
+        with self._lock:
+            return {url: entry[0] for url, entry in self._failures.items()
+                    if entry[1] > now}
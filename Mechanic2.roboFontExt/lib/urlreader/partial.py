@@ -0,0 +1,128 @@
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import threading
+
+from urlreader.base import logger, header_value
+
+
+# partial downloads not resumed for that long are removed, in seconds
+PARTIAL_MAX_AGE = 7 * 24 * 60 * 60
+
+_CONTENT_RANGE_r = re.compile(r'bytes\s+(\d+)-(\d+)/(\d+|\*)')
+
+
+def range_validator(headers):
+    """Return the validator to send as If-Range, or None
+
+    Only strong ETags and Last-Modified dates can be used, a resumed
+    body must be byte for byte the continuation of the partial one.
+    """
+    etag = header_value(headers, 'ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return header_value(headers, 'Last-Modified')
+
+
+def content_range(headers):
+    """Return the (first, last, length) of a 206 response, or None
+
+    `length` is None when the server doesn’t know it.
+    """
+    value = header_value(headers, 'Content-Range')
+    if not value:
+        return None
+    match = _CONTENT_RANGE_r.match(value)
+    if match is None:
+        return None
+    first, last, length = match.groups()
+    if length == '*':
+        length = None
+    else:
+        length = int(length)
+    return int(first), int(last), length
+
+
+class PartialDownloads(object):
+
+    """Interrupted downloads, kept on disk to be resumed
+
+    The bytes received for a URL are kept in `directory` together with
+    the validator of the response they came from, so a later download
+    can ask only for the rest with a `Range` and `If-Range` request.
+    """
+
+    def __init__(self, directory, max_age=PARTIAL_MAX_AGE):
+        self._directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(self._directory, exist_ok=True)
+        self.prune(max_age)
+
+    def _paths(self, url):
+        name = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        path = os.path.join(self._directory, name)
+        return path, path + '.json'
+
+    def get(self, url):
+        """Return a (path, size, validator) tuple for `url`, or None"""
+        path, info_path = self._paths(url)
+        with self._lock:
+            try:
+                with open(info_path) as f:
+                    info = json.load(f)
+                size = os.path.getsize(path)
+            except (OSError, ValueError):
+                return None
+        if info.get('url') != url or not size:
+            return None
+        return path, size, info['validator']
+
+    def save(self, url, received, validator, append=False):
+        """Keep the bytes in the file at `received` for `url`
+
+        With `append` they continue the bytes already kept, from the same
+        response, otherwise they replace them and their `validator`.
+        """
+        path, info_path = self._paths(url)
+        with self._lock:
+            if append:
+                with open(path, 'ab') as f, open(received, 'rb') as r:
+                    shutil.copyfileobj(r, f)
+                os.utime(info_path)
+            else:
+                shutil.copyfile(received, path)
+                with open(info_path, 'w') as f:
+                    json.dump(dict(url=url, validator=validator), f)
+        logger.debug(f'{url} kept {os.path.getsize(path)} bytes to resume')
+
+    def complete(self, url, received, path):
+        """Write the kept bytes followed by the ones at `received` to `path`
+
+        The kept bytes are removed.
+        """
+        partial_path, info_path = self._paths(url)
+        with self._lock:
+            with open(partial_path, 'ab') as f, open(received, 'rb') as r:
+                shutil.copyfileobj(r, f)
+            os.replace(partial_path, path)
+            os.unlink(info_path)
+
+    def discard(self, url):
+        with self._lock:
+            for path in self._paths(url):
+                if os.path.exists(path):
+                    os.unlink(path)
+
+    def prune(self, max_age):
+        """Remove the partial downloads older than `max_age` seconds"""
+        limit = time.time() - max_age
+        with self._lock:
+            for entry in os.scandir(self._directory):
+                try:
+                    if entry.stat().st_mtime < limit:
+                        os.unlink(entry.path)
+                except OSError:
+                    pass
@@ -0,0 +1,147 @@
+import time
+import threading
+import email.utils
+
+from urllib.parse import urlparse
+
+from urlreader.base import logger, header_value
+from urlreader.base import PRIORITY_VISIBLE, PRIORITY_BACKGROUND
+
+
+def retry_after(headers):
+    """Return the seconds to wait given by a `Retry-After` header, or None
+
+    The header holds either a number of seconds or an HTTP date.
+    """
+    value = header_value(headers, 'Retry-After')
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0, date.timestamp() - time.time())
+
+
+def _int_header(headers, name):
+    value = header_value(headers, name)
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimit(object):
+
+    """Keep within the request budget announced by a server
+
+    Servers like the GitHub API send the size of the budget, what is
+    left of it and when it resets with every response, in the
+    `X-RateLimit-Limit`, `X-RateLimit-Remaining` and `X-RateLimit-Reset`
+    headers. Once `reserve` requests or less are left, background
+    requests wait for the reset, so the rest is kept for what the user
+    is waiting for. Once the budget is exhausted only interactive
+    requests still go out, and after a `Retry-After` nothing does
+    before the given time.
+
+    Only the `hosts` given are tracked, all of them when None. Requests
+    to a path ending with one of `resources` have a budget of their own,
+    like the GitHub GraphQL API has one apart from the REST API.
+    """
+
+    def __init__(self, reserve=10, hosts=None, resources=('/graphql',)):
+        self.reserve = reserve
+        self._hosts = None if hosts is None else set(hosts)
+        self._resources = tuple(resources or ())
+        self._lock = threading.Lock()
+        self._budgets = {}
+
+    def key(self, url):
+        """Return the budget a request to `url` counts against
+
+        The host, or the host and path for a separate resource, which is
+        what update(), budget() and the scheduling of requests use.
+        """
+        parsed = urlparse(url)
+        if parsed.path.endswith(self._resources):
+            return f'{parsed.hostname}{parsed.path}'
+        return parsed.hostname
+
+    def reset(self):
+        """Forget the budgets, like after the credentials changed"""
+        with self._lock:
+            self._budgets = {}
+
+    def set_hosts(self, hosts):
+        """Track only `hosts`, all of them when None"""
+        with self._lock:
+            self._hosts = None if hosts is None else set(hosts)
+            self._budgets = {}
+
+    def tracks(self, host):
+        # `host` may be the key of a separate resource
+        return self._hosts is None or \
+            str(host).partition('/')[0] in self._hosts
+
+    def update(self, host, status_code, headers):
+        """Update the budget of `host` from a response
+
+        Returns a (delay, priority) tuple when requests of `priority`
+        and lower should wait `delay` seconds, or None.
+        """
+        if not self.tracks(host):
+            return None
+        now = time.time()
+        remaining = _int_header(headers, 'X-RateLimit-Remaining')
+        reset = _int_header(headers, 'X-RateLimit-Reset')
+        wait = retry_after(headers)
+        with self._lock:
+            budget = self._budgets.setdefault(host, dict(
+                limit=None, remaining=None, reset=None, retry_after=None))
+            if remaining is not None:
+                budget.update(
+                    limit=_int_header(headers, 'X-RateLimit-Limit'),
+                    remaining=remaining, reset=reset)
+            if wait is not None and status_code in (403, 429, 503):
+                budget['retry_after'] = now + wait
+            budget = dict(budget)
+
+        if budget['retry_after'] is not None and \
+                budget['retry_after'] > now:
+            logger.debug(f'{host} asked to retry after {wait}s')
+            return budget['retry_after'] - now, 0
+        if budget['remaining'] is None or budget['reset'] is None or \
+                budget['reset'] <= now:
+            return None
+        if budget['remaining'] == 0 or status_code == 429:
+            logger.warning(f'{host} rate limit exhausted, '
+                           f'resets in {budget["reset"] - now:.0f}s')
+            return budget['reset'] - now, PRIORITY_VISIBLE
+        if budget['remaining'] <= self.reserve:
+            logger.debug(f'{host} {budget["remaining"]} requests left, '
+                         f'holding background requests')
+            return budget['reset'] - now, PRIORITY_BACKGROUND
+        return None
+
+    def budget(self, host):
+        """Return the known budget of `host` as a dict, or None
+
+        `limit` and `remaining` are numbers of requests, `reset` and
+        `retry_after` are times since the epoch, None when unknown.
+        """
+        with self._lock:
+            budget = self._budgets.get(host)
+            if budget is None:
+                return None
+            budget = dict(budget)
+        now = time.time()
+        if budget['reset'] is not None and budget['reset'] <= now:
+            # a new window started, with the whole budget
+            budget.update(remaining=budget['limit'], reset=None)
+        if budget['retry_after'] is not None and \
+                budget['retry_after'] <= now:
+            budget['retry_after'] = None
+        return budget
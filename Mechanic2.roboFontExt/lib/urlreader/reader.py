@@ -0,0 +1,1624 @@
+import os
+import re
+import queue
+import hashlib
+import asyncio
+import shutil
+import tempfile
+import time
+import threading
+import collections
+import http.client
+
+from concurrent.futures import Future, InvalidStateError, as_completed
+from urllib.parse import urlparse, urlunparse, quote
+
+from urlreader.base import URLReaderError, logger, header_value
+from urlreader.base import CACHE_HIT, CACHE_MISS, CACHE_KNOWN_FAILURE
+from urlreader.base import CACHE_STALE
+from urlreader.base import PRIORITY_INTERACTIVE
+from urlreader.batch import FetchBatch
+from urlreader.dispatch import BatchDispatcher, DELIVERY_BUDGET
+from urlreader.cache import ContentStore, DEFAULT_PARTITION
+from urlreader.metrics import Metrics, RequestTrace
+from urlreader.metrics import OUTCOME_HIT, OUTCOME_MISS, OUTCOME_REVALIDATED
+from urlreader.metrics import OUTCOME_STALE, OUTCOME_ERROR
+from urlreader.metrics import error_class
+from urlreader.partial import PartialDownloads, range_validator
+from urlreader.partial import content_range
+from urlreader.negative import KnownFailureError, failure_class
+from urlreader.breaker import HostUnavailableError, CLOSED
+from urlreader.scheduler import RequestScheduler
+
+try:
+    from urlreader.foundation import FoundationTransport as DefaultTransport
+    from urlreader.foundation import CACHE_DIRECTORY_URL
+except ImportError:
+    # no PyObjC, like on Linux build and benchmark machines
+    from urlreader.transport import PooledTransport as DefaultTransport
+    from urlreader.transport import CACHE_DIRECTORY as CACHE_DIRECTORY_URL
+
+
+quote_r = re.compile('%[A-Za-z0-9]{2}')
+
+
+# downloads share the in-flight table with fetches, under their own key
+_DOWNLOAD = 'download'
+
+# and so do POST requests, under the digest of their body
+_POST = 'post'
+
+# a caller waiting for an in-flight request
+_Waiter = collections.namedtuple('_Waiter', 'callback progress owner')
+
+# a hedged fetch asks the next mirror once the current one takes longer
+# than this quantile of the total time of its host
+HEDGE_PERCENTILE = 0.95
+
+# the delay before asking the next mirror, in seconds, while the host
+# has no timings yet
+HEDGE_DELAY = 1.0
+
+# mirrors are never asked sooner than that, in seconds
+MIN_HEDGE_DELAY = 0.05
+
+
+class URLReader(object):
+    """A wrapper around macOS’s NSURLSession, etc.
+
+    All URL reading operations execute in the background and return the
+    URL contents to an asynchronous callback on the main thread. Optionally,
+    URLReader can be configured to use a persistent on-disk cache, a
+    ContentStore at `cache_location` or a shared one given as `cache`.
+    Responses are stored in the `cache_partition` of the store unless
+    fetch() asks for another one.
+
+    With `revalidate` the reader keeps a local copy of every response
+    together with its validators (ETag, Last-Modified) and sends
+    conditional requests, so an unchanged resource costs a
+    `304 Not Modified` instead of the whole body.
+
+    The HTTP work itself is done by a `transport`, NSURLSession when
+    PyObjC is available and a pure Python PooledTransport otherwise.
+
+    Timings, bytes and cache outcomes of every request are recorded in
+    `metrics`, per host and per the `tag` given by the caller.
+
+    Failed requests are retried according to the RetryPolicy `retry`,
+    by default they aren’t.
+
+    With a RateLimit `rate_limit`, the request budget announced by the
+    servers is tracked and requests are held back before it runs out,
+    lowest priorities first.
+
+    With a RedirectMap `redirects`, the redirects followed are
+    remembered for as long as their responses allow, and requests go
+    straight to the target of a known redirect. When that fails, the
+    redirect is forgotten and the original URL requested again.
+
+    With a NegativeCache `negative_cache`, fetches that failed in a way
+    likely to last, like a 404, aren’t requested again for a while:
+    their callback gets a KnownFailureError right away instead.
+
+    With a CircuitBreaker `breaker`, requests to a host that keeps timing
+    out or failing get a HostUnavailableError right away, rather than
+    each waiting for the timeout.
+
+    Callbacks are queued and called on the main thread in batches, each
+    taking at most `delivery_budget` seconds, so events are handled in
+    between. A BatchReceiver gets all the results of a batch at once.
+
+    Requests can be given an `owner`, any object, and cancel(owner)
+    drops all the requests of that owner still waiting for a response,
+    like when the window that asked for them is closed.
+
+    A resource available from several mirrors can be fetched with
+    fetch_hedged(): a slow mirror is doubled by a request to the next
+    one, and the first to answer wins.
+
+    Queries that have to be sent with POST, like GraphQL ones, go
+    through post().
+    """
+
+    def __init__(self, timeout=10,
+                 quote_url_path=True, force_https=False,
+                 use_cache=False,
+                 cache_location=CACHE_DIRECTORY_URL,
+                 wait_until_done=False,
+                 headers=None,
+                 revalidate=False,
+                 max_connections_per_host=6,
+                 transport=None,
+                 cache=None,
+                 cache_partition=DEFAULT_PARTITION,
+                 metrics=None,
+                 retry=None,
+                 rate_limit=None,
+                 redirects=None,
+                 negative_cache=None,
+                 breaker=None,
+                 delivery_budget=DELIVERY_BUDGET):
+
+        if transport is None:
+            transport = DefaultTransport()
+        self._transport = transport
+        self._dispatcher = BatchDispatcher(transport, delivery_budget)
+
+        # in-flight requests, keyed by URL, with the callbacks waiting
+        # for them. The table is touched from the transport completion
+        # threads as well, so it’s always accessed holding the lock.
+        self._requests = {}
+        self._requests_lock = threading.Lock()
+        self._scheduler = RequestScheduler()
+
+        if metrics is None:
+            metrics = Metrics()
+        self._metrics = metrics
+
+        self.setTimeout(timeout)
+        self.setHeaders(headers)
+        self.setMaxConnectionsPerHost(max_connections_per_host)
+        self._quote_url_path = quote_url_path
+        self._force_https = force_https
+        self._cache_location = cache_location
+        self._use_cache = use_cache
+        self._wait_until_done = wait_until_done
+        self._revalidate = revalidate
+        self._cache_partition = cache_partition
+        self._retry_policy = retry
+        self._rate_limit = rate_limit
+        self._redirects = redirects
+        self._negative_cache = negative_cache
+        self._breaker = breaker
+        self._partials = None
+
+        self._cache = None
+        if self._use_cache or self._revalidate:
+            if cache is None:
+                cache = ContentStore(self._cache_location)
+            self._cache = cache
+            self._transport.set_bypass_cache(True)
+
+    def setTimeout(self, timeout):
+        self._transport.set_timeout(timeout)
+
+    def setHeaders(self, headers):
+        self._transport.set_headers(headers)
+
+    def setMaxConnectionsPerHost(self, max_connections):
+        self._scheduler.setMaxPerHost(max_connections)
+        self._transport.set_max_connections_per_host(max_connections)
+
+    def setRetryPolicy(self, retry):
+        self._retry_policy = retry
+
+    def setRateLimit(self, rate_limit):
+        self._rate_limit = rate_limit
+
+    def setDeliveryBudget(self, budget):
+        self._dispatcher.set_budget(budget)
+
+    def setForceHTTPS(self, force):
+        self._force_https = force
+
+    @property
+    def transport(self):
+        return self._transport
+
+    @property
+    def cache(self):
+        return self._cache
+
+    @property
+    def metrics(self):
+        return self._metrics
+
+    @property
+    def rate_limit(self):
+        return self._rate_limit
+
+    @property
+    def redirects(self):
+        return self._redirects
+
+    @property
+    def negative_cache(self):
+        return self._negative_cache
+
+    @property
+    def breaker(self):
+        return self._breaker
+
+    def record_failure(self, url, failure, ttl=None):
+        """Remember that `url` failed, with the failure class `failure`
+
+        Like when its body can’t be parsed, so it isn’t fetched again
+        before `ttl` seconds, by default the one of the failure class.
+        """
+        if url is None:
+            raise URLReaderError('URL must not be None')
+        if self._negative_cache is not None:
+            self._negative_cache.record(self.process_url(url), failure, ttl)
+
+    def budget(self, url):
+        """Return the known request budget for the host of `url`, or None
+
+        See RateLimit.budget().
+        """
+        if self._rate_limit is None:
+            return None
+        return self._rate_limit.budget(
+            self._rate_limit.key(self.process_url(url)))
+
+    @property
+    def done(self):
+        with self._requests_lock:
+            if self._requests:
+                return False
+        return self._dispatcher.idle() and self._transport.idle()
+
+    def quote_url_path(self, url):
+        u = urlparse(url)
+        if quote_r.search(u.path): # this path is already quoted
+            return url
+        return urlunparse(u._replace(path=quote(u.path)))
+
+    def http2https_url(self, url):
+        u = urlparse(url)
+        if u.scheme == 'http':
+            return urlunparse(u._replace(scheme='https'))
+        return url
+
+    def process_url(self, url):
+        # any URL object, like NSURL, is handled as a string
+        url = str(url)
+        if self._quote_url_path:
+            url = self.quote_url_path(url)
+        if self._force_https:
+            url = self.http2https_url(url)
+        return url
+
+    def set_cache(self, url, data, cache_partition=None):
+        if url is None:
+            raise URLReaderError('URL must not be None')
+        url = self.process_url(url)
+        if self._cache is not None:
+            self._cache.set(url, data,
+                            partition=cache_partition or self._cache_partition)
+
+    def get_cache(self, url):
+        if url is None:
+            raise URLReaderError('URL must not be None')
+        url = self.process_url(url)
+        if self._cache is not None:
+            cached = self._cache.get(url)
+            if cached is not None:
+                return cached[0]
+
+    def invalidate_cache_for_url(self, url):
+        if url is None:
+            raise URLReaderError('URL must not be None')
+        url = self.process_url(url)
+        if self._cache is not None:
+            self._cache.invalidate(url)
+        if self._negative_cache is not None:
+            self._negative_cache.forget(url)
+
+    def flush_cache(self):
+        if self._cache is not None:
+            self._cache.flush()
+
+    def continue_runloop(self):
+        self._transport.run_loop(0.01)
+
+    def fetch(self, url, callback=None, invalidate_cache=False,
+              with_status=False, priority=PRIORITY_INTERACTIVE,
+              cache_partition=None, tag=None, owner=None, max_age=None,
+              stale=0, with_status_code=False):
+        """Fetch `url` in the background
+
+        `callback` is called on the main thread with (url, data, error).
+        With `with_status_code` it gets the HTTP status code last, None
+        when there was no response, like for a local copy. A copy
+        revalidated by a 304 is given with a 200, like NSURLSession does,
+        so anything but a 2xx is an error page.
+        Without a callback, a concurrent.futures.Future is returned
+        instead, resolved with the same tuple as soon as the response is
+        there, from any thread. Waiting on it doesn’t need the main
+        thread run loop, and it can be awaited with asyncio.wrap_future(),
+        see fetch_async().
+
+        With `wait_until_done` the callback is called by fetch() itself,
+        on the calling thread, before it returns.
+
+        The callback of a request cancelled with cancel(`owner`) is never
+        called, a future is cancelled. Cancelling the future cancels the
+        request as well.
+
+        With a `max_age`, in seconds, a local copy younger than that is
+        given without any request. One older, but by less than `stale`
+        seconds, is given right away as well, with the CACHE_STALE status,
+        and refreshed in the background: the callback is then called a
+        second time, only if the content changed. A future only gets the
+        first result.
+        """
+        if url is None:
+            raise URLReaderError('URL must not be None')
+
+        url = self.process_url(url)
+
+        if invalidate_cache:
+            self.invalidate_cache_for_url(url)
+
+        partition = cache_partition or self._cache_partition
+        if callback is None or self._wait_until_done:
+            future = Future()
+            self._fetch(url, self._future_callback(future, with_status,
+                                                   with_status_code),
+                        priority, partition, tag, owner, max_age, stale)
+            if callback is None:
+                return future
+            if not future.cancelled():
+                callback(*future.result())
+            return
+
+        if not with_status and not _is_batched(callback):
+            # drop the cache status for plain (url, data, error) callbacks
+            callback = _without_status(callback, with_status_code)
+        elif with_status_code:
+            callback = _with_status_code(callback)
+
+        self._fetch(url, callback, priority, partition, tag, owner,
+                    max_age, stale)
+
+    async def fetch_async(self, url, timeout=None, **kwargs):
+        """Fetch `url` and return (url, data, error), for asyncio
+
+        Raises asyncio.TimeoutError after `timeout` seconds. Other
+        arguments are the ones of fetch().
+        """
+        future = self.fetch(url, None, **kwargs)
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+
+    def fetch_hedged(self, urls, callback=None, hedge_after=None,
+                     percentile=HEDGE_PERCENTILE, with_status=False,
+                     priority=PRIORITY_INTERACTIVE, cache_partition=None,
+                     tag=None, owner=None, with_status_code=False):
+        """Fetch one resource from the first of the mirrors `urls` to answer
+
+        The first URL is requested, and when it didn’t answer after
+        `hedge_after` seconds, by default the `percentile` of the total
+        time of its host, the next one is requested as well, and so on.
+        A mirror that fails hands over to the next one right away. The
+        first successful response is given to `callback`, like for
+        fetch(), and the other requests are cancelled. When all the
+        mirrors fail, the response of the first one is given.
+
+        The callback gets the URL that answered, which can be a mirror,
+        and the HTTP status code of its response with `with_status_code`.
+        Without a callback a Future is returned, like for fetch().
+        """
+        urls = [self.process_url(url) for url in urls]
+        if not urls or any(url is None for url in urls):
+            raise URLReaderError('URL must not be None')
+
+        future = None
+        if callback is None or self._wait_until_done:
+            future = Future()
+            result_callback = _FutureCallback(future, with_status,
+                                              with_status_code)
+        elif _is_batched(callback):
+            result_callback = callback
+        elif with_status:
+            result_callback = callback
+            if with_status_code:
+                result_callback = _with_status_code(callback)
+        else:
+            result_callback = _without_status(callback, with_status_code)
+
+        partition = cache_partition or self._cache_partition
+        self._fetch_hedged(urls, result_callback, priority, partition, tag,
+                           owner, hedge_after, percentile, future)
+        if future is None:
+            return
+        if callback is None:
+            return future
+        if not future.cancelled():
+            callback(*future.result())
+
+    def fetch_many(self, urls, per_item_callback=None, done_callback=None,
+                   with_status=False, priority=PRIORITY_INTERACTIVE,
+                   cache_partition=None, tag=None, owner=None, mirrors=None,
+                   with_status_code=False):
+        """Fetch all the `urls` as one batch
+
+        `per_item_callback` is called on the main thread as every fetch
+        completes, like the callback of fetch() but with the URL as it was
+        requested, so results can be matched with `urls`. Once all of them
+        completed, `done_callback` is called exactly once with the list of
+        (url, data, error) results, in the order of `urls`. With
+        `with_status_code` the HTTP status code comes last, like for
+        fetch().
+
+        `mirrors` maps URLs of `urls` to the list of their mirrors, those
+        are fetched like with fetch_hedged().
+
+        Returns a FetchBatch, to follow the progress of the batch. Once
+        its `owner` is cancelled, the batch never completes.
+        """
+        batch = FetchBatch(urls, per_item_callback, done_callback,
+                           with_status, with_status_code)
+        if any(url is None for url in batch.urls):
+            raise URLReaderError('URL must not be None')
+
+        partition = cache_partition or self._cache_partition
+        if self._wait_until_done:
+            # report every result on the calling thread, as it comes in
+            item_callbacks = {}
+            for index, url in enumerate(batch.urls):
+                item_mirrors = mirrors.get(url) if mirrors else None
+                url = self.process_url(url)
+                future = Future()
+                if item_mirrors:
+                    self._fetch_hedged(
+                        [url] + [self.process_url(mirror)
+                                 for mirror in item_mirrors],
+                        _FutureCallback(future, True, True), priority,
+                        partition, tag, owner, future=future)
+                else:
+                    self._fetch(url,
+                                self._future_callback(future, True, True),
+                                priority, partition, tag, owner)
+                item_callbacks[future] = batch.callback(
+                    index, self._transport.url(url))
+            for future in as_completed(item_callbacks):
+                if future.cancelled():
+                    continue
+                item_callbacks[future](*future.result())
+            batch.finish()
+            return batch
+
+        for index, url in enumerate(batch.urls):
+            item_mirrors = mirrors.get(url) if mirrors else None
+            url = self.process_url(url)
+            item_callback = batch.callback(index, self._transport.url(url))
+            if item_mirrors:
+                self._fetch_hedged(
+                    [url] + [self.process_url(mirror)
+                             for mirror in item_mirrors],
+                    item_callback, priority, partition, tag, owner)
+            else:
+                self._fetch(url, item_callback, priority, partition, tag,
+                            owner)
+        if not batch.total:
+            self._dispatcher.dispatch(batch.finish)
+        return batch
+
+    def post(self, url, body, callback=None, headers=None,
+             priority=PRIORITY_INTERACTIVE, tag=None, owner=None):
+        """Send `body` to `url` with a POST request in the background
+
+        Meant for queries that don’t change anything on the server, like
+        GraphQL ones: the request is scheduled, retried, rate limited and
+        cancelled like a fetch, and an identical request in flight is
+        joined rather than sent twice, but the response is never cached.
+        `headers` are sent along with the ones of the reader, like a
+        Content-Type. A str `body` is sent as UTF-8.
+
+        `callback` is called on the main thread with (url, data, error),
+        without a callback a Future is returned, like for fetch().
+        """
+        if url is None:
+            raise URLReaderError('URL must not be None')
+
+        url = self.process_url(url)
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+
+        if callback is None or self._wait_until_done:
+            future = Future()
+            self._post(url, body, headers,
+                       self._future_callback(future, False), priority, tag,
+                       owner)
+            if callback is None:
+                return future
+            if not future.cancelled():
+                callback(*future.result())
+            return
+
+        self._post(url, body, headers, _without_status(callback), priority,
+                   tag, owner)
+
+    def download(self, url, callback=None, progress_callback=None,
+                 priority=PRIORITY_INTERACTIVE, cache_partition=None,
+                 tag=None, owner=None, with_status_code=False):
+        """Download `url` straight to a temporary file
+
+        The body is streamed to disk in chunks, so memory use doesn’t
+        depend on the size of the download. Downloads bypass the cache,
+        unless a `cache_partition` is given to store them in.
+
+        An interrupted download is kept on disk and the next download of
+        the same URL resumes it, with a `Range` request, when the server
+        supports it.
+
+        `callback` is called on the main thread like for fetch(), but with
+        the path of the downloaded file instead of the data, and the
+        HTTP status code last with `with_status_code`. The file is
+        removed once the callbacks returned, move it to keep it, and it
+        must not be modified when it comes from the cache. The
+        optional `progress_callback` is called on the main thread with
+        (url, bytes_received, bytes_expected), `bytes_expected` is -1 when
+        the server doesn’t send a length.
+
+        Without a callback a Future is returned, like for fetch(). The
+        file it resolves with is then left to the caller to remove.
+        Cancelling a download with cancel(`owner`) keeps what was
+        received so far, for the next download to resume it.
+        """
+        if url is None:
+            raise URLReaderError('URL must not be None')
+
+        url = self.process_url(url)
+        if callback is None:
+            future = Future()
+            self._download(url, self._future_callback(future, False,
+                                                      with_status_code),
+                           progress_callback, priority, cache_partition,
+                           tag, owner)
+            return future
+
+        if self._wait_until_done:
+            # report the progress on the calling thread while waiting
+            progress = queue.Queue()
+            future = Future()
+            self._download(url, self._future_callback(future, False,
+                                                      with_status_code),
+                           _ImmediateCallback(progress.put), priority,
+                           cache_partition, tag, owner)
+            while True:
+                try:
+                    args = progress.get(timeout=0.1)
+                except queue.Empty:
+                    if future.done() and progress.empty():
+                        break
+                    continue
+                if progress_callback is not None:
+                    progress_callback(*args)
+            if future.cancelled():
+                return
+            result = future.result()
+            try:
+                callback(*result)
+            finally:
+                _remove_download(result[1])
+            return
+
+        if with_status_code:
+            callback = _with_status_code(callback)
+        self._download(url, callback, progress_callback, priority,
+                       cache_partition, tag, owner)
+
+    async def download_async(self, url, timeout=None, **kwargs):
+        """Download `url` and return (url, path, error), for asyncio
+
+        Like fetch_async(), the file is left to the caller to remove.
+        """
+        future = self.download(url, None, **kwargs)
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+
+    def cancel(self, owner):
+        """Cancel all the requests of `owner` still waiting for a response
+
+        Their callbacks are never called. A request nobody else is waiting
+        for is stopped and its connection slot given to the next queued
+        request right away. Returns the number of callbacks cancelled.
+        """
+        return self._cancel(lambda waiter: waiter.owner is owner)
+
+    def _cancel(self, match):
+        cancelled = []
+        stopped = []
+        with self._requests_lock:
+            for key, request in list(self._requests.items()):
+                waiters = [waiter for waiter in request.waiters
+                           if not match(waiter)]
+                if len(waiters) == len(request.waiters):
+                    continue
+                cancelled.extend(waiter for waiter in request.waiters
+                                 if match(waiter))
+                request.waiters = waiters
+                if not waiters:
+                    del self._requests[key]
+                    request.cancelled = True
+                    stopped.append(request)
+        for waiter in cancelled:
+            if isinstance(waiter.callback, _FutureCallback):
+                waiter.callback.cancel()
+        for request in stopped:
+            logger.debug(f'{request.url} cancelled')
+            self._stop(request)
+        if stopped:
+            self._save_cache_when_done()
+        return len(cancelled)
+
+    def _waiting(self, callback):
+        # if `callback` still waits for a request, it wasn’t cancelled
+        with self._requests_lock:
+            return any(waiter.callback is callback
+                       for request in self._requests.values()
+                       for waiter in request.waiters)
+
+    def _stop(self, request):
+        # the completion of a cancelled request is ignored, so its slot
+        # is released here rather than when the transport gives up
+        queue = self._queue(request.url)
+        self._metrics.cancel(request.trace)
+        if self._scheduler.cancel(queue, request.start):
+            # still queued, it never had a slot
+            return
+        if request.task is not None:
+            self._transport.cancel(request.task)
+        self._scheduler.release(queue)
+
+    def _future_callback(self, future, with_status, with_status_code=False):
+        # cancelling the future, like asyncio.wait_for() does on a
+        # timeout, cancels the request as well
+        callback = _FutureCallback(future, with_status, with_status_code)
+
+        def done(future):
+            if future.cancelled():
+                self._cancel(lambda waiter: waiter.callback is callback)
+
+        future.add_done_callback(done)
+        return callback
+
+    def _download(self, url, callback, progress_callback, priority,
+                  cache_partition, tag, owner=None):
+        key = (_DOWNLOAD, url)
+        trace = RequestTrace(url, tag)
+
+        if self._cache is None:
+            cache_partition = None
+        if cache_partition is not None and not self._revalidate:
+            cached = self._cache.get_path(url)
+            if cached is not None:
+                self._metrics.finish(trace, OUTCOME_HIT)
+                path = cached[0]
+                if _is_immediate(callback):
+                    # the cached file is shared, futures own theirs
+                    path = _copy_download(path)
+                self._deliver(callback, self._transport.url(url), path, None)
+                return
+
+        if self._fail_fast(url, trace, callback):
+            return
+
+        waiter = _Waiter(callback, progress_callback, owner)
+        with self._requests_lock:
+            request = self._requests.get(key)
+            if request is not None:
+                # join the download already in flight for this URL
+                logger.debug(f'{url} already being downloaded')
+                request.waiters.append(waiter)
+                joined = True
+            else:
+                request = _Request(key, url, trace, waiter)
+                request.start = \
+                    lambda: self._start_download(request, cache_partition)
+                self._requests[key] = request
+                joined = False
+        if joined:
+            self._metrics.coalesced(url, tag)
+            return
+        self._metrics.enqueue(trace)
+        self._scheduler.submit(self._queue(url), priority, request.start)
+
+    def _post(self, url, body, headers, callback, priority, tag, owner):
+        key = (_POST, url, hashlib.sha256(body).hexdigest(),
+               tuple(sorted((headers or {}).items())))
+        trace = RequestTrace(url, tag)
+
+        if self._fail_fast(url, trace, callback, CACHE_MISS):
+            return
+
+        waiter = _Waiter(callback, None, owner)
+        with self._requests_lock:
+            request = self._requests.get(key)
+            if request is not None:
+                # join the same request already in flight
+                logger.debug(f'{url} already being posted')
+                request.waiters.append(waiter)
+                joined = True
+            else:
+                request = _Request(key, url, trace, waiter)
+                request.body = body
+                request.headers = headers
+                request.start = lambda: self._start(request, None)
+                self._requests[key] = request
+                joined = False
+        if joined:
+            self._metrics.coalesced(url, tag)
+            return
+        self._metrics.enqueue(trace)
+        self._scheduler.submit(self._queue(url), priority, request.start)
+
+    # engine
+
+    def _fetch(self, url, callback, priority, cache_partition, tag=None,
+               owner=None, max_age=None, stale=0):
+        trace = RequestTrace(url, tag)
+        if max_age is not None and \
+                self._fetch_cached(url, trace, callback, priority,
+                                   cache_partition, owner, max_age, stale):
+            return
+
+        if self._cache is not None and not self._revalidate:
+            cached = self._cache.get(url)
+            if cached is not None and cached[0]:
+                self._metrics.finish(trace, OUTCOME_HIT)
+                self._deliver(
+                    callback, self._transport.url(url), cached[0], None,
+                    CACHE_HIT)
+                return
+
+        if self._negative_cache is not None:
+            known = self._negative_cache.get(url)
+            if known is not None:
+                trace.error = KnownFailureError(url, *known)
+                self._metrics.finish(trace, OUTCOME_ERROR)
+                self._deliver(
+                    callback, self._transport.url(url), None, trace.error,
+                    CACHE_KNOWN_FAILURE)
+                return
+
+        if self._fail_fast(url, trace, callback, CACHE_MISS):
+            return
+
+        waiter = _Waiter(callback, None, owner)
+        with self._requests_lock:
+            request = self._requests.get(url)
+            if request is not None:
+                # join the request already in flight for this URL
+                logger.debug(f'{url} already being fetched')
+                request.waiters.append(waiter)
+                joined = True
+            else:
+                request = _Request(url, url, trace, waiter)
+                request.start = lambda: self._start(request, cache_partition)
+                self._requests[url] = request
+                joined = False
+            sent = request.sent
+        if joined:
+            self._metrics.coalesced(url, tag)
+            if sent:
+                _notify_sent(callback)
+            return
+        self._metrics.enqueue(trace)
+        self._scheduler.submit(self._queue(url), priority, request.start)
+
+    def _fetch_cached(self, url, trace, callback, priority, cache_partition,
+                      owner, max_age, stale):
+        # give the local copy of `url` when it is recent enough, and
+        # refresh it in the background once it’s stale
+        if self._cache is None:
+            return False
+        age = self._cache.age(url)
+        if age is None or age > max_age + stale:
+            return False
+        cached = self._cache.get(url)
+        if cached is None or not cached[0]:
+            return False
+        data = cached[0]
+        if age <= max_age:
+            self._metrics.finish(trace, OUTCOME_HIT)
+            self._deliver(callback, self._transport.url(url), data, None,
+                          CACHE_HIT)
+            return True
+        logger.debug(f'{url} stale for {age - max_age:.0f}s, refreshing')
+        self._metrics.finish(trace, OUTCOME_STALE)
+        self._deliver(callback, self._transport.url(url), data, None,
+                      CACHE_STALE)
+        self._fetch(url, _RefreshCallback(self, callback, data), priority,
+                    cache_partition, trace.tag, owner)
+        return True
+
+    def _fetch_hedged(self, urls, callback, priority, cache_partition, tag,
+                      owner, hedge_after=None, percentile=HEDGE_PERCENTILE,
+                      future=None):
+        def start(url, attempt_callback):
+            self._fetch(url, attempt_callback, priority, cache_partition,
+                        tag, owner)
+
+        def delay(url):
+            if hedge_after is not None:
+                return hedge_after
+            # from the requests sent, not the queue wait or local copies
+            delay = self._metrics.percentile('network', percentile,
+                                             _host(url))
+            if delay is None:
+                return HEDGE_DELAY
+            return max(delay, MIN_HEDGE_DELAY)
+
+        hedge = _Hedge(self, urls, callback, start, delay, tag)
+        if future is not None:
+            # like for fetch(), cancelling the future cancels the requests
+            future.add_done_callback(
+                lambda future: future.cancelled() and hedge.cancel())
+        hedge.begin()
+
+    def _conditional_headers(self, url):
+        # only send validators when there is a local copy to fall back on
+        if self._cache is None:
+            return None
+        cached = self._cache.get_path(url)
+        if cached is None or not cached[1]:
+            return None
+        validators = cached[1]
+        headers = {}
+        if 'ETag' in validators:
+            headers['If-None-Match'] = validators['ETag']
+        if 'Last-Modified' in validators:
+            headers['If-Modified-Since'] = validators['Last-Modified']
+        return headers
+
+    def _start(self, request, cache_partition):
+        if request.cancelled:
+            # like a retry timer firing after cancel()
+            return
+        url, trace = request.url, request.trace
+        self._metrics.start(trace)
+        headers = None
+        if request.body is not None:
+            headers = request.headers
+        elif self._revalidate and not request.unconditional:
+            headers = self._conditional_headers(url)
+
+        def completion(data, response_url, status_code, response_headers,
+                       error):
+            self._complete(
+                request, cache_partition, data, response_url,
+                status_code, response_headers, error)
+
+        # a POST is never sent straight to a redirect target
+        target = url if request.body is not None else self._shortcut(request)
+        unavailable = self._unavailable(target)
+        if unavailable is not None:
+            completion(None, None, None, {}, unavailable)
+            return
+        trace.sent = True
+        request.task = self._transport.request(
+            target, headers, completion, trace, request.body)
+        if request.cancelled:
+            # cancelled while starting
+            self._transport.cancel(request.task)
+            return
+        self._sent(request)
+
+    def _sent(self, request):
+        # tell the callbacks asking for it that the request is out, like
+        # a hedge timing its mirror from then rather than from the queue
+        with self._requests_lock:
+            if request.sent:
+                # a retry
+                return
+            request.sent = True
+            callbacks = [waiter.callback for waiter in request.waiters]
+        for callback in callbacks:
+            _notify_sent(callback)
+
+    def _complete(self, request, cache_partition, data, response_url,
+                  status_code, headers, error):
+        if request.cancelled:
+            return
+        url, trace = request.url, request.trace
+        status = CACHE_MISS
+        outcome = OUTCOME_MISS
+        trace.status_code = status_code
+        trace.error = error
+        if data:
+            trace.bytes += len(data)
+        self._update_rate_limit(url, status_code, headers)
+
+        if self._shortcut_failed(request, status_code, error):
+            self._start(request, cache_partition)
+            return
+
+        if self._retry_later(request, status_code, error, headers,
+                             lambda: self._start(request, cache_partition)):
+            return
+        # once per request, whatever the number of attempts
+        self._record_host(request, status_code, error)
+        if request.body is None:
+            # what a POST gets says nothing about a GET of the same URL
+            self._remember_redirect(request, response_url, status_code,
+                                    error)
+            self._remember_failure(url, status_code, error)
+
+        # if there is no data we return the original URL
+        result_url = self._transport.url(url)
+
+        if error is None and status_code == 304 and request.body is None:
+            cached = None
+            if self._cache is not None:
+                cached = self._cache.get(url)
+            if cached is None:
+                if not request.unconditional:
+                    # the local copy was evicted while the request was
+                    # in flight, so fetch the whole body again, once
+                    logger.debug(f'{url} not modified, but not cached')
+                    request.unconditional = True
+                    self._start(request, cache_partition)
+                    return
+                # not modified without validators, nothing to give
+                logger.debug(f'{url} not modified, but never cached')
+                data = None
+            else:
+                logger.debug(f'{url} not modified')
+                self._cache.touch(url)
+                data = cached[0]
+                status = CACHE_HIT
+                outcome = OUTCOME_REVALIDATED
+                # given like the local copy it confirmed
+                status_code = 200
+
+        elif data and response_url is not None:
+
+            # save the URL returned after all the possible redirects
+            post_redirect_url = response_url
+
+            if self._cache is not None and request.body is None and \
+                    _is_success(status_code):
+                # only a successful response replaces the local copy,
+                # never an error page, even one with validators. Always
+                # cache with the original request URL so even
+                # if the response requires a redirect, like for raw
+                # files on Github, we can still fulfill it offline
+                self._cache.set(url, data, _validators(headers),
+                                cache_partition)
+
+                # but in that case, remove the cached data for the
+                # final URL so we don’t store two copies
+                if url != str(post_redirect_url):
+                    self._cache.invalidate(str(post_redirect_url))
+
+            # if we have a response we pass the final URL after
+            # the redirects, so a consumer can see it changed
+            result_url = post_redirect_url
+
+        # fan the single response out to every waiting caller, on the
+        # main thread. Dispatching while holding the lock makes sure
+        # `done` can’t be seen before the callbacks are queued.
+        with self._requests_lock:
+            if request.cancelled:
+                # cancelled meanwhile, cancel() released the slot
+                return
+            del self._requests[request.key]
+            callbacks = [waiter.callback for waiter in request.waiters]
+            for callback in callbacks:
+                if not _is_immediate(callback):
+                    self._dispatcher.dispatch(callback, *_arguments(
+                        callback, (result_url, data, error, status),
+                        status_code))
+        self._metrics.finish(trace, outcome)
+        for callback in callbacks:
+            if _is_immediate(callback):
+                # like a mirror answering with an HTTP error
+                callback(*_arguments(
+                    callback, (result_url, data, error, status),
+                    status_code))
+        self._scheduler.release(self._queue(url))
+        self._save_cache_when_done()
+
+    def _fail_fast(self, url, trace, callback, *status):
+        # answer right away for a host known to be unavailable
+        if self._breaker is None:
+            return False
+        trace.error = self._breaker.unavailable(_host(url))
+        if trace.error is None:
+            return False
+        self._metrics.finish(trace, OUTCOME_ERROR)
+        self._deliver(callback, self._transport.url(url), None, trace.error,
+                      *status)
+        return True
+
+    def _unavailable(self, url):
+        # the error of a request that must not be sent, or None
+        if self._breaker is None:
+            return None
+        host = _host(url)
+        if self._breaker.allow(host):
+            return None
+        return self._breaker.unavailable(host) or \
+            HostUnavailableError(host, time.time())
+
+    def _record_host(self, request, status_code, error):
+        # the outcome of a request after its retries, so one flaky URL
+        # doesn’t open the circuit of its whole host
+        if self._breaker is None or \
+                isinstance(error, HostUnavailableError):
+            return
+        self._breaker.record(_request_host(request), status_code, error)
+
+    def _probing(self, request):
+        # if the request is the probe of a host failing fast
+        if self._breaker is None:
+            return False
+        return self._breaker.state(_request_host(request)) != CLOSED
+
+    def _shortcut(self, request):
+        # the URL to request, straight to a known redirect target
+        request.shortcut = None
+        if self._redirects is not None:
+            request.shortcut = self._redirects.get(request.url)
+        if request.shortcut is not None:
+            logger.debug(f'{request.url} going to {request.shortcut}')
+            return request.shortcut
+        return request.url
+
+    def _shortcut_failed(self, request, status_code, error):
+        # a redirect target that fails is forgotten, and the original
+        # URL requested again, as the redirect may have changed
+        if request.shortcut is None:
+            return False
+        if error is None and status_code is not None and status_code < 400:
+            return False
+        logger.debug(f'{request.url} redirect to {request.shortcut} '
+                     f'failed with {error_class(error) or status_code}')
+        self._redirects.forget(request.url)
+        return True
+
+    def _remember_redirect(self, request, response_url, status_code,
+                           error):
+        if self._redirects is None or request.shortcut is not None:
+            return
+        if error is not None or response_url is None or \
+                status_code is None or status_code >= 400:
+            return
+        self._redirects.remember(request.url, str(response_url),
+                                 request.trace.redirect_responses)
+
+    def _remember_failure(self, url, status_code, error):
+        if self._negative_cache is None:
+            return
+        failure = failure_class(status_code, error)
+        if failure is not None:
+            self._negative_cache.record(url, failure)
+        elif error is None and status_code is not None and \
+                status_code < 400:
+            self._negative_cache.forget(url)
+
+    def _update_rate_limit(self, url, status_code, headers):
+        # hold the requests waiting for a host running out of budget
+        if self._rate_limit is None:
+            return
+        queue = self._queue(url)
+        pause = self._rate_limit.update(queue, status_code, headers)
+        if pause is not None:
+            delay, priority = pause
+            self._scheduler.pause(queue, delay, priority)
+
+    def _queue(self, url):
+        # the scheduler queue of `url`: its host, or its own for a
+        # resource with a rate limit of its own, so pausing it for its
+        # budget doesn’t hold the rest of the host
+        if self._rate_limit is None:
+            return _host(url)
+        return self._rate_limit.key(url)
+
+    def _retry_later(self, request, status_code, error, headers, start):
+        # retry a transient failure after a while, the request keeps its
+        # slot meanwhile so a failing host isn’t hit any harder. A probe
+        # isn’t retried, its outcome decides for the host right away.
+        trace = request.trace
+        if self._retry_policy is None or self._probing(request):
+            return False
+        delay = self._retry_policy.next_delay(
+            trace, status_code, error, headers)
+        if delay is None:
+            return False
+        trace.retries += 1
+        logger.debug(f'{trace.url} failed with '
+                     f'{error_class(error) or status_code}, '
+                     f'retry {trace.retries} in {delay:.2f}s')
+        timer = threading.Timer(delay, start)
+        timer.daemon = True
+        timer.start()
+        return True
+
+    def _deliver(self, callback, *args, status_code=None):
+        args = _arguments(callback, args, status_code)
+        if _is_immediate(callback):
+            callback(*args)
+        else:
+            self._dispatcher.dispatch(callback, *args)
+
+    def _save_cache_when_done(self):
+        # write the cache index, and the failures, once the reader has
+        # nothing in flight
+        if self._cache is None and self._negative_cache is None:
+            return
+        with self._requests_lock:
+            if self._requests:
+                return
+        if self._cache is not None:
+            self._cache.save()
+        if self._negative_cache is not None:
+            self._negative_cache.save()
+
+    def _partial_downloads(self):
+        # kept next to the cache, so they survive a restart
+        if self._partials is None:
+            if self._cache is not None:
+                location = os.path.join(self._cache.location, 'partial')
+            else:
+                location = os.path.join(
+                    tempfile.gettempdir(), 'URLReader-partial')
+            self._partials = PartialDownloads(location)
+        return self._partials
+
+    def _start_download(self, request, cache_partition):
+        if request.cancelled:
+            return
+        url, trace = request.url, request.trace
+        self._metrics.start(trace)
+        fd, path = tempfile.mkstemp(prefix='URLReader-')
+        os.close(fd)
+        headers = None
+        offset = 0
+        partial = self._partial_downloads().get(url)
+        if partial is not None:
+            # only ask for the rest, if the resource didn’t change
+            _, offset, validator = partial
+            logger.debug(f'{url} resuming from byte {offset}')
+            headers = {'Range': f'bytes={offset}-', 'If-Range': validator}
+        elif self._revalidate and cache_partition is not None and \
+                not request.unconditional:
+            headers = self._conditional_headers(url)
+
+        def progress(bytes_received, bytes_expected):
+            if offset and trace.status_code == 206:
+                # count the bytes kept from before
+                bytes_received += offset
+                if bytes_expected >= 0:
+                    bytes_expected += offset
+            with self._requests_lock:
+                waiters = list(request.waiters)
+            for waiter in waiters:
+                if waiter.progress is not None:
+                    self._deliver(
+                        waiter.progress, self._transport.url(url),
+                        bytes_received, bytes_expected)
+
+        def completion(path, response_url, status_code, response_headers,
+                       error):
+            self._complete_download(
+                request, cache_partition, offset, path, response_url,
+                status_code, response_headers, error)
+
+        target = self._shortcut(request)
+        unavailable = self._unavailable(target)
+        if unavailable is not None:
+            completion(path, None, None, {}, unavailable)
+            return
+        trace.sent = True
+        request.task = self._transport.download(
+            target, headers, path, progress, completion, trace)
+        if request.cancelled:
+            self._transport.cancel(request.task)
+
+    def _resume_download(self, url, offset, path, status_code, headers,
+                         error):
+        # keep what was received of an interrupted download, or complete
+        # a resumed one. Returns the error, or False to start over.
+        partials = self._partial_downloads()
+        received = 0
+        if path is not None and os.path.exists(path):
+            received = os.path.getsize(path)
+
+        if status_code == 206 and offset:
+            first_last_length = content_range(headers)
+            if first_last_length is None or \
+                    first_last_length[0] != offset:
+                logger.debug(f'{url} unexpected range, starting over')
+                partials.discard(url)
+                return False
+            length = first_last_length[2]
+            if error is None and length is not None and \
+                    offset + received != length:
+                error = http.client.IncompleteRead(b'', length - offset)
+            if error is None:
+                partials.complete(url, path, path)
+            elif received:
+                partials.save(url, path, None, append=True)
+        elif status_code == 416:
+            # the kept bytes don’t match the resource anymore
+            partials.discard(url)
+            return False
+        elif status_code == 200:
+            validator = range_validator(headers)
+            if error is not None and received and validator is not None:
+                partials.save(url, path, validator)
+            else:
+                partials.discard(url)
+        return error
+
+    def _complete_download(self, request, cache_partition, offset, path,
+                           response_url, status_code, headers, error):
+        url, trace = request.url, request.trace
+        outcome = OUTCOME_MISS
+        if path is not None and os.path.exists(path):
+            trace.bytes += os.path.getsize(path)
+
+        self._update_rate_limit(url, status_code, headers)
+        error = self._resume_download(
+            url, offset, path, status_code, headers, error)
+        if request.cancelled:
+            # what was received is kept to be resumed, but nobody waits
+            _remove_download(path)
+            return
+        if error is False:
+            _remove_download(path)
+            self._start_download(request, cache_partition)
+            return
+        if self._shortcut_failed(request, status_code, error):
+            _remove_download(path)
+            self._start_download(request, cache_partition)
+            return
+        if status_code == 206 and error is None:
+            # the resumed download is complete
+            status_code = 200
+
+        trace.status_code = status_code
+        trace.error = error
+        result_url = self._transport.url(url)
+        if response_url is not None:
+            result_url = response_url
+
+        if self._retry_later(
+                request, status_code, error, headers,
+                lambda: self._start_download(request, cache_partition)):
+            _remove_download(path)
+            return
+        self._record_host(request, status_code, error)
+        self._remember_redirect(request, response_url, status_code, error)
+
+        if error is not None:
+            _remove_download(path)
+            path = None
+        elif cache_partition is not None and status_code == 304:
+            cached = self._cache.get_path(url)
+            if cached is None:
+                _remove_download(path)
+                if not request.unconditional:
+                    logger.debug(f'{url} not modified, but not cached')
+                    request.unconditional = True
+                    self._start_download(request, cache_partition)
+                    return
+                logger.debug(f'{url} not modified, but never cached')
+                path = None
+            else:
+                self._cache.touch(url)
+                # hand out a copy, as the download file is removed
+                shutil.copyfile(cached[0], path)
+                result_url = self._transport.url(url)
+                outcome = OUTCOME_REVALIDATED
+                status_code = 200
+        elif cache_partition is not None and status_code is not None \
+                and _is_success(status_code):
+            self._cache.set_path(
+                url, path, _validators(headers), cache_partition)
+
+        with self._requests_lock:
+            if request.cancelled:
+                _remove_download(path)
+                return
+            del self._requests[request.key]
+            callbacks = [waiter.callback for waiter in request.waiters]
+            dispatched = [callback for callback in callbacks
+                          if not _is_immediate(callback)]
+            for callback in dispatched:
+                self._dispatcher.dispatch(callback, *_arguments(
+                    callback, (result_url, path, error), status_code))
+            if dispatched:
+                # the main thread runs dispatched work in order, so the
+                # file is only removed after every callback returned
+                self._dispatcher.dispatch(_remove_download, path)
+        self._metrics.finish(trace, outcome)
+        immediate = [callback for callback in callbacks
+                     if _is_immediate(callback)]
+        for index, callback in enumerate(immediate):
+            # futures own their file, hand out copies when it’s shared
+            owned_path = path
+            if path is not None and (dispatched or index):
+                owned_path = _copy_download(path)
+            callback(*_arguments(
+                callback, (result_url, owned_path, error), status_code))
+        self._scheduler.release(self._queue(url))
+        self._save_cache_when_done()
+
+
+class _Request(object):
+
+    # an entry of the in-flight table: the callers waiting for `url`
+    # and the transport task serving them
+
+    def __init__(self, key, url, trace, waiter):
+        self.key = key
+        self.url = url
+        self.trace = trace
+        self.waiters = [waiter]
+        self.start = None
+        # the body and headers of a POST
+        self.body = None
+        self.headers = None
+        self.shortcut = None
+        self.task = None
+        # handed to the transport, the retries aside
+        self.sent = False
+        self.cancelled = False
+        # set once refetched without validators, after a 304 that
+        # had no local copy to go with it
+        self.unconditional = False
+
+
+class _Hedge(object):
+
+    # a fetch_hedged() in progress: the attempts started so far, one per
+    # mirror, and the one that won
+
+    def __init__(self, reader, urls, callback, start, delay, tag):
+        self._reader = reader
+        self._urls = urls
+        self._callback = callback
+        self._start = start
+        self._delay = delay
+        self._tag = tag
+        self._lock = threading.Lock()
+        self._attempts = []
+        self._results = {}
+        self._finished = False
+
+    def begin(self):
+        self._launch()
+
+    def cancel(self):
+        with self._lock:
+            self._finished = True
+            attempts = list(self._attempts)
+        self._reader._cancel(lambda waiter: waiter.callback in attempts)
+
+    def _launch(self):
+        with self._lock:
+            index = len(self._attempts)
+            if self._finished or index >= len(self._urls):
+                return
+            url = self._urls[index]
+            attempt = _HedgeAttempt(self, url)
+            self._attempts.append(attempt)
+        self._start(url, attempt)
+
+    def _attempt_sent(self, attempt):
+        # the request of `attempt` is out, the next mirror is asked if
+        # it doesn’t answer in time. Waiting in the queue doesn’t count.
+        with self._lock:
+            if self._finished or attempt in self._results or \
+                    self._attempts[-1] is not attempt or \
+                    len(self._attempts) >= len(self._urls):
+                return
+        timer = threading.Timer(
+            self._delay(attempt.url), self._hedge, (attempt, attempt.url))
+        timer.daemon = True
+        timer.start()
+
+    def _hedge(self, attempt, url):
+        # `attempt` is slow, ask the next mirror as well
+        with self._lock:
+            if self._finished or attempt in self._results or \
+                    self._attempts[-1] is not attempt:
+                return
+        if not self._reader._waiting(attempt):
+            # cancelled by its owner
+            return
+        logger.debug(f'{url} is slow, asking the next mirror')
+        self._reader.metrics.hedged(url, self._tag)
+        self._launch()
+
+    def _attempt_done(self, attempt, url, data, error, status,
+                      status_code):
+        failed = error is not None or \
+            (status_code is not None and status_code >= 400)
+        losers = None
+        with self._lock:
+            if self._finished:
+                # lost the race
+                return
+            self._results[attempt] = (url, data, error, status, status_code)
+            exhausted = len(self._results) == len(self._urls)
+            if not failed or exhausted:
+                self._finished = True
+                losers = [other for other in self._attempts
+                          if other not in self._results]
+                if failed:
+                    # every mirror failed, the first one tells best why
+                    url, data, error, status, status_code = \
+                        self._results[self._attempts[0]]
+        if losers is not None:
+            if losers:
+                self._reader._cancel(
+                    lambda waiter: waiter.callback in losers)
+            self._reader._deliver(self._callback, url, data, error, status,
+                                  status_code=status_code)
+        elif self._attempts[-1] is attempt:
+            # the latest mirror failed, don’t wait to ask the next one
+            self._launch()
+
+
+class _HedgeAttempt(object):
+
+    # the callback of the request of one mirror of a _Hedge, called with
+    # the HTTP status code as well
+
+    immediate = True
+    with_status_code = True
+
+    def __init__(self, hedge, url):
+        self._hedge = hedge
+        self.url = url
+
+    def sent(self):
+        self._hedge._attempt_sent(self)
+
+    def __call__(self, url, data, error, status=None, status_code=None):
+        self._hedge._attempt_done(self, url, data, error, status,
+                                  status_code)
+
+
+class _RefreshCallback(object):
+
+    # the callback of the background refresh of a stale copy, calls the
+    # original callback again only when the content changed
+
+    immediate = True
+    with_status_code = True
+
+    def __init__(self, reader, callback, data):
+        self._reader = reader
+        self._callback = callback
+        self._data = data
+
+    def __call__(self, url, data, error, status=None, status_code=None):
+        if error is not None or not _is_success(status_code):
+            # the stale copy is kept, as only a 2xx response is cached,
+            # and the caller already has it
+            logger.debug(f'{url} refresh failed with '
+                         f'{error_class(error) or status_code}')
+            return
+        if not data or data == self._data:
+            return
+        self._reader._deliver(self._callback, url, data, None, CACHE_MISS,
+                              status_code=status_code)
+
+
+def _remove_download(path):
+    if path is not None and os.path.exists(path):
+        os.unlink(path)
+
+
+def _copy_download(path):
+    fd, copy_path = tempfile.mkstemp(prefix='URLReader-')
+    os.close(fd)
+    shutil.copyfile(path, copy_path)
+    return copy_path
+
+
+def _host(url):
+    return urlparse(url).hostname
+
+
+def _request_host(request):
+    # the host the request was sent to, maybe a redirect target
+    return _host(request.shortcut or request.url)
+
+
+def _is_success(status_code):
+    # a 2xx response, or a non-HTTP one, like for a file URL
+    return status_code is None or 200 <= status_code < 300
+
+
+def _validators(headers):
+    validators = {}
+    etag = header_value(headers, 'ETag')
+    if etag:
+        validators['ETag'] = etag
+    last_modified = header_value(headers, 'Last-Modified')
+    if last_modified:
+        validators['Last-Modified'] = last_modified
+    return validators or None
+
+
+class _FutureCallback(object):
+
+    # resolves a Future straight from the completion thread, rather than
+    # being dispatched to the main thread, so waiting on it never
+    # depends on the main thread run loop
+
+    immediate = True
+
+    def __init__(self, future, with_status, with_status_code=False):
+        self._future = future
+        self._with_status = with_status
+        self.with_status_code = with_status_code
+
+    def cancel(self):
+        self._future.cancel()
+
+    def __call__(self, url, data, error, *args):
+        # (status), (status, status code), or (status code) for downloads
+        result = (url, data, error)
+        if self._with_status:
+            result += (args[0] if args else None,)
+        if self.with_status_code:
+            result += (args[-1],)
+        try:
+            self._future.set_result(result)
+        except InvalidStateError:
+            # cancelled by the caller, like after a timeout
+            pass
+
+
+class _ImmediateCallback(object):
+
+    # a function called from the completion thread, like _FutureCallback
+
+    immediate = True
+
+    def __init__(self, function):
+        self._function = function
+
+    def __call__(self, *args):
+        self._function(args)
+
+
+def _is_immediate(callback):
+    return getattr(callback, 'immediate', False)
+
+
+def _notify_sent(callback):
+    sent = getattr(callback, 'sent', None)
+    if sent is not None:
+        sent()
+
+
+def _is_batched(callback):
+    return getattr(callback, 'batched', False)
+
+
+def _wants_status_code(callback):
+    return getattr(callback, 'with_status_code', False)
+
+
+def _arguments(callback, args, status_code):
+    # the HTTP status code goes last, for the callbacks asking for it
+    if _wants_status_code(callback):
+        return args + (status_code,)
+    return args
+
+
+def _with_status_code(callback):
+    def wrapper(*args):
+        callback(*args)
+    wrapper.with_status_code = True
+    return wrapper
+
+
+def _without_status(callback, with_status_code=False):
+    if with_status_code:
+        def wrapper(url, data, error, status, status_code):
+            callback(url, data, error, status_code)
+        wrapper.with_status_code = True
+        return wrapper
+
+    def wrapper(url, data, error, status):
+        callback(url, data, error)
+    return wrapper
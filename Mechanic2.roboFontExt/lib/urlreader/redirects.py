@@ -0,0 +1,125 @@
+import time
+import threading
+import email.utils
+
+from urlreader.base import logger, header_value
+
+
+PERMANENT_REDIRECT_STATUS_CODES = (301, 308)
+
+# lifetime of a permanent redirect without an explicit one, in seconds
+PERMANENT_MAX_AGE = 24 * 60 * 60
+
+# no redirect is remembered for longer than that, in seconds
+MAX_AGE = 7 * 24 * 60 * 60
+
+
+def freshness_lifetime(headers, now=None):
+    """Return the seconds `headers` allow a response to be reused, or None
+
+    None means the response doesn’t say, 0 that it must not be reused.
+    """
+    cache_control = header_value(headers, 'Cache-Control') or ''
+    directives = {}
+    for directive in cache_control.split(','):
+        name, _, value = directive.strip().partition('=')
+        directives[name.lower()] = value.strip('"')
+    if 'no-store' in directives or 'no-cache' in directives:
+        return 0
+    for name in ('s-maxage', 'max-age'):
+        if name in directives:
+            try:
+                return max(0, int(directives[name]))
+            except ValueError:
+                return 0
+    expires = header_value(headers, 'Expires')
+    if expires:
+        try:
+            date = email.utils.parsedate_to_datetime(expires)
+        except (TypeError, ValueError):
+            # an invalid date, like 0, means already expired
+            return 0
+        if now is None:
+            now = time.time()
+        return max(0, date.timestamp() - now)
+    return None
+
+
+class RedirectMap(object):
+
+    """Redirects already followed, to go straight to their target
+
+    A redirect is remembered for as long as its response can be reused,
+    given by its `Cache-Control` or `Expires` header, permanent ones
+    without either for `permanent_max_age` seconds, and never longer
+    than `max_age`. The validators of the redirect response, if any,
+    are kept along with its target, see validators().
+
+    URLReader forgets a redirect as soon as requesting its target fails
+    and requests the original URL again.
+    """
+
+    def __init__(self, permanent_max_age=PERMANENT_MAX_AGE, max_age=MAX_AGE):
+        self._permanent_max_age = permanent_max_age
+        self._max_age = max_age
+        self._lock = threading.Lock()
+        # url -> (target, expires, validators)
+        self._redirects = {}
+
+    def remember(self, url, target, responses):
+        """Remember that `url` redirected to `target`
+
+        `responses` are the (status_code, headers) of the redirects
+        followed, the shortest lifetime of them all is kept.
+        """
+        if target is None or url == target or not responses:
+            return
+        now = time.time()
+        lifetime = self._max_age
+        for status_code, headers in responses:
+            response_lifetime = freshness_lifetime(headers, now)
+            if response_lifetime is None and \
+                    status_code in PERMANENT_REDIRECT_STATUS_CODES:
+                response_lifetime = self._permanent_max_age
+            if not response_lifetime:
+                return
+            lifetime = min(lifetime, response_lifetime)
+        validators = {}
+        for name in ('ETag', 'Last-Modified'):
+            value = header_value(responses[0][1], name)
+            if value:
+                validators[name] = value
+        with self._lock:
+            self._redirects[url] = (target, now + lifetime, validators)
+        logger.debug(f'{url} redirects to {target} for {lifetime:.0f}s')
+
+    def get(self, url):
+        """Return the target `url` redirects to, or None once expired"""
+        with self._lock:
+            entry = self._redirects.get(url)
+            if entry is None:
+                return None
+            target, expires, _ = entry
+            if expires <= time.time():
+                del self._redirects[url]
+                return None
+            return target
+
+    def validators(self, url):
+        with self._lock:
+            entry = self._redirects.get(url)
+            if entry is None:
+                return None
+            return dict(entry[2])
+
+    def forget(self, url):
+        with self._lock:
+            self._redirects.pop(url, None)
+
+    def clear(self):
+        with self._lock:
+            self._redirects = {}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._redirects)
@@ -0,0 +1,72 @@
+import time
+import random
+import socket
+import http.client
+
+from urlreader.ratelimit import retry_after
+
+
+# NSURLErrorDomain codes worth another try: timed out, cannot connect
+# to host and network connection lost
+_TRANSIENT_URL_ERROR_CODES = (-1001, -1004, -1005)
+
+
+def is_transient_error(error):
+    """Return if `error` is likely to go away when trying again"""
+    if hasattr(error, 'domain') and hasattr(error, 'code'):
+        # a NSError
+        return error.domain() == 'NSURLErrorDomain' and \
+            error.code() in _TRANSIENT_URL_ERROR_CODES
+    # socket.timeout is an alias of TimeoutError since Python 3.10
+    return isinstance(error, (ConnectionError, TimeoutError, socket.timeout,
+                              http.client.IncompleteRead))
+
+
+class RetryPolicy(object):
+
+    """When and how soon to retry a failed GET request
+
+    A request is tried at most `max_attempts` times, after a timeout, a
+    dropped connection or one of the `retry_status_codes`. The delay
+    before a retry grows exponentially from `base_delay` up to
+    `max_delay` seconds, with full jitter so clients failing together
+    don’t retry together. A longer `Retry-After` asked by the server is
+    honored. No retry starts later than `deadline` seconds after the
+    request first started.
+    """
+
+    def __init__(self, max_attempts=4, base_delay=0.5, max_delay=8,
+                 deadline=120, retry_status_codes=(408, 500, 502, 503, 504)):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.retry_status_codes = tuple(retry_status_codes)
+
+    def should_retry(self, status_code, error):
+        if error is not None:
+            return is_transient_error(error)
+        return status_code in self.retry_status_codes
+
+    def delay(self, attempt):
+        """Return the delay before retrying after `attempt` failed ones"""
+        ceiling = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return random.uniform(0, ceiling)
+
+    def next_delay(self, trace, status_code, error, headers=None):
+        """Return the delay before retrying the request of `trace`
+
+        Returns None when the request must not be retried.
+        """
+        attempt = trace.retries + 1
+        if attempt >= self.max_attempts:
+            return None
+        if not self.should_retry(status_code, error):
+            return None
+        delay = self.delay(attempt)
+        if error is None:
+            delay = max(delay, retry_after(headers) or 0)
+        if trace.started is not None and \
+                time.monotonic() + delay - trace.started > self.deadline:
+            return None
+        return delay
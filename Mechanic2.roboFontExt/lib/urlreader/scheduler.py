@@ -0,0 +1,134 @@
+import time
+import heapq
+import itertools
+import threading
+
+
+class RequestScheduler(object):
+
+    """Start requests in priority order, per host
+
+    At most `max_per_host` requests are in flight for every host, the
+    others wait in a priority queue and start as soon as a slot is
+    released. Requests with the same priority start in FIFO order.
+    A host can be paused for the requests of a priority and lower,
+    they stay queued until the pause is over. All methods can be
+    called from any thread.
+    """
+
+    def __init__(self, max_per_host=6):
+        self._lock = threading.Lock()
+        self._max_per_host = max_per_host
+        self._in_flight = {}
+        self._queues = {}
+        self._paused = {}
+        self._order = itertools.count()
+
+    def setMaxPerHost(self, max_per_host):
+        with self._lock:
+            self._max_per_host = max_per_host
+
+    def submit(self, host, priority, start):
+        with self._lock:
+            queue = self._queues.setdefault(host, [])
+            heapq.heappush(queue, (priority, next(self._order), start))
+            starts = self._next(host)
+        for start in starts:
+            start()
+
+    def release(self, host):
+        # hand the slot over to the next queued request, if any
+        with self._lock:
+            self._in_flight[host] -= 1
+            starts = self._next(host)
+        for start in starts:
+            start()
+
+    def cancel(self, host, start):
+        """Remove `start` from the queue of `host`
+
+        Returns False when it isn’t queued, as it already started.
+        """
+        with self._lock:
+            queue = self._queues.get(host, [])
+            for index, entry in enumerate(queue):
+                if entry[2] is start:
+                    del queue[index]
+                    heapq.heapify(queue)
+                    return True
+        return False
+
+    def pause(self, host, delay, priority=0):
+        """Hold the requests of `host` with `priority` or lower
+
+        Held requests stay queued for `delay` seconds, requests of a
+        higher priority keep starting. Pausing a paused host extends
+        the pause.
+        """
+        until = time.monotonic() + delay
+        with self._lock:
+            if host in self._paused:
+                paused_until, paused_priority = self._paused[host]
+                until = max(until, paused_until)
+                priority = min(priority, paused_priority)
+            self._paused[host] = (until, priority)
+        self._resume_later(host, delay)
+
+    def paused(self, host):
+        """Return the (seconds left, priority) of the pause of `host`"""
+        with self._lock:
+            if not self._held(host, None):
+                return None
+            until, priority = self._paused[host]
+            return until - time.monotonic(), priority
+
+    def queued(self):
+        with self._lock:
+            return sum(len(queue) for queue in self._queues.values())
+
+    def _resume_later(self, host, delay):
+        timer = threading.Timer(delay, self._resume, (host,))
+        timer.daemon = True
+        timer.start()
+
+    def _resume(self, host):
+        with self._lock:
+            starts = self._next(host)
+            left = None
+            if self._held(host, None):
+                # timers can fire a little early
+                left = self._paused[host][0] - time.monotonic()
+        for start in starts:
+            start()
+        if left is not None:
+            self._resume_later(host, left)
+
+    def _held(self, host, priority):
+        # with the lock held, a None `priority` asks if `host` is paused
+        if host not in self._paused:
+            return False
+        until, paused_priority = self._paused[host]
+        if time.monotonic() >= until:
+            del self._paused[host]
+            return False
+        return priority is None or priority >= paused_priority
+
+    def _next(self, host):
+        # with the lock held, take the requests that can start now
+        queue = self._queues.get(host, [])
+        in_flight = self._in_flight.get(host, 0)
+        starts = []
+        # the queue is ordered by priority, once the first one is held
+        # all the others are as well
+        while queue and in_flight < self._max_per_host and \
+                not self._held(host, queue[0][0]):
+            _, _, start = heapq.heappop(queue)
+            in_flight += 1
+            starts.append(start)
+        if in_flight:
+            self._in_flight[host] = in_flight
+        else:
+            self._in_flight.pop(host, None)
+        if not queue:
+            self._queues.pop(host, None)
+        return starts
@@ -0,0 +1,297 @@
+import os
+import time
+import queue
+import socket
+import threading
+import http.client
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, urljoin
+
+from urlreader.base import Transport, URLReaderError, logger
+
+
+USER_CACHE_DIRECTORY = os.environ.get(
+    'XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+CACHE_DIRECTORY = os.path.join(USER_CACHE_DIRECTORY, 'URLReader')
+
+
+REDIRECT_STATUS_CODES = (301, 302, 303, 307, 308)
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+class ConnectionPool(object):
+
+    """Idle keep-alive HTTP connections, pooled per host
+
+    At most `pool_size` idle connections are kept for every
+    (scheme, host, port), extra connections are closed when released.
+    """
+
+    def __init__(self, pool_size=6):
+        self._lock = threading.Lock()
+        self._pool_size = pool_size
+        self._idle = {}
+
+    def set_pool_size(self, pool_size):
+        with self._lock:
+            self._pool_size = pool_size
+
+    def acquire(self, key, timeout):
+        """Return a (connection, reused) tuple for `key`"""
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+        scheme, host, port = key
+        if scheme == 'https':
+            connection = http.client.HTTPSConnection(
+                host, port, timeout=timeout)
+        else:
+            connection = http.client.HTTPConnection(
+                host, port, timeout=timeout)
+        return connection, False
+
+    def release(self, key, connection):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self._pool_size:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def clear(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+
+class _Task(object):
+
+    # a request of PooledTransport, as returned to be cancelled
+
+    def __init__(self):
+        self.cancelled = False
+        self.connection = None
+        self.future = None
+
+    def cancel(self):
+        self.cancelled = True
+        if self.future is not None and self.future.cancel():
+            # it didn’t start
+            return
+        connection = self.connection
+        if connection is not None and connection.sock is not None:
+            # wakes up the worker blocked reading the response
+            try:
+                connection.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class PooledTransport(Transport):
+
+    """A pure Python transport, built on http.client
+
+    Requests run on a pool of `max_workers` threads and reuse keep-alive
+    connections, at most `pool_size` idle ones per host. Redirects are
+    followed up to `max_redirects` times.
+
+    As there is no Cocoa run loop, callbacks are queued and called by
+    run_loop(), which URLReader runs from continue_runloop(). Whoever
+    owns the main thread is expected to do the same, or to use the
+    futures returned by URLReader.fetch() without a callback.
+    """
+
+    def __init__(self, max_workers=16, pool_size=6, max_redirects=10):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='URLReader')
+        self._pool = ConnectionPool(pool_size)
+        self._max_redirects = max_redirects
+        self._timeout = None
+        self._headers = None
+        self._pending = queue.Queue()
+
+    def set_timeout(self, timeout):
+        self._timeout = timeout
+
+    def set_headers(self, headers):
+        self._headers = headers
+
+    def set_pool_size(self, pool_size):
+        self._pool.set_pool_size(pool_size)
+
+    def request(self, url, headers, completion, trace=None, body=None):
+        task = _Task()
+        task.future = self._executor.submit(
+            self._perform, url, headers, completion, trace=trace, task=task,
+            body=body)
+        return task
+
+    def download(self, url, headers, path, progress, completion,
+                 trace=None):
+        task = _Task()
+        task.future = self._executor.submit(
+            self._perform, url, headers, completion, path, progress, trace,
+            task)
+        return task
+
+    def cancel(self, task):
+        task.cancel()
+
+    def _perform(self, url, headers, completion, path=None, progress=None,
+                 trace=None, task=None, body=None):
+        # the final response, once it started
+        response = {}
+        try:
+            data, response_url, status_code, response_headers = \
+                self._get(url, headers, path, progress, trace, response,
+                          task, body)
+        except Exception as error:
+            completion(path, response.get('url'), response.get('status'),
+                       response.get('headers', {}), error)
+            return
+        completion(data, response_url, status_code, response_headers, None)
+
+    def _get(self, url, headers, path=None, progress=None, trace=None,
+             final=None, task=None, body=None):
+        sent = time.monotonic()
+        request_headers = {'Accept-Encoding': 'identity'}
+        if self._headers:
+            request_headers.update(self._headers)
+        if headers:
+            request_headers.update(headers)
+
+        if trace is not None:
+            trace.redirect_responses = []
+        for redirects in range(self._max_redirects + 1):
+            key, connection, response = self._send(url, request_headers,
+                                                   task, body)
+            try:
+                location = response.getheader('Location')
+                if response.status in REDIRECT_STATUS_CODES and location:
+                    response.read()
+                    url = urljoin(url, location)
+                    if response.status not in (307, 308):
+                        # the redirected request is a GET, like browsers do
+                        body = None
+                    if trace is not None:
+                        trace.redirect_responses.append(
+                            (response.status, dict(response.getheaders())))
+                    continue
+                if trace is not None:
+                    # the status line and headers of the final response
+                    trace.first_byte = time.monotonic() - sent
+                    trace.redirects = redirects
+                    trace.status_code = response.status
+                if final is not None:
+                    final.update(url=url, status=response.status,
+                                 headers=dict(response.getheaders()))
+                if path is None:
+                    data = response.read()
+                else:
+                    data = path
+                    self._read_to_path(response, path, progress, task)
+            finally:
+                if task is not None and task.cancelled:
+                    # the connection may have been shut down
+                    connection.close()
+                else:
+                    self._finish(key, connection, response)
+            return data, url, response.status, dict(response.getheaders())
+        raise URLReaderError(f'Too many redirects for {url}')
+
+    def _read_to_path(self, response, path, progress, task=None):
+        bytes_expected = response.length
+        if bytes_expected is None:
+            bytes_expected = -1
+        bytes_received = 0
+        with open(path, 'wb') as f:
+            while True:
+                if task is not None and task.cancelled:
+                    raise URLReaderError('Cancelled')
+                chunk = response.read(DOWNLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                f.write(chunk)
+                bytes_received += len(chunk)
+                if progress is not None:
+                    progress(bytes_received, bytes_expected)
+        if bytes_received < bytes_expected:
+            # read() returns what it has when the connection is closed
+            raise http.client.IncompleteRead(
+                b'', bytes_expected - bytes_received)
+
+    def _send(self, url, headers, task=None, body=None):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise URLReaderError(f'Unsupported URL scheme for {url}')
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        if task is not None and task.cancelled:
+            raise URLReaderError('Cancelled')
+        method = 'GET' if body is None else 'POST'
+        connection, reused = self._pool.acquire(key, self._timeout)
+        if task is not None:
+            task.connection = connection
+        try:
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+        except ConnectionError:
+            connection.close()
+            if not reused:
+                raise
+            # the server closed the idle keep-alive connection,
+            # try again once on a new one
+            logger.debug(f'{key} stale connection, reconnecting')
+            connection, _ = self._pool.acquire(key, self._timeout)
+            if task is not None:
+                task.connection = connection
+            try:
+                connection.request(method, path, body, headers)
+                response = connection.getresponse()
+            except Exception:
+                connection.close()
+                raise
+        except Exception:
+            connection.close()
+            raise
+        return key, connection, response
+
+    def _finish(self, key, connection, response):
+        # only a fully read response leaves the connection reusable
+        if response.will_close or not response.isclosed():
+            connection.close()
+        else:
+            self._pool.release(key, connection)
+
+    def dispatch(self, function, *args):
+        self._pending.put((function, args))
+
+    def run_loop(self, timeout):
+        try:
+            function, args = self._pending.get(timeout=timeout)
+        except queue.Empty:
+            return
+        while True:
+            try:
+                function(*args)
+            except Exception:
+                logger.exception(f'Error calling {function}')
+            try:
+                function, args = self._pending.get_nowait()
+            except queue.Empty:
+                return
+
+    def idle(self):
+        return self._pending.empty()
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self._pool.clear()
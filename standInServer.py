@@ -0,0 +1,526 @@
+"""
+A local stand-in for the servers Mechanic talks to, to load-test it.
+
+Serves synthetic registries, info.plist files, release JSON, zipballs
+and icons the way api.github.com, raw.githubusercontent.com, codeload,
+jsDelivr, gitlab.com, the extension store and the Mechanic registry do,
+with faults that can be injected: latency, bandwidth caps, bursts of 5xx
+responses, rate limits and extra redirects. Every response has an ETag
+and conditional requests get a `304 Not Modified`. GraphQL queries for the
+info.plist of repositories are answered as well, with a token.
+
+    python standInServer.py --extensions 500 --latency 0.05 --burst-every 100
+
+In RoboFont, point Mechanic at it with `mechanic2.standIn.useStandInServer()`.
+The faults can be changed while it runs, like:
+
+    http://localhost:8000/_standin?latency=0.5&burstEvery=20
+
+which answers with the current settings and request counts as JSON.
+"""
+
+import io
+import re
+import json
+import time
+import zlib
+import struct
+import random
+import hashlib
+import zipfile
+import plistlib
+import argparse
+import threading
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qsl
+
+
+DEFAULT_PORT = 8000
+
+# written at most this many bytes at a time when the bandwidth is capped
+CHUNK_SIZE = 16 * 1024
+
+# the repository fields of a GraphQL query, like the ones of mechanic2.githubUpdates
+_graphQLString = r'"(?:[^"\\]|\\.)*"'
+graphQLRepositoryRE = re.compile(
+    r'(\w+): repository\(owner: (%s), name: (%s)\) \{ object\(expression: (%s)\)' % (_graphQLString, _graphQLString, _graphQLString)
+)
+
+
+class StandInConfig(object):
+
+    """
+    The content and the faults of a stand-in server.
+    """
+
+    def __init__(self, extensions=100, gitlabEvery=5, storeExtensions=20, version="1.1",
+                 latency=0, bandwidth=None, burstEvery=0, burstLength=3, burstStatus=503, retryAfter=None,
+                 rateLimit=60, rateWindow=3600, redirects=False, zipPadding=0):
+        # content
+        self.extensions = extensions
+        self.gitlabEvery = gitlabEvery
+        self.storeExtensions = storeExtensions
+        self.version = version
+        self.zipPadding = zipPadding
+        # faults
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.burstEvery = burstEvery
+        self.burstLength = burstLength
+        self.burstStatus = burstStatus
+        self.retryAfter = retryAfter
+        self.rateLimit = rateLimit
+        self.rateWindow = rateWindow
+        self.redirects = redirects
+
+    def update(self, values):
+        """
+        Update the settings from a dict of strings, like a query.
+        """
+        for key, value in values.items():
+            if not hasattr(self, key):
+                raise KeyError(key)
+            current = getattr(self, key)
+            if isinstance(current, bool):
+                value = value.lower() in ("1", "true", "yes")
+            elif value.lower() in ("", "none"):
+                value = None
+            elif isinstance(current, int) or key in ("bandwidth", "retryAfter"):
+                value = float(value) if "." in value else int(value)
+            elif isinstance(current, float):
+                value = float(value)
+            setattr(self, key, value)
+
+    def asDict(self):
+        return dict(vars(self))
+
+
+class StandInState(object):
+
+    """
+    The request counters shared by all the request handlers.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.statuses = dict()
+        self.burstLeft = 0
+        self.rateUsed = 0
+        self.rateReset = time.time() + config.rateWindow
+        self._zips = dict()
+
+    def configure(self, values):
+        """
+        Change the settings from a dict of strings, a burst under way stops.
+        """
+        with self.lock:
+            self.config.update(values)
+            self.burstLeft = 0
+
+    def count(self):
+        """
+        Count a request, return if it falls in a burst of server errors.
+        """
+        with self.lock:
+            self.requests += 1
+            if self.burstLeft:
+                self.burstLeft -= 1
+                return True
+            if self.config.burstEvery and self.requests % self.config.burstEvery == 0:
+                self.burstLeft = self.config.burstLength - 1
+                return True
+            return False
+
+    def countStatus(self, status):
+        with self.lock:
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    def useRateLimit(self):
+        """
+        Use a request of the API budget, return the (limit, remaining, reset) after it or `None` once exhausted.
+        """
+        with self.lock:
+            now = time.time()
+            if now >= self.rateReset:
+                self.rateUsed = 0
+                self.rateReset = now + self.config.rateWindow
+            if self.rateUsed >= self.config.rateLimit:
+                return None
+            self.rateUsed += 1
+            return self.config.rateLimit, self.config.rateLimit - self.rateUsed, int(self.rateReset)
+
+    def zipball(self, rootName, extensionPath, name):
+        key = (rootName, extensionPath)
+        with self.lock:
+            data = self._zips.get(key)
+        if data is None:
+            data = makeZipball(rootName, extensionPath, name, self.config)
+            with self.lock:
+                self._zips[key] = data
+        return data
+
+    def asDict(self):
+        with self.lock:
+            return dict(
+                config=self.config.asDict(),
+                requests=self.requests,
+                statuses={str(status): count for status, count in self.statuses.items()},
+                rateRemaining=self.config.rateLimit - self.rateUsed,
+            )
+
+
+# content
+
+def extensionName(index):
+    return "StandIn%03d" % index
+
+
+def makeInfoPlist(name, version):
+    return plistlib.dumps(dict(
+        name=name,
+        developer="Stand-in",
+        developerURL="http://localhost",
+        version=version,
+        timeStamp=time.time(),
+        launchAtStartUp=False,
+        mainScript="",
+        html=False,
+        addToMenu=[],
+        requiresVersionMajor="4",
+        requiresVersionMinor="0",
+    ))
+
+
+def makeZipball(rootName, extensionPath, name, config):
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, "w") as z:
+        folder = "%s/%s" % (rootName, extensionPath)
+        z.writestr(folder + "/info.plist", makeInfoPlist(name, config.version))
+        z.writestr(folder + "/lib/", "")
+        if config.zipPadding:
+            # incompressible, to make downloads as large as needed
+            padding = random.Random(name).getrandbits(8 * config.zipPadding).to_bytes(config.zipPadding, "little")
+            z.writestr(folder + "/resources/padding.bin", padding)
+    return data.getvalue()
+
+
+def makeIcon(name):
+    # a single pixel png, its color depends on the name
+    color = hashlib.md5(name.encode()).digest()[:3]
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    return b"".join([
+        b"\x89PNG\r\n\x1a\n",
+        chunk(b"IHDR", struct.pack(">IIBBBBB", 1, 1, 8, 2, 0, 0, 0)),
+        chunk(b"IDAT", zlib.compress(b"\x00" + color)),
+        chunk(b"IEND", b""),
+    ])
+
+
+def makeGraphQLData(query, config):
+    # every repository exists, with its info.plist on the default branch
+    data = dict()
+    for alias, owner, name, expression in graphQLRepositoryRE.findall(query):
+        name = json.loads(name)
+        branch, path = json.loads(expression).split(":", 1)
+        blob = None
+        if path.endswith("info.plist"):
+            text = makeInfoPlist(name, config.version)
+            blob = dict(oid=hashlib.sha1(text).hexdigest(), text=text.decode("utf-8"))
+        data[alias] = dict(object=blob)
+    return data
+
+
+def makeRegistry(config, baseURL):
+    extensions = []
+    for index in range(config.extensions):
+        name = extensionName(index)
+        if config.gitlabEvery and index % config.gitlabEvery == config.gitlabEvery - 1:
+            repository = "https://gitlab.com/standin/%s" % name
+        else:
+            repository = "https://github.com/standin/%s" % name
+        extensions.append(dict(
+            extensionName=name,
+            repository=repository,
+            extensionPath="%s.roboFontExt" % name,
+            developer="Stand-in",
+            developerURL=baseURL,
+            description="Stand-in extension %s" % index,
+            tags=["standin"],
+            icon="%s/icons/%s.png" % (baseURL, name),
+        ))
+    return dict(extensions=extensions)
+
+
+def makeStoreData(config, baseURL):
+    extensions = []
+    for index in range(config.storeExtensions):
+        name = "Store" + extensionName(index)
+        extensions.append(dict(
+            extensionName=name,
+            version=config.version,
+            link="%s/store/" % baseURL,
+            purchaseURL="%s/store/purchase/%s" % (baseURL, name),
+            developer="Stand-in",
+            developerURL=baseURL,
+            description="Stand-in store extension %s" % index,
+            tags=["standin"],
+            icon="%s/icons/%s.png" % (baseURL, name),
+        ))
+    return dict(extensions=extensions)
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def baseURL(self):
+        return "http://%s" % self.headers.get("Host", "localhost:%s" % self.server.server_port)
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        path = parts.path
+        query = dict(parse_qsl(parts.query, keep_blank_values=True))
+
+        if path == "/_standin":
+            try:
+                self.state.configure(query)
+            except (KeyError, ValueError) as e:
+                self.respond(400, json.dumps(dict(error="invalid setting %s" % e)).encode(), "application/json")
+                return
+            self.respond(200, json.dumps(self.state.asDict(), indent=2).encode(), "application/json", cache=False)
+            return
+
+        config = self.state.config
+        rateHeaders = self.injectFaults(path)
+        if rateHeaders is None:
+            return
+
+        if config.redirects and "redirected" not in query and not path.startswith("/github/api/"):
+            # an extra hop, like a moved repository
+            self.redirect(302, path + "?redirected=1")
+            return
+
+        route = self.route(path)
+        if route is None:
+            self.respond(404, b"not found", headers=rateHeaders, cache=False)
+            return
+        status, body, contentType = route
+        if status in (301, 302):
+            self.redirect(status, body, rateHeaders)
+            return
+        self.respond(status, body, contentType, rateHeaders)
+
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if path != "/github/api/graphql":
+            self.respond(404, b"not found", cache=False)
+            return
+        rateHeaders = self.injectFaults(path)
+        if rateHeaders is None:
+            return
+        if not self.headers.get("Authorization"):
+            self.respond(401, json.dumps(dict(message="This endpoint requires you to be authenticated.")).encode(), "application/json", rateHeaders, cache=False)
+            return
+        try:
+            query = json.loads(body)["query"]
+        except Exception:
+            self.respond(400, json.dumps(dict(message="Problems parsing JSON")).encode(), "application/json", rateHeaders, cache=False)
+            return
+        data = makeGraphQLData(query, self.state.config)
+        self.respond(200, json.dumps(dict(data=data)).encode(), "application/json", rateHeaders, cache=False)
+
+    def injectFaults(self, path):
+        """
+        Wait for the latency and answer with a server error during a burst, or when out of API budget.
+        Return the rate limit headers to send, `None` when the request was answered.
+        """
+        config = self.state.config
+        if config.latency:
+            time.sleep(config.latency)
+
+        if self.state.count():
+            headers = dict()
+            if config.retryAfter is not None:
+                headers["Retry-After"] = str(config.retryAfter)
+            self.respond(config.burstStatus, b"stand-in server error", headers=headers, cache=False)
+            return None
+
+        rateHeaders = dict()
+        if path.startswith("/github/api/"):
+            budget = self.state.useRateLimit()
+            if budget is None:
+                rateHeaders = {
+                    "X-RateLimit-Limit": str(config.rateLimit),
+                    "X-RateLimit-Remaining": "0",
+                    "X-RateLimit-Reset": str(int(self.state.rateReset)),
+                }
+                self.respond(403, json.dumps(dict(message="API rate limit exceeded")).encode(), "application/json", rateHeaders, cache=False)
+                return None
+            limit, remaining, reset = budget
+            rateHeaders = {
+                "X-RateLimit-Limit": str(limit),
+                "X-RateLimit-Remaining": str(remaining),
+                "X-RateLimit-Reset": str(reset),
+            }
+        return rateHeaders
+
+    def route(self, path):
+        """
+        Return the (status, body, content type) of `path`, the body is the location of redirects, `None` when not found.
+        """
+        parts = path.strip("/").split("/")
+        config = self.state.config
+        baseURL = self.baseURL()
+
+        if path == "/registry.json":
+            return 200, json.dumps(makeRegistry(config, baseURL)).encode(), "application/json"
+        if path == "/store/data.json":
+            return 200, json.dumps(makeStoreData(config, baseURL)).encode(), "application/json"
+        if parts[0] == "icons" and len(parts) == 2:
+            return 200, makeIcon(parts[1]), "image/png"
+        if parts[0] == "store" and len(parts) == 3 and parts[2].endswith(".roboFontExt.zip"):
+            # /store/<key>/<name>.roboFontExt.zip
+            extensionPath = parts[2][:-len(".zip")]
+            name = extensionPath[:-len(".roboFontExt")]
+            return 200, self.state.zipball(name, extensionPath, name), "application/zip"
+
+        # github
+        if parts[:2] == ["github", "raw"] and len(parts) >= 7 and parts[-1] == "info.plist":
+            # /github/raw/<owner>/<repo>/master/<extensionPath>/info.plist
+            return 200, makeInfoPlist(parts[3], config.version), "application/octet-stream"
+        if parts[:2] == ["jsdelivr", "gh"] and len(parts) >= 6 and parts[-1] == "info.plist":
+            # /jsdelivr/gh/<owner>/<repo>@master/<extensionPath>/info.plist
+            return 200, makeInfoPlist(parts[3].split("@")[0], config.version), "application/octet-stream"
+        if parts[:3] == ["github", "api", "repos"] and len(parts) == 6:
+            owner, repo, kind = parts[3:]
+            if kind == "zipball":
+                return 302, "/github/codeload/%s/%s/zip/master" % (owner, repo), None
+            if kind == "releases":
+                releases = [dict(tag_name=config.version, name="%s %s" % (repo, config.version), prerelease=False, body="Stand-in release")]
+                return 200, json.dumps(releases).encode(), "application/json"
+        if parts[:2] == ["github", "codeload"] and len(parts) == 6:
+            # /github/codeload/<owner>/<repo>/zip/master
+            repo = parts[3]
+            return 200, self.state.zipball("%s-master" % repo, "%s.roboFontExt" % repo, repo), "application/zip"
+
+        # gitlab
+        if parts[0] == "gitlab" and len(parts) >= 7 and parts[3:5] == ["raw", "master"] and parts[-1] == "info.plist":
+            # /gitlab/<owner>/<repo>/raw/master/<extensionPath>/info.plist
+            return 200, makeInfoPlist(parts[2], config.version), "application/octet-stream"
+        if parts[0] == "gitlab" and len(parts) == 7 and parts[3:6] == ["-", "archive", "master"]:
+            # /gitlab/<owner>/<repo>/-/archive/master/<repo>-master.zip
+            repo = parts[2]
+            return 200, self.state.zipball("%s-master" % repo, "%s.roboFontExt" % repo, repo), "application/zip"
+        return None
+
+    def redirect(self, status, location, headers=None):
+        self.state.countStatus(status)
+        self.send_response(status)
+        self.send_header("Location", location)
+        self.send_header("Content-Length", "0")
+        for key, value in (headers or dict()).items():
+            self.send_header(key, value)
+        self.end_headers()
+
+    def respond(self, status, body, contentType="text/plain", headers=None, cache=True):
+        etag = None
+        if cache and status == 200:
+            etag = '"%s"' % hashlib.sha1(body).hexdigest()
+            if self.headers.get("If-None-Match") == etag:
+                status, body = 304, b""
+        self.state.countStatus(status)
+        self.send_response(status)
+        if etag is not None:
+            self.send_header("ETag", etag)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or dict()).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.write(body)
+
+    def write(self, body):
+        bandwidth = self.state.config.bandwidth
+        if not bandwidth:
+            self.wfile.write(body)
+            return
+        for start in range(0, len(body), CHUNK_SIZE):
+            chunk = body[start:start + CHUNK_SIZE]
+            self.wfile.write(chunk)
+            self.wfile.flush()
+            time.sleep(len(chunk) / bandwidth)
+
+
+def startStandInServer(port=DEFAULT_PORT, config=None, host="127.0.0.1"):
+    """
+    Start a stand-in server on a background thread, return it.
+    Its `state` has the settings and the request counts.
+    """
+    if config is None:
+        config = StandInConfig()
+    handler = type("StandInHandler", (StandInHandler, ), dict(state=StandInState(config)))
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.state = handler.state
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--extensions", type=int, default=100, help="number of extensions in the registry")
+    parser.add_argument("--gitlab-every", type=int, default=5, help="every nth extension is on GitLab, 0 for none")
+    parser.add_argument("--store-extensions", type=int, default=20, help="number of extensions in the store data")
+    parser.add_argument("--version", default="1.1", help="the version of every extension")
+    parser.add_argument("--zip-padding", type=int, default=0, help="bytes added to every zipball")
+    parser.add_argument("--latency", type=float, default=0, help="seconds before every response")
+    parser.add_argument("--bandwidth", type=float, default=None, help="bytes per second of every response")
+    parser.add_argument("--burst-every", type=int, default=0, help="start a burst of server errors every n requests")
+    parser.add_argument("--burst-length", type=int, default=3, help="number of server errors of a burst")
+    parser.add_argument("--burst-status", type=int, default=503)
+    parser.add_argument("--retry-after", type=int, default=None, help="Retry-After of the server errors, in seconds")
+    parser.add_argument("--rate-limit", type=int, default=60, help="API requests allowed per window")
+    parser.add_argument("--rate-window", type=int, default=3600, help="API rate limit window, in seconds")
+    parser.add_argument("--redirects", action="store_true", help="redirect every request once more")
+    args = parser.parse_args()
+
+    config = StandInConfig(
+        extensions=args.extensions,
+        gitlabEvery=args.gitlab_every,
+        storeExtensions=args.store_extensions,
+        version=args.version,
+        zipPadding=args.zip_padding,
+        latency=args.latency,
+        bandwidth=args.bandwidth,
+        burstEvery=args.burst_every,
+        burstLength=args.burst_length,
+        burstStatus=args.burst_status,
+        retryAfter=args.retry_after,
+        rateLimit=args.rate_limit,
+        rateWindow=args.rate_window,
+        redirects=args.redirects,
+    )
+    server = startStandInServer(args.port, config)
+    print("Stand-in server at http://localhost:%s, API at http://127.0.0.1:%s" % (args.port, args.port))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()